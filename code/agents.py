@@ -27,6 +27,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import re
 import string
+import threading
 from collections import Counter, OrderedDict, defaultdict
 
 import pandas as pd
@@ -36,20 +37,33 @@ from fewshots_table import (DEMO_CRT, DEMO_CRT_DIRECT, DEMO_SCITAB,
                             NUMERICAL_OPERATION_EXAMPLE,
                             TABLE_OPERATION_EXAMPLE, DEMO_DATABENCH,
                             NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE, GLOBAL_PLAN_EXAMPLES,
-                            NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE_GLOBAL)
+                            NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE_GLOBAL,
+                            SQL_OPERATION_EXAMPLE)
 from langchain import Wikipedia
 from langchain.agents.react.base import DocstoreExplorer
 from llm import UnifiedLLM, get_completion
 from config import llm_config
+from exec_cache import execution_cache, fingerprint
+from prompt_stats import prompt_tracker
 from prompts_table import (DIRECT_AGENT, NUMERICAL_OPERATION_PROMPT,
                            TABLE_OPERATION_PROMPT, react_agent_prompt_crt,
                            react_agent_prompt_scitab, react_agent_prompt_tat,
                            react_agent_prompt_wtq, NUMERICAL_OPERATION_PROMPT_LONG_TABLE,
                            NUMERICAL_OPERATION_PROMPT_LONG_TABLE_GLOBAL,
-                           react_agent_prompt_databench, global_plan_prompt)
-from tot import llm_reward, vote_prompt_as
-from utils import (extract_from_outputs, parse_action, table2df,
-                   table_linear)
+                           react_agent_prompt_databench, global_plan_prompt,
+                           FORMAT_REMINDER, SQL_OPERATION_PROMPT)
+from rollout import RolloutEngine
+from routing import ModelRouter, default_router
+from retrieval import PassageRetriever, count_tokens, table_entities, table_query, task_demo_bank
+from scratchpad import ScratchpadCompactor, is_tabular, table_handle
+from table_registry import TableRegistry, isolated
+from sql_backend import SQLBackend, extract_sql, register_frames
+from table_relevance import prune_table
+from tot import llm_reward, vote_prompt_as, vote_prompt_as_brief
+from utils import (canonicalize_answer, extract_from_outputs, majority_vote,
+                   parse_action, serialize_table, table2df, table_linear,
+                   df_schema, render_result, render_observation, ResultVote,
+                   OBSERVATION_MAX_ROWS, OBSERVATION_MAX_CHARS)
 
 all_input_token, all_output_token = 0, 0
 
@@ -76,56 +90,59 @@ def get_completion(prompt, model="gpt-35-turbo", n=1, max_tokens=400, temperatur
     return results
 
 
-def table_operation_unified(instruction, table_df):
+def table_operation_unified(instruction, table_df, router=None):
     """Unified table operation function without SGLang."""
-    prompt = TABLE_OPERATION_PROMPT.format(
+    prompt = prompt_tracker.format("retrieve_code", TABLE_OPERATION_PROMPT,
         instruction=instruction, table_df=table_df, examples=TABLE_OPERATION_EXAMPLE)
-    # Use a default model for table operations
-    llm = UnifiedLLM("gpt-3.5-turbo")  # You can make this configurable
+    llm = (router or default_router).llm("retrieve_code")
     result = llm(prompt, max_tokens=2000, temperature=0.6)
     return result[0] if result else ""
 
 
-def code_revise_unified(current_error, extracted_code, table_df):
+def code_revise_unified(current_error, extracted_code, table_df, router=None):
     """Unified code revision function without SGLang."""
     prompt = f"You are an expert in revising code. The following code results in an error when executing on the table dataframe (the dataframe only shows the first two records of original data due to its large size). Please revise the code to address the error and only return the revised code in one python code block. \n Table dataframe: {table_df}\n Erroneous code: {extracted_code}\n Error message: {current_error}\n Revised code:"
-    llm = UnifiedLLM("gpt-3.5-turbo")
+    llm = (router or default_router).llm("code_revise")
     result = llm(prompt, max_tokens=2000, temperature=0.6)
     return result[0] if result else ""
 
 
-def numerical_operation_unified(instruction, table_df):
+def numerical_operation_unified(instruction, table_df, router=None):
     """Unified numerical operation function without SGLang."""
-    prompt = NUMERICAL_OPERATION_PROMPT.format(
+    prompt = prompt_tracker.format("calculate_code", NUMERICAL_OPERATION_PROMPT,
         instruction=instruction, table_df=table_df, examples=NUMERICAL_OPERATION_EXAMPLE)
-    llm = UnifiedLLM("gpt-3.5-turbo")
+    llm = (router or default_router).llm("calculate_code")
     result = llm(prompt, max_tokens=4000, temperature=0.6)
     return result[0] if result else ""
 
 
-def numerical_operation_long_table_unified(instruction, table_df, global_planning=False):
+def numerical_operation_long_table_unified(instruction, table_df, global_planning=False, router=None):
     """Unified long table numerical operation function without SGLang."""
     if global_planning:
-        prompt = NUMERICAL_OPERATION_PROMPT_LONG_TABLE_GLOBAL.format(
+        prompt = prompt_tracker.format("calculate_code", NUMERICAL_OPERATION_PROMPT_LONG_TABLE_GLOBAL,
             instruction=instruction, table_df=table_df, examples=NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE_GLOBAL)
     else:
-        prompt = NUMERICAL_OPERATION_PROMPT_LONG_TABLE.format(
+        prompt = prompt_tracker.format("calculate_code", NUMERICAL_OPERATION_PROMPT_LONG_TABLE,
             instruction=instruction, table_df=table_df, examples=NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE)
-    llm = UnifiedLLM("gpt-3.5-turbo")
+    llm = (router or default_router).llm("calculate_code")
     result = llm(prompt, max_tokens=4000, temperature=0.6)
     return result[0] if result else ""
 
 
-def direct_code_unified(prompt):
+def direct_code_unified(prompt, router=None):
     """Unified direct code function without SGLang."""
-    llm = UnifiedLLM("gpt-3.5-turbo")
+    llm = (router or default_router).llm("direct_code")
     result = llm(prompt, max_tokens=4000, temperature=0.6)
     return result[0] if result else ""
 
 
+def observation_key(observation):
+    # vote on the observed value, not on the step prefix
+    return canonicalize_answer(re.sub(r"^Observation \d+:\s*", "", str(observation)))
+
+
 def validate_gloabl_result(executed_results, threshold=3):
-    answer = Counter(executed_results).most_common(1)[0][0]
-    frequency = Counter(executed_results).most_common(1)[0][1]
+    answer, frequency = majority_vote(executed_results)
     if frequency >= threshold and answer != "":
         return True, answer
     else:
@@ -158,12 +175,43 @@ class ReactAgent:
                  without_tool=False,
                  long_table_op='ignore',
                  code_as_observation=False,
-                 debugging=False
+                 debugging=False,
+                 rollout_depth=2,
+                 rollout_budget=20,
+                 rollout_workers=4,
+                 rollout_early_stop=True,
+                 propose_model_name: str = '',
+                 verify_max_tokens: int = 200,
+                 min_valid_samples: int = 1,
+                 max_resample: int = 2,
+                 resample_max_tokens: int = 300,
+                 router=None,
+                 fewshot_k: int = 0,
+                 fewshot_max_tokens=None,
+                 extra_demos=None,
+                 scratchpad_max_tokens=None,
+                 keep_recent_observations: int = 1,
+                 table_max_tokens=None,
+                 context_max_tokens=None,
+                 code_prompt_table: str = "schema",
+                 executor=None,
+                 code_backend: str = "pandas",
+                 observation_max_rows=OBSERVATION_MAX_ROWS,
+                 observation_max_chars=OBSERVATION_MAX_CHARS,
+                 observation_max_tokens=None
                  ) -> None:
 
-        # Use unified LLM interface for all models
-        self.llm = UnifiedLLM(plan_model_name)
-        self.code_llm = UnifiedLLM(code_model_name) if code_model_name != plan_model_name else self.llm
+        # Use unified LLM interface for all models, routed per call site
+        self.router = router if router is not None else ModelRouter(
+            plan_model=plan_model_name, code_model=code_model_name, propose_model=propose_model_name)
+        self.llm = self.router.llm("plan")
+        # optional cheap model proposing the step candidates, judged by the plan model
+        self.propose_model_name = propose_model_name
+        self.propose_llm = self.router.llm("propose") if propose_model_name else None
+        self.verify_max_tokens = verify_max_tokens
+        if self.propose_llm is not None and as_reward != "llm":
+            # proposals are picked by the plan model, i.e. the llm reward
+            raise ValueError(f"propose_model_name needs as_reward='llm', got '{as_reward}'")
         
         # Keep client for legacy compatibility where needed
         self.client = llm_config.get_client_for_model(plan_model_name)
@@ -173,6 +221,15 @@ class ReactAgent:
             table, num_row=None) if isinstance(table, list) else table
         self.long_table = False
         self.debugging = debugging
+        self.table_format, self.table_tokens = None, None
+        if isinstance(table, list) and table:
+            if long_table_op == 'prune':
+                # planner, evaluator and quick answer see the relevant part, code tools the full table
+                self.table_string, self.long_table = prune_table(table, question, max_tokens=table_max_tokens)
+                self.table_format, self.table_tokens = "pruned", count_tokens(self.table_string)
+            else:
+                self.table_string, self.table_format, self.table_tokens = serialize_table(table, table_max_tokens)
+                self.long_table = self.table_format in ("sampled", "summary")
         # if len(table) * len(table[0]) > 50:  # 10*5    300
         #     self.long_table = True
         #     if long_table_op == 'short-table':
@@ -181,7 +238,26 @@ class ReactAgent:
         #         self.table_string += f"\n[...Remaining {remain} rows not shown due to large table size...]"
         self.table_df = table_df
         self.table_dfs = [table_df]
+        # DataFrames of table_df and of the tables the tools produce, built once
+        self.table_registry = TableRegistry()
+        # sandbox.CodeExecutor running generated code in worker processes; None runs it in process
+        self.executor = executor
+        # "schema": code prompts show dtypes and a few rows, code runs on the injected df
+        self.code_prompt_table = code_prompt_table
+        # "sqlite"/"duckdb": retrieve and calculate steps write SQL run on an embedded engine
+        self.code_backend = code_backend
+        # one SQL backend per table, shared by the samples and rollout branches querying it
+        self._sql_backends, self._sql_lock = {}, threading.Lock()
+        # results over these caps are observed as a summary, later code gets the full table
+        self.observation_limits = {"max_rows": observation_max_rows, "max_chars": observation_max_chars,
+                                   "max_tokens": observation_max_tokens}
         self.df_path = df_path
+        # keep only the context paragraphs relevant to the question when a budget is given
+        self.full_context = context
+        self.context_retrieved = False
+        if context_max_tokens and context:
+            context, self.context_retrieved = PassageRetriever(context).select(
+                self.question, context_max_tokens, entities=table_entities(self.table_string))
         self.context = context
         self.answer = answer
         self.plan_model_name = plan_model_name
@@ -192,6 +268,9 @@ class ReactAgent:
         self.plan_sample = plan_sample
         self.code_sample = code_sample
         self.max_actual_steps = max_actual_steps
+        self.min_valid_samples = min_valid_samples
+        self.max_resample = max_resample
+        self.resample_max_tokens = resample_max_tokens
         self.as_reward = as_reward
         self.task = task
         self.evaluator_output = []
@@ -206,6 +285,14 @@ class ReactAgent:
         self.llm_sampled = []
         self.code_sampled = []
         self.direct_sampled = []
+        # older tabular observations are replaced by references once the budget is exceeded
+        self.compactor = ScratchpadCompactor(
+            scratchpad_max_tokens, keep_recent=keep_recent_observations) if scratchpad_max_tokens else None
+        self.rollout_engine = None
+        if as_reward in ("rollout", "combined"):
+            self.rollout_engine = RolloutEngine(
+                self, depth=rollout_depth, max_llm_calls=rollout_budget,
+                max_workers=rollout_workers, early_stop=rollout_early_stop)
 
         if not self.direct_reasoning:
             if task == "tat":
@@ -228,6 +315,11 @@ class ReactAgent:
                 self.agent_prompt = react_agent_prompt_databench
                 self.global_plan_prompt = global_plan_prompt
                 self.global_plan_examples = GLOBAL_PLAN_EXAMPLES
+            if fewshot_k > 0:
+                # keep only the demos most similar to this question and table schema
+                bank = task_demo_bank(task, self.react_examples, (extra_demos or {}).get(task))
+                self.react_examples = bank.select(
+                    table_query(question, self.table_string), fewshot_k, fewshot_max_tokens)
 
         else:
             self.agent_prompt = DIRECT_AGENT
@@ -248,6 +340,54 @@ class ReactAgent:
 
         self.__reset_agent()
 
+    def code_table(self, table_df):
+        """Table part of a code prompt for table2df code."""
+        if self.code_prompt_table == "schema":
+            try:
+                return df_schema(table_df, df=self.table_registry.frame(table_df))
+            except Exception:
+                pass
+        return table_df
+
+    def run_code(self, executable_code, namespace, outputs, tool="expression", table=""):
+        """
+        Execute generated code and return its output variables; raises if the code fails.
+        Equivalent programs already run on the same table are answered by the execution cache.
+        """
+        return execution_cache.run(tool, table, executable_code,
+                                   lambda: self._execute(executable_code, namespace, outputs, table), outputs)
+
+    def _execute(self, executable_code, namespace, outputs, table):
+        if self.executor is not None:
+            # a fork-server executor keeps the table's namespace resident under its fingerprint
+            return self.executor.run(executable_code, namespace, outputs, table=table or None)
+        loc = dict(namespace)
+        exec(executable_code, globals(), loc)
+        return {name: loc[name] for name in outputs if name in loc}
+
+    def exec_on_table(self, executable_code, table_df, outputs, tool):
+        """Execute generated code with the table's df and data available."""
+        table = fingerprint(table_df)
+        # copy-on-write copies are only safe while generated code runs in the same scope
+        with self.table_registry.scope():
+            try:
+                # the sandbox copies the namespace when sending it to a worker
+                namespace = self.table_registry.shared(table_df) if self.executor is not None \
+                    else self.table_registry.namespace(table_df)
+            except Exception:
+                namespace = {}
+                executable_code = "\n".join([table_df, executable_code])
+            else:
+                # near-miss column names are corrected; raises for programs that cannot run
+                executable_code = self.table_registry.validator(table_df).check(executable_code)
+            return self.run_code(executable_code, namespace, outputs, tool, table)
+
+    def map_samples(self, fn, items):
+        """Apply fn to every code sample, in parallel when a sandbox executor is set."""
+        if self.executor is not None:
+            return self.executor.map(fn, items)
+        return [fn(item) for item in items]
+
     def code_extract_retrieve(self, code_strings):
         rows = []
         new_table = ""
@@ -255,83 +395,135 @@ class ReactAgent:
         try:
             executable_code = re.findall(p, code_strings)[0]
             executable_code = "\n".join(executable_code.split("\n")[1:-1])
-            df_string = self.table_df
-            executable_code = "\n".join([df_string, executable_code])
-            loc = {}
-            exec(executable_code, globals(), loc)
+            loc = self.exec_on_table(executable_code, self.table_df, ("new_table",), "retrieve")
             new_table = loc['new_table']
         except:
             pass
-        if isinstance(new_table, pd.Series):
-            new_table = new_table.to_frame()
-        if isinstance(new_table, pd.DataFrame):
-            if not new_table.empty:
-                # to string format
-                header = new_table.columns.tolist()
-                rows = new_table.values.tolist()
-                rows.insert(0, header)
+        if isinstance(new_table, (pd.Series, pd.DataFrame)):
+            _, rows = render_result(new_table)
         return rows
 
-    def retriever_tool(self, instruction):
+    def observation(self, rows):
+        """Observation text of a result table, a summary when it exceeds the observation caps."""
+        return render_observation(rows, **self.observation_limits)
+
+    def sql_source(self, table_df):
+        """What the SQL of a step runs on: a DataBench dataset, scanned in place whichever sample of it the step shows, else the table."""
+        return self.df_path if self.task == "databench" else table_df
+
+    def sql_tables(self, table_df):
+        """SQL backend holding the step's tables; each table gets its own backend, registered once."""
+        source = self.sql_source(table_df)
+        with self._sql_lock:
+            backend = self._sql_backends.get(source)
+            if backend is None:
+                backend = SQLBackend(self.code_backend)
+                if self.task == "databench":
+                    backend.register_parquet("df", source)
+                else:
+                    register_frames(backend, self.table_registry.shared(table_df))
+                self._sql_backends[source] = backend
+        return backend
+
+    def code_extract_sql(self, code_strings, table_df):
+        """Run the SQL query of a sample; returns (result, rows, error, sql) like code_extract_calculator."""
+        sql = extract_sql(code_strings)
+        if not sql:
+            return "", [], None, None
+        backend = self.sql_tables(table_df)
+        try:
+            result = execution_cache.run("sql", fingerprint(self.sql_source(table_df), self.code_backend),
+                                         " ".join(sql.split()), lambda: backend.query(sql))
+        except Exception as e:
+            return "", [], e, sql
+        text, rows = render_result(result, **self.observation_limits)
+        if result.shape == (1, 1):
+            text = str(result.iat[0, 0])
+        return text, rows, None, sql
+
+    def sql_tool(self, instruction, table_df, table_dfs, site, global_planning=False, vote=False):
+        """Retrieve or calculate step with the code model writing SQL on the registered tables."""
+        prompt = prompt_tracker.format(site, SQL_OPERATION_PROMPT,
+            instruction=instruction, schema=self.sql_tables(table_df).schema(), examples=SQL_OPERATION_EXAMPLE)
+        code_llm = self.router.llm(site)
+        queries = [code_llm(prompt, num_return_sequences=1, return_prob=False)[0]
+                   for _ in range(self.code_sample)]
+        results, generated_code = [], []
+        # retrieved rows are voted on in their order, e.g. the top n of a ranking
+        samples_vote = ResultVote(ordered=site == "retrieve_code")
+        for result, rows, _, sql in self.map_samples(
+                lambda query: self.code_extract_sql(query, table_df), queries):
+            if result != "" and rows != []:
+                result = samples_vote.add(rows, result.strip())
+            results.append(result.strip())
+            generated_code.append(sql)
+        if global_planning:
+            self.generated_code = generated_code
+            return results
+        results = [res for res in results if res != ""]
+        if samples_vote.winner():
+            table_dfs.append(table2df(samples_vote.winner()[0]))
+        if vote and results:
+            results = majority_vote(results)[0]
+        return results
+
+    def retriever_tool(self, instruction, table_dfs=None):
+        if table_dfs is None:
+            table_dfs = self.table_dfs
+        if self.code_backend != "pandas":
+            return self.sql_tool(instruction, self.table_df, table_dfs, "retrieve_code")
         max_attempt = self.code_sample
         results = []
-        results2dfs = defaultdict(list)
+        vote = ResultVote(ordered=True, render=self.observation)
         if self.code_model_name == self.plan_model_name:
             # use one base model
-            prompt = TABLE_OPERATION_PROMPT.format(
-                instruction=instruction, table_df=self.table_df, examples=TABLE_OPERATION_EXAMPLE)
-            codes = self.llm(prompt, num_return_sequences=max_attempt, return_prob=False)
+            prompt = prompt_tracker.format("retrieve_code", TABLE_OPERATION_PROMPT,
+                instruction=instruction, table_df=self.code_table(self.table_df), examples=TABLE_OPERATION_EXAMPLE)
+            codes = self.router.llm("retrieve_code")(
+                prompt, num_return_sequences=max_attempt, return_prob=False)
 
-            for code_strings in codes:
-                rows = self.code_extract_retrieve(code_strings)
+            for rows in self.map_samples(self.code_extract_retrieve, codes):
                 if rows != []:
-                    result = table_linear(rows, num_row=None).strip()
-                    results2dfs[result].append(table2df(rows))
+                    # identical results are rendered once
+                    result = vote.add(rows).strip()
                 else:
                     result = ""
                 results.append(result)
 
         else:
             # Use unified LLM for code generation
-            prompt = TABLE_OPERATION_PROMPT.format(
-                instruction=instruction, table_df=self.table_df, examples=TABLE_OPERATION_EXAMPLE)
-            code_strings = [self.code_llm(prompt, num_return_sequences=1, return_prob=False)[0] 
+            prompt = prompt_tracker.format("retrieve_code", TABLE_OPERATION_PROMPT,
+                instruction=instruction, table_df=self.code_table(self.table_df), examples=TABLE_OPERATION_EXAMPLE)
+            code_llm = self.router.llm("retrieve_code")
+            code_strings = [code_llm(prompt, num_return_sequences=1, return_prob=False)[0]
                            for _ in range(max_attempt)]
 
-            for code_string in code_strings:
-                rows = self.code_extract_retrieve(code_string)
+            for rows in self.map_samples(self.code_extract_retrieve, code_strings):
                 if isinstance(rows, list) and rows != []:
                     # if len(rows) > 7:  # not showing the rest
                     #     remain = len(rows) - 7
                     #     result = table_linear(rows, num_row=7).strip(
                     #     ) + f"\n[...Remaining {remain} rows not shown due to large table size...]"
                     # else:
-                    result = table_linear(rows, num_row=None)
-                    results2dfs[result.strip()].append(table2df(rows))
+                    result = vote.add(rows)
                 else:
                     result = ""
                 results.append(result)
 
         results = [res for res in results if not res == ""]
-        try:
-            sorted_df = sorted(results2dfs, key=lambda key: len(
-                results2dfs[key]), reverse=True)
-            target_df = list(sorted_df.values())[0][0]
-            self.table_dfs.append(target_df)
-        except:
-            pass
+        if vote.winner():
+            table_dfs.append(table2df(vote.winner()[0]))
         return results
 
-    def calculator_tool(self, eqution, recent_table_df):
+    def calculator_tool(self, eqution, recent_table_df, table_dfs=None, site="calculate_code"):
         def clean_eqution(eqution):
             eqution = eqution.replace(",", "")
             eqution = eqution.replace("$", "")
             return eqution
         try:
             eqution = clean_eqution(eqution)
-            loc = {}
             eqution_ = "result = "+eqution
-            exec(eqution_, globals(), loc)
+            loc = self.run_code(eqution_, {}, ("result",))
             if self.without_tool:
                 return [], ""
             else:
@@ -341,44 +533,24 @@ class ReactAgent:
             # try with the coder
             try:
                 result = self.numerical_tool(
-                    eqution, recent_table_df, self.df_path, global_planning=False)
+                    eqution, recent_table_df, self.df_path, global_planning=False, table_dfs=table_dfs, site=site)
             except:
                 pass
             return result
 
     def code_extract_calculator(self, code_strings, table_df, original_df):
         result = ""
-        rows = []
         p = re.compile(r"```[Python|python].*```", re.DOTALL)
         if not self.task == "databench":
             try:
                 executable_code = re.findall(p, code_strings)[0]
                 executable_code = "\n".join(executable_code.split("\n")[1:-1])
-                df_string = table_df
-                executable_code = "\n".join([df_string, executable_code])
-                loc = {}
-                exec(executable_code, globals(), loc)
+                loc = self.exec_on_table(executable_code, table_df, ("final_result",), "calculate")
                 result = loc['final_result']
             except:
                 # print(e)
                 pass
-            if isinstance(result, pd.Series):
-                result = result.to_frame()
-
-            if isinstance(result, pd.DataFrame) and not result.empty:
-                # to string format
-                header = result.columns.tolist()
-                rows = result.values.tolist()
-                rows.insert(0, header)
-                result = table_linear(rows, num_row=None)
-
-            if not isinstance(result, str):
-                try:
-                    # if it is numpy array
-                    rows = result.tolist()
-                    result = table_linear(rows, num_row=None)
-                except:
-                    result = str(result)
+            result, rows = render_result(result, **self.observation_limits)
             return result, rows, None, None
         else:
             current_error = None
@@ -394,8 +566,11 @@ class ReactAgent:
                         executable_code.split("\n")[:return_ids+1])
                 executable_code = "\n".join(
                     ["import pandas as pd\nimport numpy as np\nimport pandas\nimport numpy\n", executable_code, f"final_result=target_function(original_df)"])
-                loc = {"original_df": original_df}
-                exec(executable_code, globals(), loc)
+                # samples share the loaded dataset; in process each gets a copy-on-write copy
+                with self.table_registry.scope():
+                    dataset = original_df if self.executor is not None else isolated(original_df)
+                    loc = self.run_code(executable_code, {"original_df": dataset}, ("final_result",),
+                                        "calculate", fingerprint(self.df_path))
                 result = loc['final_result']
             except Exception as e:
                 # print(e)
@@ -404,98 +579,81 @@ class ReactAgent:
             if isinstance(result, pd.Series):
                 result = result.to_frame()
             if isinstance(result, pd.DataFrame) and not result.empty:
-                # to string format
                 self.original_df = result
-                header = result.columns.tolist()
-                rows = result.values.tolist()
-                rows.insert(0, header)
-                if len(result) > 10:
-                    # too long
-                    remain_line = len(result) - 4
-                    result = table_linear(
-                        rows, num_row=3) + f"\n ...[remaining {remain_line} rows not shown due to large table size]..."
-                    rows = rows[:3]
-                else:
-                    result = table_linear(rows, num_row=None)
-
-            if not isinstance(result, str):
-                # result is a variable
-                with open("temp.txt", "w") as f:
-                    print(result, file=f)
-                with open("temp.txt", "r") as f:
-                    result = f.readlines()
-                result = "\n".join(result)
+            result, rows = render_result(result, **self.observation_limits)
             return result, rows, current_error, executable_code
 
-    def numerical_tool(self, instruction, table_df, df_path=None, global_planning=False):
+    def numerical_tool(self, instruction, table_df, df_path=None, global_planning=False, table_dfs=None, site="calculate_code"):
+        if table_dfs is None:
+            table_dfs = self.table_dfs
+        if self.code_backend != "pandas":
+            return self.sql_tool(instruction, table_df, table_dfs, site, global_planning,
+                                 vote=self.code_as_observation)
         max_attempt = self.code_sample
         results, generated_code = [], []
-        results2df = defaultdict(list)
+        vote = ResultVote()
+        original_df = None
         if df_path:
-            original_df = pd.read_parquet(df_path, engine='pyarrow')
+            original_df = self.table_registry.dataset(df_path)
 
         if self.code_model_name == self.plan_model_name:
-            prompt = NUMERICAL_OPERATION_PROMPT.format(
-                instruction=instruction, table_df=table_df, examples=NUMERICAL_OPERATION_EXAMPLE)
-            codes = self.llm(prompt, num_return_sequences=max_attempt, return_prob=False)
-            for code_strings in codes:
-                result, rows = self.code_extract_calculator(
-                    code_strings, table_df, original_df)
+            prompt = prompt_tracker.format(site, NUMERICAL_OPERATION_PROMPT,
+                instruction=instruction, table_df=self.code_table(table_df), examples=NUMERICAL_OPERATION_EXAMPLE)
+            codes = self.router.llm(site)(
+                prompt, num_return_sequences=max_attempt, return_prob=False)
+            extracted = self.map_samples(
+                lambda code: self.code_extract_calculator(code, table_df, original_df), codes)
+            for result, rows, _, _ in extracted:
                 if result != "" and rows != []:
-                    try:
-                        result = result.strip()
-                        results2df[result].append(table2df(rows))
-                    except:
-                        pass
+                    result = vote.add(rows, result.strip())
                 results.append(result)
 
         else:
             # Use unified approach for all models
-            prompt = NUMERICAL_OPERATION_PROMPT.format(
-                instruction=instruction, table_df=table_df, examples=NUMERICAL_OPERATION_EXAMPLE)
-            code_strings = [self.code_llm(prompt, num_return_sequences=1, return_prob=False)[0] 
+            prompt = prompt_tracker.format(site, NUMERICAL_OPERATION_PROMPT,
+                instruction=instruction, table_df=self.code_table(table_df), examples=NUMERICAL_OPERATION_EXAMPLE)
+            code_llm = self.router.llm(site)
+            code_strings = [code_llm(prompt, num_return_sequences=1, return_prob=False)[0]
                            for _ in range(max_attempt)]
 
-            for code_string in code_strings:
-                result, rows, error, extracted_code = self.code_extract_calculator(
-                    code_string, table_df, original_df)
+            extracted = self.map_samples(
+                lambda code: self.code_extract_calculator(code, table_df, original_df), code_strings)
+            for result, rows, error, extracted_code in extracted:
                 if result != "" and rows != []:
-                    try:
-                        result = result.strip()
-                        results2df[result].append(table2df(rows))
-                    except:
-                        pass
+                    result = vote.add(rows, result.strip())
                 results.append(result)
                 generated_code.append(extracted_code)
         if not global_planning:
             results = [res for res in results if not res == ""]
-            try:
-                sorted_df = sorted(results2df, key=lambda key: len(
-                    results2df[key]), reverse=True)
-                target_df = list(sorted_df.values())[0][0]
-                self.table_dfs.append(target_df)
-            except:
-                pass
+            if vote.winner():
+                table_dfs.append(table2df(vote.winner()[0]))
             if self.code_as_observation:
                 if len(results) > 0:
-                    results = Counter(results).most_common(1)[0][0]
+                    results = majority_vote(results)[0]
             return results
         else:
             self.generated_code = generated_code
             return results
 
-    def as_llm(self, thoughts, actions, observations):
+    def as_llm(self, thoughts, actions, observations, max_tokens=2000, vote_prompt=vote_prompt_as):
         all_paths = ""
         assert len(thoughts) == len(actions)
-        if len(thoughts) > 0:
-            all_paths = f"Question: {self.question}\nTable:{self.table_string}Past reasonings:{self.scratchpad}\n"
+        if len(set(actions)) == 1:
+            # nothing to choose between, skip the evaluator call
+            target_thought, target_action = thoughts[0], actions[0]
+            target_observation = observations[0] if observations else ""
+        elif len(thoughts) > 0:
+            # table before question, so evaluator prompts of one question share a prefix
+            all_paths = f"Table:{self.table_string}\nQuestion: {self.question}\nPast reasonings:{self.scratchpad}\n"
             current_paths = ""
             for i, (t, a, o) in enumerate(zip(thoughts, actions, observations)):
                 sc = "\n".join([t, a, o])
                 all_paths += f'current reasoning path {i+1}: {sc}\n'
                 current_paths += f'current reasoning path {i+1}: {sc}\n'
-            outputs, _, _ = llm_reward(reasoning_paths=all_paths, vote_prompt=vote_prompt_as, model_type="open",
-                                       model_name=self.plan_model_name, tokenizer=self.tokenizer, model=self.llm)
+            outputs, _, _ = llm_reward(reasoning_paths=all_paths, vote_prompt=vote_prompt, model_type="open",
+                                       model_name=self.router.model_for("evaluator"), tokenizer=self.tokenizer,
+                                       model=self.router.llm("evaluator"),
+                                       max_tokens=max_tokens)
             self.evaluator_output.append([current_paths, outputs])
             target_choice = extract_from_outputs(outputs, len(thoughts))
             target_thought = thoughts[target_choice]
@@ -508,30 +666,55 @@ class ReactAgent:
             target_thought, target_action, target_observation = "", "", ""
         return target_thought, target_action, target_observation
 
+    def get_current_step(self, instance):
+        current_thought, current_action, current_observation = "", "", ""
+        if instance:
+            instance_ = [line for line in instance.split(
+                "\n") if line.strip() != ""]
+        try:
+            current_thought = [
+                line for line in instance_ if f"Thought {self.step_n}:" in line][0]
+            current_action = [
+                line for line in instance_ if f"Action {self.step_n}:" in line][0]
+            current_observation_start_id = [i for i, line in enumerate(
+                instance_) if f"Observation {self.step_n}:" in line]
+            current_observation_end_id = [i for i, line in enumerate(
+                instance_) if f"Thought {self.step_n+1}:" in line]
+            current_observation = "\n".join(
+                instance_[current_observation_start_id[0]:current_observation_end_id[0]])
+        except:
+            pass
+        return current_thought, current_action, current_observation
+
+    def top_up_samples(self, sampled):
+        # keep the parseable samples and only request the missing ones with a
+        # format reminder; top-ups are counted in resample_n, not as steps
+        if self.as_reward == "logp" or self.as_reward == "combined":
+            # the last item holds one log prob per sample; top-ups would have none
+            return sampled
+
+        def is_valid(instance):
+            thought, action, _ = self.get_current_step(instance)
+            return thought != "" and action != ""
+
+        valid_n = len([item for item in sampled if is_valid(item)])
+        attempt = 0
+        while valid_n < self.min_valid_samples and attempt < self.max_resample:
+            prompt = self._build_agent_prompt() + FORMAT_REMINDER.format(step=self.step_n)
+            llm = self.propose_llm if self.propose_llm is not None else self.llm
+            extra = llm(prompt, num_return_sequences=self.min_valid_samples - valid_n,
+                        max_tokens=self.resample_max_tokens, return_prob=False)
+            extra = [item for item in extra if is_valid(item)]
+            sampled = sampled + extra
+            valid_n += len(extra)
+            self.resample_n += 1
+            attempt += 1
+        return sampled
+
     def as_reward_fn(self, sampled):
         # a reward function to select the most promising steps among sampled
         global all_input_token, all_output_token
 
-        def get_current_step(instance):
-            current_thought, current_action, current_observation = "", "", ""
-            if instance:
-                instance_ = [line for line in instance.split(
-                    "\n") if line.strip() != ""]
-            try:
-                current_thought = [
-                    line for line in instance_ if f"Thought {self.step_n}:" in line][0]
-                current_action = [
-                    line for line in instance_ if f"Action {self.step_n}:" in line][0]
-                current_observation_start_id = [i for i, line in enumerate(
-                    instance_) if f"Observation {self.step_n}:" in line]
-                current_observation_end_id = [i for i, line in enumerate(
-                    instance_) if f"Thought {self.step_n+1}:" in line]
-                current_observation = "\n".join(
-                    instance_[current_observation_start_id[0]:current_observation_end_id[0]])
-            except:
-                pass
-            return current_thought, current_action, current_observation
-
         def get_preliminary_ans(sampled):
             mapping = []
             threshold = len(sampled)*self.answer_aggrement
@@ -549,12 +732,7 @@ class ReactAgent:
                         mapping.append(i)
                 except:
                     pass
-            try:
-                most_common, num_most_common = Counter(
-                    pre_answers).most_common(1)[0]  # val, times
-            except:
-                most_common = ""
-                num_most_common = 0
+            most_common, num_most_common = majority_vote(pre_answers)
             if num_most_common > threshold:
                 pre_ans = most_common
             assert len(pre_answers) == len(mapping)
@@ -563,9 +741,9 @@ class ReactAgent:
         def as_rollout(sampled, actions):
             _, pre_ans_all, mapping = get_preliminary_ans(sampled)
             try:
-                common = Counter(pre_ans_all).most_common(1)[0][0]
+                common = canonicalize_answer(majority_vote(pre_ans_all)[0])
                 sampled_id = [i for i, item in enumerate(
-                    pre_ans_all) if item == common]
+                    pre_ans_all) if canonicalize_answer(item) == common]
                 sampled_id = [mapping[item] for item in sampled_id]
             except:
                 pass
@@ -575,6 +753,18 @@ class ReactAgent:
                 target_action = ""
             return target_action
 
+        def as_rollout_engine(sampled, actions, action_thought):
+            # continue each distinct action with real tool calls, falling back
+            # to counting the finish answers already in the samples
+            target_action = ""
+            if self.rollout_engine is not None:
+                _, pre_ans_all, _ = get_preliminary_ans(sampled)
+                target_action = self.rollout_engine.select(
+                    action_thought, pre_ans_all)
+            if target_action == "":
+                target_action = as_rollout(sampled, actions)
+            return target_action
+
         def as_consistency(action_thought, observations):
             target_thought, target_action, target_observation = "", "", ""
             if target_thought == "" and target_action == "":
@@ -586,14 +776,25 @@ class ReactAgent:
                     target_thought = [
                         item for item in action_thought[target_action] if item != ""][0]
                     try:
-                        target_observation = Counter(
-                            observations).most_common(1)[0][0]
+                        target_observation = majority_vote(
+                            observations, key=observation_key)[0]
                     except:
                         pass
                 except:
                     pass
             return target_thought, target_action, target_observation
 
+        def distinct_paths(thoughts, actions, observations):
+            seen = set()
+            paths = [[], [], []]
+            for t, a, o in zip(thoughts, actions, observations):
+                if a not in seen:
+                    seen.add(a)
+                    paths[0].append(t)
+                    paths[1].append(a)
+                    paths[2].append(o)
+            return paths
+
         thoughts, actions, observations = [], [], []
         pre_ans = None
         action_thought = defaultdict(list)
@@ -610,7 +811,7 @@ class ReactAgent:
 
         target_sample = []
         for i, item in enumerate(sampled):
-            t, a, o = get_current_step(item)
+            t, a, o = self.get_current_step(item)
             if not t == "" and not a == "":
                 thoughts.append(t)
                 actions.append(a)
@@ -624,8 +825,14 @@ class ReactAgent:
                 action_thought, observations)
 
         elif self.as_reward == "llm":
-            target_thought, target_action, target_observation = self.as_llm(
-                thoughts, actions, observations)
+            if self.propose_llm is not None:
+                # two-tier planning: the plan model only picks among distinct proposals
+                target_thought, target_action, target_observation = self.as_llm(
+                    *distinct_paths(thoughts, actions, observations),
+                    max_tokens=self.verify_max_tokens, vote_prompt=vote_prompt_as_brief)
+            else:
+                target_thought, target_action, target_observation = self.as_llm(
+                    thoughts, actions, observations)
 
         elif self.as_reward == "logp":
             target_thought, target_action, target_observation = "", "", ""
@@ -645,7 +852,7 @@ class ReactAgent:
 
         elif self.as_reward == "rollout":
             target_thought, target_action, target_observation = "", "", ""
-            target_action = as_rollout(sampled, actions)
+            target_action = as_rollout_engine(sampled, actions, action_thought)
             try:
                 target_thought = [
                     item for item in action_thought[target_action] if item != ""][0]
@@ -670,7 +877,7 @@ class ReactAgent:
                 ac_lst.append(ac)
             except:
                 pass
-            ac = as_rollout(sampled, actions)
+            ac = as_rollout_engine(sampled, actions, action_thought)
             ac_lst.append(ac)
             target_action = Counter(ac_lst).most_common(1)[0][0]
             try:
@@ -695,10 +902,7 @@ class ReactAgent:
         try:
             executable_code = re.findall(p, instance)[0]
             executable_code = "\n".join(executable_code.split("\n")[1:-1])
-            df_string = self.table_df
-            executable_code = "\n".join([df_string, executable_code])
-            loc = {}
-            exec(executable_code, globals(), loc)
+            loc = self.exec_on_table(executable_code, self.table_df, ("result",), "direct_code")
             result = loc['result']
         except:
             result = ""
@@ -706,6 +910,85 @@ class ReactAgent:
             result = str(result)
         return result
 
+    def record_observation(self, observation, table_df=None) -> None:
+        # keep the table a step produced (its table_dfs entry) reachable by handle,
+        # then compact the scratchpad
+        body = observation.split(":", 1)[-1]
+        if table_df is not None and is_tabular(body):
+            self.observed_tables[table_handle(self.step_n)] = table_df
+        if self.compactor is not None:
+            self.scratchpad = self.compactor.compact(self.scratchpad, self.stored_handle)
+
+    def stored_handle(self, step):
+        # references only name handles the code tools can resolve
+        handle = table_handle(step)
+        return handle if handle in self.observed_tables else None
+
+    def recent_table(self, argument, table_dfs):
+        """The table an instruction refers to by handle, else the most recent table."""
+        for handle, table_df in self.observed_tables.items():
+            if re.search(rf"\b{handle}\b", argument):
+                return table_df
+        return table_dfs[-1]
+
+    def _run_tool(self, action_type, argument, table_dfs=None):
+        # raw tool result: a string, the list of sample results, or None without a result
+        if table_dfs is None:
+            table_dfs = self.table_dfs
+        if action_type == "Calculate":
+            recent_table_df = self.recent_table(argument, table_dfs)
+            return self.calculator_tool(
+                argument, recent_table_df=recent_table_df, table_dfs=table_dfs)
+        elif action_type == "Retrieve":
+            return self.retriever_tool(
+                instruction=argument, table_dfs=table_dfs)
+        elif action_type == "Search":
+            if self.without_tool:
+                return None
+            try:
+                return self.docstore.search(argument)
+            except Exception as e:
+                # cannot find on wikipedia, use llm search results
+                return None
+        elif action_type == "Operate":
+            recent_table_df = self.recent_table(argument, table_dfs)
+            return self.calculator_tool(
+                argument, recent_table_df=recent_table_df, table_dfs=table_dfs, site="operate_code")
+        return None
+
+    def _observe(self, action_type, new_ob, step_n, observation="", all_observations=None) -> str:
+        # observation line of a raw tool result; sample results are voted together
+        # with the llm predicted observations, which stand in if the tool failed
+        if all_observations is None:
+            all_observations = []
+        if action_type == "Calculate":
+            if not isinstance(new_ob, list):
+                if new_ob != "":
+                    observation = f"Observation {step_n}: {new_ob}"
+            else:
+                # majority voting among tool results and llm results
+                new_ob = [f'Observation {step_n}: {item}' for item in new_ob] + list(all_observations)
+                if new_ob != []:
+                    observation = majority_vote(
+                        new_ob, key=observation_key)[0]
+
+        elif action_type == "Retrieve":
+            if new_ob:
+                new_ob = [
+                    f'Observation {step_n}: {item}' for item in new_ob]
+                if not self.long_table and not self.code_as_observation:
+                    new_ob += all_observations
+                observation = majority_vote(
+                    new_ob, key=observation_key)[0]
+
+        elif action_type == "Search":
+            if new_ob is not None:
+                observation = f"Observation {step_n}: {new_ob}"
+        elif action_type == "Operate":
+            if new_ob != "":
+                observation = f"Observation {step_n}: {new_ob}"
+        return observation
+
     def run(self, reset=True, given_plan=None) -> None:
         if reset:
             self.__reset_agent()
@@ -718,13 +1001,8 @@ class ReactAgent:
 
         if not self.answer:
             if self.use_pre_answer:
-                try:
-                    self.answer = Counter(
-                        self.pre_ans_all).most_common(1)[0][0]
-                except:
-                    # direct prompting
-                    self.answer = self.get_quick_answer()
-            else:
+                self.answer = majority_vote(self.pre_ans_all)[0]
+            if not self.answer:
                 # direct prompting
                 self.answer = self.get_quick_answer()
 
@@ -733,16 +1011,15 @@ class ReactAgent:
             llm_sampled = self.prompt_agent(mode="text")
             llm_sampled_ = [self.get_answer_from_llm(
                 item) for item in llm_sampled]
-            prompt = self.code_prompt.format(
-                examples=self.code_examples, table=self.table_df, question=self.question, context=self.context)
-            code_sampled = [direct_code_unified(prompt) for i in range(self.code_sample)]
-            code_sampled_ = [self.get_answer_from_code(
-                item) for item in code_sampled]
+            prompt = prompt_tracker.format("direct_code", self.code_prompt,
+                examples=self.code_examples, table=self.code_table(self.table_df), question=self.question, context=self.context)
+            code_sampled = [direct_code_unified(prompt, router=self.router) for i in range(self.code_sample)]
+            code_sampled_ = self.map_samples(self.get_answer_from_code, code_sampled)
             self.llm_sampled = [item for item in llm_sampled_ if item != ""]
             self.code_sampled = [item for item in code_sampled_ if item != ""]
             self.direct_sampled = self.llm_sampled + self.code_sampled
             self.history = [llm_sampled, code_sampled]
-            self.answer = Counter(self.direct_sampled).most_common(1)[0][0]
+            self.answer = majority_vote(self.direct_sampled)[0]
             self.finished = True
 
         else:
@@ -750,6 +1027,7 @@ class ReactAgent:
                 sampled = self.prompt_agent_gpt()
             else:
                 sampled = self.prompt_agent(mode="both")
+            sampled = self.top_up_samples(sampled)
             self.actual_step_n += 1
             thought, action, observation, all_observations = self.as_reward_fn(
                 sampled)
@@ -759,56 +1037,26 @@ class ReactAgent:
             else:
                 if thought != "" and action != "":
                     if "Finish" not in action:
+                        produced = len(self.table_dfs)
                         action_type, argument = parse_action(action)
-                        if action_type == "Calculate":
-                            recent_table_df = self.table_dfs[-1]
-                            new_ob = self.calculator_tool(
-                                argument, recent_table_df=recent_table_df)
-                            if not isinstance(new_ob, list):
-                                if new_ob != "":
-                                    observation = f"Observation {self.step_n}: {new_ob}"
-                            else:
-                                # majority voting among tool results and llm results
-                                if new_ob != []:
-                                    new_ob = [
-                                        f'Observation {self.step_n}: {item}' for item in new_ob]
-                                new_ob += all_observations
-                                observation = Counter(
-                                    new_ob).most_common(1)[0][0]
-
-                        elif action_type == "Retrieve":
-                            new_ob = self.retriever_tool(
-                                instruction=argument)
-                            if new_ob != []:
-                                new_ob = [
-                                    f'Observation {self.step_n}: {item}' for item in new_ob]
-                                if not self.long_table and not self.code_as_observation:
-                                    new_ob += all_observations
-                                observation = Counter(
-                                    new_ob).most_common(1)[0][0]
-
-                        elif action_type == "Search":
-                            if self.without_tool:
-                                pass
-                            else:
-                                try:
-                                    observation_wiki = self.docstore.search(
-                                        argument)
-                                    observation = f"Observation {self.step_n}: {observation_wiki}"
-                                except Exception as e:
-                                    # cannot find on wikipedia, use llm search results
-                                    pass
-                        elif action_type == "Operate":
-                            recent_table_df = self.table_dfs[-1]
-                            new_ob = self.calculator_tool(
-                                argument, recent_table_df=recent_table_df)
-                            if new_ob != "":
-                                observation = f"Observation {self.step_n}: {new_ob}"
+                        cached = None
+                        if self.rollout_engine is not None:
+                            cached = self.rollout_engine.lookup(self.scratchpad, action)
+                        if cached is not None:
+                            # the rollout already ran the tool, its results are voted like a fresh run
+                            result, self.table_dfs = cached
+                        else:
+                            result = self._run_tool(action_type, argument)
+                        observation = self._observe(
+                            action_type, result, self.step_n, observation, all_observations)
 
                         if observation != "":
                             self.scratchpad += thought + "\n"
                             self.scratchpad += action + "\n"
                             self.scratchpad += observation + "\n"
+                            # the executed result, not the (possibly summarized or predicted) text
+                            table_df = self.table_dfs[-1] if len(self.table_dfs) > produced else None
+                            self.record_observation(observation, table_df)
                             self.step_n += 1
 
                     else:
@@ -827,6 +1075,8 @@ class ReactAgent:
 
     def prompt_agent_gpt(self) -> str:
         prompt = self._build_agent_prompt()
+        if self.propose_llm is not None:
+            return self.propose_llm(prompt, num_return_sequences=self.plan_sample, return_prob=False)
         return get_completion(prompt, model=self.plan_model_name, n=self.plan_sample)
 
     def prompt_agent_gpt_coder(self, prompt) -> str:
@@ -859,14 +1109,16 @@ class ReactAgent:
         text_prompt = DIRECT_AGENT.split("[BREAK]")[0].strip()
         text_examples = examples.split("[BREAK]")[
             0].strip()
-        prompt = text_prompt.format(
+        prompt = prompt_tracker.format(
+            "quick_answer", text_prompt,
             examples=text_examples,
             table=self.table_string,
             context=self.context,
             question=self.question)
-        answer = self.llm(prompt, num_return_sequences=self.plan_sample, return_prob=False)
+        answer = self.router.llm("quick_answer")(
+            prompt, num_return_sequences=self.plan_sample, return_prob=False)
         answers = [ans.split(":")[-1].strip() for ans in answer]
-        answer = Counter(answers).most_common(1)[0][0]
+        answer = majority_vote(answers)[0]
         return answer
 
     def prompt_agent(self, mode="both") -> str:
@@ -875,30 +1127,37 @@ class ReactAgent:
             return_prob = True
         else:
             return_prob = False
+        if mode == "both" and self.propose_llm is not None:
+            return self.propose_llm(prompt, num_return_sequences=self.plan_sample, return_prob=False)
         return self.llm(prompt, num_return_sequences=self.plan_sample, return_prob=return_prob)
 
     def get_global_plan(self):
-        prompt = self.global_plan_prompt.format(
+        prompt = prompt_tracker.format(
+            "global_plan", self.global_plan_prompt,
             examples=self.global_plan_examples,
             table=self.table_string,
             context=self.context,
             question=self.question)
-        return self.llm(prompt, num_return_sequences=1, return_prob=False)
+        return self.router.llm("global_plan")(prompt, num_return_sequences=1, return_prob=False)
 
-    def _build_agent_prompt(self, mode="both") -> str:
+    def _build_agent_prompt(self, mode="both", scratchpad=None) -> str:
+        if scratchpad is None:
+            scratchpad = self.scratchpad
         if mode == "text":
-            return self.text_prompt.format(
+            return prompt_tracker.format(
+                "direct_text", self.text_prompt,
                 examples=self.text_examples,
                 table=self.table_string,
                 context=self.context,
                 question=self.question)
         elif mode == "both":
-            return self.agent_prompt.format(
+            return prompt_tracker.format(
+                "plan", self.agent_prompt,
                 examples=self.react_examples,
                 table=self.table_string,
                 context=self.context,
                 question=self.question,
-                scratchpad=self.scratchpad)
+                scratchpad=scratchpad)
 
     def is_finished(self) -> bool:
         return self.finished
@@ -914,12 +1173,19 @@ class ReactAgent:
     def __reset_agent(self) -> None:
         self.step_n = 1
         self.actual_step_n = 1
+        self.resample_n = 0
         self.finished = False
         self.scratchpad: str = ''
+        self.observed_tables = {}
+        if self.rollout_engine is not None:
+            # rollout caches are keyed by scratchpad, valid for one question
+            self.rollout_engine.reset()
 
     def set_qa(self, question: str, key: str) -> None:
         self.question = question
         self.key = key
+        if self.rollout_engine is not None:
+            self.rollout_engine.reset()
 
 
 def normalize_answer(s):
@@ -0,0 +1,172 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import math
+import re
+from typing import Any, Dict, List
+
+from utils import _is_number
+
+# question cues of multi-step numerical reasoning
+HARD_CUES = ["difference", "percentage", "percent", "ratio", "average", "mean", "median",
+             "total", "sum", "how many", "how much", "compare", "change", "increase",
+             "decrease", "growth", "more than", "less than", "rank", "highest", "lowest",
+             "at least", "at most", "proportion", "between"]
+
+FEATURE_WEIGHTS = {"size": 0.2, "numeric": 0.15, "cues": 0.35, "tables": 0.15, "context": 0.15}
+
+# knob -> lower bound of the per-question allocation
+BUDGET_KNOBS = {"plan_sample": 1, "code_sample": 1, "max_steps": 2, "max_actual_steps": 2}
+
+
+def parquet_shape(path: str) -> Dict[str, int]:
+    """Shape of a parquet dataset from its metadata, without reading the data."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path)
+    schema = parquet.schema_arrow
+    numeric = sum(1 for field in schema
+                  if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+                  or pa.types.is_decimal(field.type))
+    return {"rows": parquet.metadata.num_rows, "cols": len(schema), "numeric_cols": numeric}
+
+
+def table_shape(table) -> Dict[str, int]:
+    """Rows, columns and numeric columns of a table given as rows (header first), as text or as a shape."""
+    if isinstance(table, dict):
+        return table
+    if isinstance(table, str):
+        lines = [line for line in table.split("\n") if line.strip().startswith("|")]
+        rows = max(len(lines) - 1, 0)
+        remaining = re.search(r"remaining (\d+) rows", table)
+        if remaining:
+            rows += int(remaining.group(1))
+        cols = max(lines[0].count("|") - 1, 0) if lines else 0
+        cells = [[c.strip() for c in line.strip().strip("|").split("|")] for line in lines[1:]]
+    else:
+        rows = max(len(table) - 1, 0)
+        cols = len(table[0]) if table else 0
+        cells = table[1:]
+    numeric = 0
+    for j in range(cols):
+        column = [row[j] for row in cells if j < len(row) and str(row[j]).strip() != ""]
+        if column and sum(_is_number(c) for c in column) / len(column) > 0.5:
+            numeric += 1
+    return {"rows": rows, "cols": cols, "numeric_cols": numeric}
+
+
+class DifficultyBudgetPolicy:
+    """
+    Estimates question difficulty up front and spreads sample counts and step
+    limits over a dataset, keeping the average at the configured values.
+    """
+
+    def __init__(self, plan_sample=5, code_sample=5, max_steps=6, max_actual_steps=6,
+                 min_scale=0.4, max_scale=2.0):
+        self.base = {"plan_sample": plan_sample, "code_sample": code_sample,
+                     "max_steps": max_steps, "max_actual_steps": max_actual_steps}
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+
+    def features(self, question: str, tables: List[Any], context: str = "") -> Dict[str, float]:
+        shapes = [table_shape(table) for table in tables if table]
+        cells = sum(s["rows"] * s["cols"] for s in shapes)
+        numeric = sum(s["numeric_cols"] for s in shapes)
+        question = question.lower()
+        cues = sum(1 for cue in HARD_CUES if cue in question)
+        return {
+            "size": min(1.0, math.log10(cells + 1) / 4),
+            "numeric": min(1.0, numeric / 5),
+            "cues": min(1.0, cues / 2),
+            "tables": 1.0 if len(shapes) > 1 else 0.0,
+            "context": min(1.0, len(context or "") / 4000),
+        }
+
+    def score(self, question: str, tables: List[Any], context: str = "") -> float:
+        """Difficulty in [0, 1]."""
+        features = self.features(question, tables, context)
+        return sum(FEATURE_WEIGHTS[name] * value for name, value in features.items())
+
+    def allocate(self, items: List[Dict[str, Any]]) -> List[Dict[str, int]]:
+        """
+        Allocate budgets for a dataset.
+
+        Args:
+            items: dicts with "question", "tables" and optional "context"
+
+        Returns:
+            One dict of plan_sample, code_sample, max_steps and max_actual_steps per item
+        """
+        if not items:
+            return []
+        scores = [self.score(item["question"], item["tables"], item.get("context", ""))
+                  for item in items]
+        weights = [self.min_scale + (self.max_scale - self.min_scale) * s for s in scores]
+        mean_weight = sum(weights) / len(weights)
+        weights = [w / mean_weight for w in weights]
+
+        budgets = [{} for _ in items]
+        for knob, lower in BUDGET_KNOBS.items():
+            base = self.base[knob]
+            upper = max(lower, math.ceil(base * self.max_scale))
+            for budget, value in zip(budgets, self._round(
+                    [base * w for w in weights], round(base * len(items)), lower, upper)):
+                budget[knob] = value
+        return budgets
+
+    @staticmethod
+    def _round(targets: List[float], total: int, lower: int, upper: int) -> List[int]:
+        # largest remainder rounding within [lower, upper] summing to total
+        total = min(max(total, lower * len(targets)), upper * len(targets))
+        targets = [min(max(t, lower), upper) for t in targets]
+        for _ in range(len(targets)):
+            # clamping moved the sum: rescale the unclamped targets to compensate
+            free = [i for i, t in enumerate(targets) if lower < t < upper]
+            excess = sum(targets) - total
+            free_sum = sum(targets[i] for i in free)
+            if abs(excess) < 1e-9 or free_sum <= 0:
+                break
+            scale = max(free_sum - excess, 0.0) / free_sum
+            for i in free:
+                targets[i] = min(max(targets[i] * scale, lower), upper)
+        values = [int(math.floor(t)) for t in targets]
+        order = sorted(range(len(targets)), key=lambda i: targets[i] - values[i], reverse=True)
+        # one unit per item and pass, as often as saturated targets need it;
+        # total is within the bounds, so every pass moves the sum
+        while sum(values) < total:
+            for i in order:
+                if sum(values) >= total:
+                    break
+                if values[i] < upper:
+                    values[i] += 1
+        while sum(values) > total:
+            for i in reversed(order):
+                if sum(values) <= total:
+                    break
+                if values[i] > lower:
+                    values[i] -= 1
+        return values
@@ -0,0 +1,340 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+import ast
+import difflib
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+# column-naming arguments of pandas methods: keyword names and positional index
+COLUMN_ARGS = {
+    "groupby": (("by",), 0),
+    "sort_values": (("by",), 0),
+    "drop_duplicates": (("subset",), 0),
+    "dropna": (("subset",), None),
+    "drop": (("columns",), None),
+    "set_index": (("keys",), 0),
+    "pivot": (("index", "columns", "values"), None),
+    "pivot_table": (("index", "columns", "values"), None),
+    "nlargest": (("columns",), 1),
+    "nsmallest": (("columns",), 1),
+}
+# names pandas gives to derived columns; never corrected
+GENERATED_COLUMNS = {"index", "count", "size", "proportion", "level_0", "level_1", "0", "variable", "value"}
+# methods whose result has the columns of their receiver (or some of them), and groupby,
+# whose subscripts select columns; the labels of other results are not columns of the schema
+COLUMN_KEEPING = {"copy", "head", "tail", "query", "sort_values", "sort_index", "drop_duplicates", "dropna",
+                  "fillna", "reset_index", "sample", "nlargest", "nsmallest", "drop", "rename", "assign",
+                  "astype", "merge", "join", "where", "mask", "replace", "set_index", "groupby"}
+FRAME_ATTRIBUTES = set(dir(pd.DataFrame))
+PANDAS_NAMES = {"pd", "pandas"}
+
+
+class CodeValidationError(ValueError):
+    """Generated code cannot run on the tables: invalid syntax or unknown columns."""
+
+
+def _key(name: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+
+class ColumnMap:
+    """Columns of a table and the normalized names they are matched by."""
+
+    def __init__(self, columns: Iterable[Any]):
+        self.columns = {str(column) for column in columns}
+        self._keys: Dict[str, Set[str]] = {}
+        for column in self.columns:
+            self._keys.setdefault(_key(column), set()).add(column)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """The column a name refers to; None when unknown or ambiguous."""
+        if name in self.columns:
+            return name
+        matches = self._keys.get(_key(name))
+        if matches:
+            return next(iter(matches)) if len(matches) == 1 else None
+        close = difflib.get_close_matches(_key(name), list(self._keys), n=2, cutoff=0.85)
+        if len(close) == 1 and len(self._keys[close[0]]) == 1:
+            return next(iter(self._keys[close[0]]))
+        return None
+
+
+def _strings(node: ast.AST, lists: bool = True) -> List[ast.Constant]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node]
+    if lists and isinstance(node, (ast.List, ast.Tuple)):
+        return [elt for elt in node.elts if isinstance(elt, ast.Constant) and isinstance(elt.value, str)]
+    return []
+
+
+def _root(node: ast.AST) -> Optional[str]:
+    # name at the bottom of an attribute/subscript/call chain
+    while True:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, (ast.Attribute, ast.Subscript)):
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        else:
+            return None
+
+
+class _Scan(ast.NodeVisitor):
+    """Columns the program creates, frames it reassigns and names bound to frames."""
+
+    def __init__(self, frames: Set[str]):
+        self.frames = frames
+        self.created: Set[str] = set(GENERATED_COLUMNS)
+        self.reassigned: Set[str] = set()
+        self.frame_like: Set[str] = set(frames)
+        # names also bound to something else: a Series, value_counts(), melt(), ...
+        self.derived: Set[str] = set()
+
+    def rooted(self, node: ast.AST) -> bool:
+        """Whether node is a table of the schema, or a frame of some of its columns derived from one."""
+        if isinstance(node, ast.Name):
+            return node.id in self.frame_like and node.id not in self.derived
+        if isinstance(node, ast.Subscript):
+            receiver, index = node.value, node.slice
+            if isinstance(receiver, ast.Attribute) and receiver.attr in ("loc", "iloc"):
+                if isinstance(index, ast.Tuple):
+                    return len(index.elts) == 2 and isinstance(index.elts[1], (ast.List, ast.Slice)) \
+                        and self.rooted(receiver.value)
+                return self.rooted(receiver.value)
+            # a single label selects a Series
+            return not _strings(index, lists=False) and self.rooted(receiver)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            func = node.func
+            if isinstance(func.value, ast.Name) and func.value.id in PANDAS_NAMES:
+                frames = [elt for arg in node.args
+                          for elt in (arg.elts if isinstance(arg, (ast.List, ast.Tuple)) else [arg])]
+                return func.attr in ("merge", "concat") and any(self.rooted(frame) for frame in frames)
+            return func.attr in COLUMN_KEEPING and self.rooted(func.value)
+        return False
+
+    def visit_Assign(self, node):
+        rooted = self.rooted(node.value)
+        for target in node.targets:
+            for name in ast.walk(target):
+                if isinstance(name, ast.Name):
+                    self.reassigned.add(name.id)
+            if isinstance(target, ast.Name):
+                (self.frame_like if rooted else self.derived).add(target.id)
+            elif isinstance(target, (ast.Tuple, ast.List)):
+                self.derived.update(name.id for name in ast.walk(target) if isinstance(name, ast.Name))
+            if isinstance(target, ast.Attribute) and target.attr in ("columns", "index"):
+                self.reassigned.add(_root(target))
+                self.created.update(c.value for c in _strings(node.value))
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.reassigned.add(node.target.id)
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        for name in ast.walk(node.target):
+            if isinstance(name, ast.Name):
+                self.reassigned.add(name.id)
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.created.update(c.value for c in _strings(node.slice))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        method = func.attr if isinstance(func, ast.Attribute) else None
+        for keyword in node.keywords:
+            if keyword.arg == "inplace" and isinstance(func, ast.Attribute):
+                self.reassigned.add(_root(func.value))
+            elif keyword.arg == "name":
+                self.created.update(c.value for c in _strings(keyword.value))
+            elif keyword.arg == "columns" and method in ("rename", "DataFrame") and isinstance(keyword.value, ast.Dict):
+                self.created.update(c.value for v in keyword.value.values for c in _strings(v))
+            elif keyword.arg == "columns" and method == "DataFrame":
+                self.created.update(c.value for c in _strings(keyword.value))
+            elif method in ("assign", "agg", "aggregate") and keyword.arg:
+                self.created.add(keyword.arg)
+        if method == "DataFrame" and node.args and isinstance(node.args[0], ast.Dict):
+            self.created.update(c.value for k in node.args[0].keys if k is not None for c in _strings(k))
+        elif method == "insert" and len(node.args) > 1:
+            self.created.update(c.value for c in _strings(node.args[1]))
+        elif method == "to_frame" and node.args:
+            self.created.update(c.value for c in _strings(node.args[0]))
+        elif method == "apply" and self.rooted(func.value):
+            # lambda row: row['col'] iterates over the frame's rows
+            for arg in node.args:
+                if isinstance(arg, ast.Lambda):
+                    self.frame_like.update(a.arg for a in arg.args.args)
+        self.generic_visit(node)
+
+
+class _Check(ast.NodeVisitor):
+    """Resolve column references, rewriting near-misses in place."""
+
+    def __init__(self, validator: "SchemaValidator", scan: _Scan):
+        self.validator = validator
+        self.scan = scan
+        self.fixes: List[Tuple[str, str]] = []
+        self.errors: List[str] = []
+
+    def _base(self, node: ast.AST) -> Optional[str]:
+        # a table of the schema, referenced directly and never reassigned
+        if isinstance(node, ast.Name) and node.id in self.validator.maps and node.id not in self.scan.reassigned:
+            return node.id
+        return None
+
+    def _columns(self, receiver: ast.AST) -> ColumnMap:
+        root = _root(receiver)
+        columns = self.validator.maps.get(root) if root not in self.scan.reassigned else None
+        return columns or self.validator.union
+
+    def _check(self, receiver: ast.AST, constants: List[ast.Constant]) -> None:
+        if not constants or not self.scan.rooted(receiver):
+            return
+        base = self._base(receiver)
+        columns = self._columns(receiver)
+        for constant in constants:
+            name = constant.value
+            if name in self.scan.created or name in columns.columns:
+                continue
+            resolved = columns.resolve(name)
+            if resolved is not None and resolved not in self.scan.created:
+                constant.value = resolved
+                self.fixes.append((name, resolved))
+            elif base is not None:
+                self.errors.append(f"KeyError: column '{name}' is not in {base} "
+                                   f"(columns: {sorted(self.validator.maps[base].columns)})")
+
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Load):
+            receiver = node.value
+            if isinstance(receiver, ast.Attribute) and receiver.attr == "loc":
+                if isinstance(node.slice, ast.Tuple) and len(node.slice.elts) == 2:
+                    self._check(receiver.value, _strings(node.slice.elts[1]))
+            elif not isinstance(receiver, ast.Attribute) or receiver.attr not in ("iloc", "at", "iat", "str"):
+                self._check(receiver, _strings(node.slice, lists=isinstance(node.slice, ast.List)))
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        base = self._base(node.value)
+        if isinstance(node.ctx, ast.Load) and base and node.attr not in FRAME_ATTRIBUTES:
+            columns = self.validator.maps[base]
+            if node.attr not in columns.columns and node.attr not in self.scan.created:
+                resolved = columns.resolve(node.attr)
+                if resolved is not None and resolved.isidentifier() and resolved not in FRAME_ATTRIBUTES:
+                    self.fixes.append((node.attr, resolved))
+                    node.attr = resolved
+                else:
+                    self.errors.append(f"AttributeError: {base} has no column or attribute '{node.attr}'")
+        self.generic_visit(node)
+
+    def _check_merge(self, node: ast.Call) -> None:
+        # left_on/right_on name columns of one side, on of both
+        func = node.func
+        sides = list(node.args) if _root(func.value) in PANDAS_NAMES else [func.value] + list(node.args)
+        sides += [keyword.value for keyword in node.keywords if keyword.arg in ("left", "right", "other")]
+        if len(sides) < 2:
+            return
+        left, right = sides[0], sides[1]
+        for keyword in node.keywords:
+            if keyword.arg == "left_on":
+                self._check(left, _strings(keyword.value))
+            elif keyword.arg == "right_on":
+                self._check(right, _strings(keyword.value))
+            elif keyword.arg == "on" and self.scan.rooted(left) and self.scan.rooted(right):
+                for constant in _strings(keyword.value):
+                    name = constant.value
+                    resolved = {self._columns(side).resolve(name) for side in (left, right)}
+                    if name not in self.scan.created and len(resolved) == 1 and None not in resolved \
+                            and name not in resolved:
+                        constant.value = resolved.pop()
+                        self.fixes.append((name, constant.value))
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr in ("merge", "join"):
+            self._check_merge(node)
+        elif isinstance(func, ast.Attribute) and func.attr in COLUMN_ARGS:
+            keywords, position = COLUMN_ARGS[func.attr]
+            for keyword in node.keywords:
+                if keyword.arg in keywords:
+                    self._check(func.value, _strings(keyword.value))
+            if position is not None and len(node.args) > position:
+                self._check(func.value, _strings(node.args[position]))
+        elif isinstance(func, ast.Attribute) and func.attr == "rename":
+            for keyword in node.keywords:
+                if keyword.arg == "columns" and isinstance(keyword.value, ast.Dict):
+                    self._check(func.value, [c for k in keyword.value.keys if k is not None for c in _strings(k)])
+        self.generic_visit(node)
+
+
+class SchemaValidator:
+    """
+    Validator for the tables of a question, built once per schema. Maps each
+    table variable (df, df1, original_df, ...) to its columns.
+    """
+
+    def __init__(self, frames: Dict[str, Iterable[Any]]):
+        self.maps = {name: ColumnMap(columns) for name, columns in frames.items()}
+        self.union = ColumnMap(column for columns in self.maps.values() for column in columns.columns)
+
+    @classmethod
+    def from_namespace(cls, namespace: Dict[str, Any]) -> "SchemaValidator":
+        return cls({name: value.columns for name, value in namespace.items() if isinstance(value, pd.DataFrame)})
+
+    def validate(self, code: str) -> Tuple[str, List[Tuple[str, str]], List[str]]:
+        """
+        Returns (code, fixes, errors): the code with near-miss column names
+        corrected, the (wrong, correct) names replaced and the reasons the
+        program cannot run. Code without fixes is returned unchanged.
+        """
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return code, [], [f"SyntaxError: {e.msg} (line {e.lineno})"]
+        scan = _Scan(set(self.maps))
+        scan.visit(tree)
+        check = _Check(self, scan)
+        check.visit(tree)
+        if check.fixes and not check.errors:
+            code = ast.unparse(tree)
+        return code, check.fixes, check.errors
+
+    def check(self, code: str) -> str:
+        """The corrected code; raises CodeValidationError for programs that cannot run."""
+        code, _, errors = self.validate(code)
+        if errors:
+            raise CodeValidationError("; ".join(errors))
+        return code
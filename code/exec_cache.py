@@ -0,0 +1,177 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+import ast
+import hashlib
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# names generated code gets from or hands back to the tools; never renamed
+RESERVED_NAMES = {"df", "data", "original_df", "pd", "pandas", "np", "numpy",
+                  "new_table", "final_result", "result", "answer", "target_function"}
+# calls that reach variables by their name, which renaming would break
+NAME_LOOKUPS = {"locals", "globals", "vars", "eval", "exec"}
+
+
+class _Renamer(ast.NodeTransformer):
+    def __init__(self, names: Dict[str, str]):
+        self.names = names
+
+    def visit_Name(self, node):
+        node.id = self.names.get(node.id, node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self.names.get(node.arg, node.arg)
+        return node
+
+
+def canonical_code(code: str) -> Optional[str]:
+    """
+    Canonical form of a program: its AST without docstrings, with local
+    variables renamed in order of first appearance, so programs differing
+    only in whitespace, comments or variable names share a form. None when
+    the code does not parse. Variables are kept when something refers to
+    them by name: "@var" in query/eval strings, keyword arguments named like
+    them, or locals()/eval(...) calls.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if isinstance(body, list) and body and isinstance(body[0], ast.Expr) \
+                and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+    names = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            name = node.id
+        elif isinstance(node, ast.arg):
+            name = node.arg
+        else:
+            continue
+        if name not in RESERVED_NAMES and name not in names:
+            names[name] = f"_v{len(names)}"
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            by_name = set(re.findall(r"@\s*([A-Za-z_]\w*)", node.value))
+        elif isinstance(node, ast.keyword):
+            by_name = {node.arg}
+        elif isinstance(node, ast.Name) and node.id in NAME_LOOKUPS:
+            by_name = set(names)
+        else:
+            continue
+        if by_name & names.keys():
+            names = {}
+            break
+    tree = _Renamer(names).visit(tree)
+    return ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+
+def fingerprint(*parts: Any) -> str:
+    """Fingerprint of the table(s) a program runs on: table2df code, a dataset path, ..."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8", "replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ExecutionCache:
+    """
+    Results and errors of executed programs keyed by (table fingerprint,
+    tool, outputs, canonical program), so equivalent samples run once. LRU
+    bounded, shared by all agents of a run; hit rates are kept per tool.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups: Dict[str, int] = defaultdict(int)
+        self.hits: Dict[str, int] = defaultdict(int)
+
+    def run(self, tool: str, table: str, code: str, fn: Callable[[], Any],
+            outputs: Iterable[str] = ()) -> Any:
+        """Return fn() for a program, from the cache when an equivalent one ran on the same table."""
+        canonical = canonical_code(code)
+        key = (table, tool, tuple(outputs), canonical if canonical is not None else "raw:" + code)
+        with self._lock:
+            self.lookups[tool] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits[tool] += 1
+                self._entries.move_to_end(key)
+        if entry is not None:
+            ok, value = entry
+            if not ok:
+                raise value
+            return _copy(value)
+        try:
+            value = fn()
+        except Exception as e:
+            self._store(key, (False, e))
+            raise
+        self._store(key, (True, _copy(value)))
+        return value
+
+    def _store(self, key: tuple, entry: tuple) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        return {tool: {"lookups": n, "hits": self.hits[tool], "hit_rate": round(self.hits[tool] / max(n, 1), 3)}
+                for tool, n in self.lookups.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.lookups.clear()
+            self.hits.clear()
+
+
+def _copy(value):
+    # outputs (DataFrames, lists, ...) handed out by the cache must not share state with it
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if hasattr(value, "copy") and not isinstance(value, (str, bytes)):
+        try:
+            return value.copy()
+        except Exception:
+            return value
+    return value
+
+
+# shared by all agents of a run, like the prompt tracker
+execution_cache = ExecutionCache()
@@ -671,10 +671,10 @@ Action 2: Finish[["Tuesday", "Monday"]]
 
 
 TABLE_OPERATION_EXAMPLE = """
-Instruction: extract the score of the game between the teams on 6 February 1922.
 Table dateframe code: import pandas as pd
 data={"Tie no": ["1", "2", "3", "Replay", "4", "5", "6", "7", "8", "9", "10", "11", "Replay", "12", "Replay", "13", "Replay", "Replay", "14", "Replay", "15", "16"], "Home team": ["Liverpool", "Preston North End", "Southampton", "Cardiff City", "Leicester City", "Nottingham Forest", "Aston Villa", "Bolton Wanderers", "Swindon Town", "Tottenham Hotspur", "Barnsley", "Northampton Town", "Stoke", "Brighton & Hove Albion", "Huddersfield Town", "Bradford City", "Notts County", "Notts County", "Crystal Palace", "Millwall", "Southend United", "Bradford Park Avenue"], "Score": ["0\u20131", "3\u20131", "1\u20131", "2\u20130", "2\u20130", "3\u20130", "1\u20130", "1\u20133", "0\u20131", "1\u20130", "3\u20131", "2\u20132", "3\u20130", "0\u20130", "2\u20130", "1\u20131", "0\u20130", "1\u20130", "0\u20130", "2\u20130", "0\u20131", "2\u20133"], "Away team": ["West Bromwich Albion", "Newcastle United", "Cardiff City", "Southampton", "Fulham", "Hull City", "Luton Town", "Manchester City", "Blackburn Rovers", "Watford", "Oldham Athletic", "Stoke", "Northampton Town", "Huddersfield Town", "Brighton & Hove Albion", "Notts County", "Bradford City", "Bradford City", "Millwall", "Crystal Palace", "Swansea Town", "Arsenal"], "Date": ["28 January 1922", "28 January 1922", "28 January 1922", "1 February 1922", "28 January 1922", "28 January 1922", "28 January 1922", "28 January 1922", "28 January 1922", "28 January 1922", "28 January 1922", "28 January 1922", "1 February 1922", "28 January 1922", "1 February 1922", "28 January 1922", "1 February 1922", "6 February 1922", "28 January 1922", "1 February 1922", "28 January 1922", "28 January 1922"]}
 df=pd.DataFrame(data)
+Instruction: extract the score of the game between the teams on 6 February 1922.
 Code: ```Python
 # Filter based on the date
 filtered_df = df[df['Date'] == '6 February 1922']
@@ -683,10 +683,10 @@ filtered_df = df[df['Date'] == '6 February 1922']
 new_table = filtered_df
 ```
 
-Instruction: retrieve the number of passengers for Los Angeles and Saskatoon from the table in 2013.
 Table dataframe code: import pandas as pd
 data={"Rank": ["1", "2", "3", "4", "5", "6", "7", "8", "9"], "City": ["United States, Los Angeles", "United States, Houston", "Canada, Calgary", "Canada, Saskatoon", "Canada, Vancouver", "United States, Phoenix", "Canada, Toronto", "Canada, Edmonton", "United States, Oakland"], "Passengers": ["14,749", "5,465", "3,761", "2,282", "2,103", "1,829", "1,202", "110", "107"], "Ranking": ["", "", "", "4", "", "1", "1", "", ""], "Airline": ["Alaska Airlines", "United Express", "Air Transat, WestJet", "", "Air Transat", "US Airways", "Air Transat, CanJet", "", ""]}
 df=pd.DataFrame(data)
+Instruction: retrieve the number of passengers for Los Angeles and Saskatoon from the table in 2013.
 Code: ```Python
 # Filter the rows for Los Angeles and Saskatoon in 2013
 filter_la = (df['City'] == 'United States, Los Angeles') & (df['Rank'] == '1')
@@ -702,10 +702,10 @@ new_table.columns = ['City', 'Passengers_2013']
 
 
 NUMERICAL_OPERATION_EXAMPLE = """
-Instruction: count how many buildings have a height under 200 ft.
 Dataframe code: import pandas as pd
 data={"Rank": ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "13", "14", "15", "16", "17", "18", "19", "20", "21=", "21=", "23", "24", "25", "26", "27", "28", "29", "30"], "Name": ["Rhodes State Office Tower", "LeVeque Tower", "William Green Building", "Huntington Center", "Vern Riffe State Office Tower", "One Nationwide Plaza", "Franklin County Courthouse", "AEP Building", "Borden Building", "Three Nationwide Plaza", "One Columbus Center", "Columbus Center", "Capitol Square", "Continental Center", "PNC Bank Building", "Miranova Condominiums", "Fifth Third Center", "Motorists Mutual Building", "Midland Building", "The Condominiums at North Bank Park", "Lincoln Tower Dormitory", "Morrill Tower Dormitory", "Hyatt Regency Columbus", "Key Bank Building", "Adam's Mark Hotel", "Town Center", "8 East Broad Street", "Huntington Building", "Ohio Judicial Center", "16 East Broad Street"], "Height\\nft / m": ["629 / 192", "555 / 169", "530 / 162", "512 / 156", "503 / 153", "485 / 148", "464 / 141", "456 / 139", "438 / 134", "408 / 124", "366 / 112", "357 / 109", "350 / 107", "348 / 106", "317 / 97", "314 / 96", "302 / 92", "286 / 87", "280 / 85", "267 / 81", "260 / 79", "260 / 79", "256 / 78", "253 / 77", "243 / 74", "226 / 69", "212 / 64.6", "202 / 59.4", "200 / 57.9", "180 / 64.4"], "Floors": ["41", "47", "33", "37", "32", "40", "27", "31", "34", "27", "26", "25", "26", "26", "25", "26", "25", "21", "21", "20", "26", "26", "20", "20", "16", "17", "17", "13", "14", "13"], "Year": ["1973", "1927", "1990", "1984", "1988", "1976", "1991", "1983", "1974", "1989", "1987", "1964", "1984", "1973", "1977", "2001", "1998", "1973", "1970", "2007", "1967", "1967", "1980", "1963", "1961", "1974", "1906", "1926", "1933", "1900"], "Notes": ["Has been the tallest building in Columbus and the tallest mid-block skyscraper in Ohio since 1973. Tallest building constructed in Columbus in the 1970s.", "Tallest building constructed in Columbus in the 1920s.", "Tallest building constructed in Columbus in the 1990s.", "Tallest building constructed in Columbus in the 1980s.", "", "", "", "", "", "", "", "Tallest building constructed in Columbus in the 1960s. Was built as the Bank One Tower.", "", "", "", "Tallest residential building in the state of Ohio. Tallest building built in the 2000s.", "", "", "", "", "", "", "", "", "", "", "", "", "", ""]}
 df=pd.DataFrame(data)
+Instruction: count how many buildings have a height under 200 ft.
 Information: 
 Code: ```Python
 # Conversion of height from string to numeric
@@ -718,10 +718,10 @@ buildings_under_200ft = df[df['Height'] < 200]
 final_result = len(buildings_under_200ft)
 ```
 
-Instruction: calculate the average of gold medals for the top 5 nations.
 Dataframe code: import pandas as pd
 data={"Rank": ["1", "2", "3", "4", "5"], "Nation": ["United States", "Jamaica", "Netherlands", "Bahamas", "Ukraine"], "Gold": ["5", "4", "2", "1", "1"], "Silver": ["6", "1", "0", "1", "0"], "Bronze": ["5", "1", "0", "0", "1"], "Total": ["16", "6", "2", "2", "2"]}
 df=pd.DataFrame(data)
+Instruction: calculate the average of gold medals for the top 5 nations.
 Code: ```Python
 top_5_medals = df.["Gold"].astype(int).sum()
 final_result = top_5_medals / 5
@@ -729,11 +729,30 @@ final_result = top_5_medals / 5
 """
 
 
+SQL_OPERATION_EXAMPLE = """
+Tables:
+Table df (Rank object, Name object, "Height\\nft / m" object, Floors object, Year object)
+First rows: [['1', 'Rhodes State Office Tower', '629 / 192', '41', '1973'], ['2', 'LeVeque Tower', '555 / 169', '47', '1927'], ['3', 'William Green Building', '530 / 162', '33', '1990']]
+Instruction: count how many buildings have more than 30 floors.
+SQL: ```sql
+SELECT COUNT(*) FROM df WHERE CAST(Floors AS INTEGER) > 30
+```
+
+Tables:
+Table df (Rank object, Nation object, Gold object, Silver object, Bronze object, Total object)
+First rows: [['1', 'United States', '5', '6', '5', '16'], ['2', 'Jamaica', '4', '1', '1', '6'], ['3', 'Netherlands', '2', '0', '0', '2']]
+Instruction: show the nations and gold medals of the top 3 nations.
+SQL: ```sql
+SELECT Nation, Gold FROM df ORDER BY CAST(Rank AS INTEGER) LIMIT 3
+```
+"""
+
+
 NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE = """
-Instruction: count the number of entries whose category is Technology
 Dataframe code for the first two records: import pandas as pd
 data={'rank':[1.0, 2.0],'personName':['Elon Musk', 'Jeff Bezos'],'age':[50.0, 58.0],'finalWorth':[219000.0, 171000.0],'category':['Automotive', 'Technology'],'source':['Tesla, SpaceX', 'Amazon'],'country':['United States', 'United States'],'state':['Texas', 'Washington'],'city':['Austin', 'Seattle'],'organization':['Tesla', 'Amazon'],'selfMade':[1.0, 1.0],'gender':['M', 'M'],'birthDate':[Timestamp('1971-06-28 00:00:00+0000', tz='UTC'), Timestamp('1964-01-12 00:00:00+0000', tz='UTC')],'title':['CEO', 'Entrepreneur'],'philanthropyScore':[1.0, 1.0],'bio':["Elon Musk is working to revolutionize transportation both on Earth, through electric car maker Tesla -- and in space, via rocket producer SpaceX. He owns 21% of Tesla but has pledged more than half his stake as collateral for loans; Forbes has discounted his stake to take the loans into account. A regulatory filing in early April 2022 revealed that Musk had purchased 9.2% of Twitter. The company invited him to join its board the next day.   SpaceX, Musk's rocket company, is valued at $74 billion after a funding round in February 2021. He grew up in South Africa, then immigrated to Canada at age 17. He landed in the U.S. as a transfer student to the University of Pennsylvania.", 'Jeff Bezos founded e-commerce giant Amazon in 1994 out of his garage in Seattle. He stepped down as CEO to become executive chairman in July 2021. Bezos sold $8.8 billion worth of his Amazon stock in 2021 and also gave some shares away; he now owns a bit less than 10% of the company.  Amazon faced criticism from U.S. senators and the general public for its treatment of warehouse workers during the coronavirus pandemic. He and his wife MacKenzie divorced in 2019 after 25 years of marriage and he transferred a quarter of his then-16% Amazon stake to her. Bezos owns The Washington Post and Blue Origin, an aerospace company developing rockets; he briefly flew to space in one in July 2021.'],'about':['Musk was accepted to a graduate program at Stanford, but deferred attendance to launch his first business, software company Zip2. As a kid Musk taught himself to code; he sold his first game, Blastar, for about $500. ', "Growing up, Jeff Bezos worked summers on his grandfather's ranch repairing Caterpillar tractors. Bezos met Google founders Larry Page and Sergey Brin in 1998 and managed to become one of the company's first angel investors, putting in an estimated $250,000."]}
 df=pd.DataFrame(data)
+Instruction: count the number of entries whose category is Technology
 Information: 
 Code: ```Python
 # Define the function to count entries with category "Technology"  
@@ -742,10 +761,10 @@ def target_function(dataframe):
     return technology_entries_count
 ```
 
-Instruction: calculate the average of gold medals for the top 5 nations.
 Dataframe code for the first two records: import pandas as pd
 data={"Rank": ["1", "2"], "Nation": ["United States", "Jamaica"], "Gold": ["5", "4"], "Silver": ["6", "1"], "Bronze": ["5", "1"], "Total": ["16", "6"]}
 df=pd.DataFrame(data)
+Instruction: calculate the average of gold medals for the top 5 nations.
 Code: ```Python
 # average number of gold medals for the top 5 nations in the dataframe
 def target_function(dataframe):
@@ -792,12 +811,12 @@ Plan: 1. I need to count the number of entries whose 'trip_distance' is larger t
 """
 
 NUMERICAL_OPERATION_EXAMPLE_LONG_TABLE_GLOBAL = """
-Plan: 1. I need to filter the table to get all billionaires from the 'Technology' category.
-2: Then I need to count the number of retrieved entries.
-3. The answer to the question is the number of retrieved entries in the second step, and I will return this value as the final answer.
 Dataframe code for the first two records: import pandas as pd
 data={'rank':[1.0, 2.0],'personName':['Elon Musk', 'Jeff Bezos'],'age':[50.0, 58.0],'finalWorth':[219000.0, 171000.0],'category':['Automotive', 'Technology'],'source':['Tesla, SpaceX', 'Amazon'],'country':['United States', 'United States'],'state':['Texas', 'Washington'],'city':['Austin', 'Seattle'],'organization':['Tesla', 'Amazon'],'selfMade':[1.0, 1.0],'gender':['M', 'M'],'birthDate':[Timestamp('1971-06-28 00:00:00+0000', tz='UTC'), Timestamp('1964-01-12 00:00:00+0000', tz='UTC')],'title':['CEO', 'Entrepreneur'],'philanthropyScore':[1.0, 1.0],'bio':["Elon Musk is working to revolutionize transportation both on Earth, through electric car maker Tesla -- and in space, via rocket producer SpaceX. He owns 21% of Tesla but has pledged more than half his stake as collateral for loans; Forbes has discounted his stake to take the loans into account. A regulatory filing in early April 2022 revealed that Musk had purchased 9.2% of Twitter. The company invited him to join its board the next day.   SpaceX, Musk's rocket company, is valued at $74 billion after a funding round in February 2021. He grew up in South Africa, then immigrated to Canada at age 17. He landed in the U.S. as a transfer student to the University of Pennsylvania.", 'Jeff Bezos founded e-commerce giant Amazon in 1994 out of his garage in Seattle. He stepped down as CEO to become executive chairman in July 2021. Bezos sold $8.8 billion worth of his Amazon stock in 2021 and also gave some shares away; he now owns a bit less than 10% of the company.  Amazon faced criticism from U.S. senators and the general public for its treatment of warehouse workers during the coronavirus pandemic. He and his wife MacKenzie divorced in 2019 after 25 years of marriage and he transferred a quarter of his then-16% Amazon stake to her. Bezos owns The Washington Post and Blue Origin, an aerospace company developing rockets; he briefly flew to space in one in July 2021.'],'about':['Musk was accepted to a graduate program at Stanford, but deferred attendance to launch his first business, software company Zip2. As a kid Musk taught himself to code; he sold his first game, Blastar, for about $500. ', "Growing up, Jeff Bezos worked summers on his grandfather's ranch repairing Caterpillar tractors. Bezos met Google founders Larry Page and Sergey Brin in 1998 and managed to become one of the company's first angel investors, putting in an estimated $250,000."]}
 df=pd.DataFrame(data)
+Plan: 1. I need to filter the table to get all billionaires from the 'Technology' category.
+2: Then I need to count the number of retrieved entries.
+3. The answer to the question is the number of retrieved entries in the second step, and I will return this value as the final answer.
 Code: ```Python 
 def target_function(dataframe):  
     # filter the table for 'Technology' as the category and count the number of the entries
@@ -806,12 +825,12 @@ def target_function(dataframe):
     return technology_entries_count
 ```
 
-Plan: 1. I need to retrieve the first five values from the 'Gold' columns.
-2. To calculate the average number, I will sum the retrieved values and divide the sum by 5.
-3. The answer to the question is the result from step 2. I will return that value as the final answer.
 Dataframe code for the first two records: import pandas as pd
 data={"Rank": ["1", "2"], "Nation": ["United States", "Jamaica"], "Gold": ["5", "4"], "Silver": ["6", "1"], "Bronze": ["5", "1"], "Total": ["16", "6"]}
 df=pd.DataFrame(data)
+Plan: 1. I need to retrieve the first five values from the 'Gold' columns.
+2. To calculate the average number, I will sum the retrieved values and divide the sum by 5.
+3. The answer to the question is the result from step 2. I will return that value as the final answer.
 Code: ```Python
 def target_function(dataframe):
     # retrieve the top 5 gold medals values from the table
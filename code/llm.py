@@ -29,21 +29,47 @@ import random
 import math
 import asyncio
 import re
+import threading
 from typing import Union, List, Optional
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from config import llm_config
 
 random.seed(42)
 
 
+def usage_dict(usage) -> dict:
+    """Prompt, cached prompt and completion tokens of an OpenAI usage object."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {"prompt_tokens": usage.prompt_tokens or 0,
+            "completion_tokens": usage.completion_tokens or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0}
+
+
 class UnifiedLLM:
     """Unified LLM interface using OpenAI API format for both GPT and open-source models."""
     
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, base_url: Optional[str] = None, api_key: Optional[str] = None):
         self.model_name = model_name
-        self.client = llm_config.get_client_for_model(model_name)
-        self.async_client = llm_config.get_async_client_for_model(model_name)
+        if base_url:
+            # explicit endpoint, e.g. from a model routing table
+            api_key = api_key or llm_config.openai_api_key or "EMPTY"
+            self.client = OpenAI(api_key=api_key, base_url=base_url)
+            self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        else:
+            self.client = llm_config.get_client_for_model(model_name)
+            self.async_client = llm_config.get_async_client_for_model(model_name)
         self.is_gpt = llm_config.is_gpt_model(model_name)
+        # token usage of the calling thread's last synchronous call, if the endpoint reports it
+        self._local = threading.local()
+
+    @property
+    def last_usage(self) -> Optional[dict]:
+        # per thread: samples and rollouts call a shared instance concurrently
+        return getattr(self._local, "usage", None)
+
+    @last_usage.setter
+    def last_usage(self, usage: Optional[dict]) -> None:
+        self._local.usage = usage
         
     def __call__(self, prompt: Union[str, List[dict]], num_return_sequences: int = 1, 
                  return_prob: bool = False, max_tokens: int = 2000, 
@@ -58,6 +84,7 @@ class UnifiedLLM:
         else:
             raise ValueError("Prompt must be either string or list of message dictionaries")
         
+        self.last_usage = None
         try:
             # Use OpenAI chat completions API for both GPT and open-source models
             response = self.client.chat.completions.create(
@@ -72,6 +99,8 @@ class UnifiedLLM:
             
             # Extract generated text from all choices
             results = [choice.message.content.strip() if choice.message.content else "" for choice in response.choices]
+            if getattr(response, "usage", None) is not None:
+                self.last_usage = usage_dict(response.usage)
             
             # For consistency with original interface, return probability scores if requested
             # Note: This is a simplified implementation as true logprobs may not be available
@@ -0,0 +1,113 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+from retrieval import count_tokens
+
+# prompt template field -> reported section; the rest of the template counts as instructions
+SECTIONS = {
+    "examples": "examples",
+    "table": "table",
+    "table_df": "table",
+    "context": "context",
+    "question": "question",
+    "instruction": "question",
+    "scratchpad": "scratchpad",
+}
+SECTION_ORDER = ["instructions", "examples", "table", "context", "question", "scratchpad"]
+
+
+class PromptTokenTracker:
+    """
+    Per-section token counts of the prompts built in a run, aggregated per
+    call site. Each recorded breakdown is kept as ``last`` and, when a log
+    path is set, appended to it as one JSON line.
+    """
+
+    def __init__(self, log_path: Optional[str] = None):
+        self.log_path = log_path
+        self.last: Dict[str, int] = {}
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, site: str, prompt: str, sections: Dict[str, str]) -> Dict[str, int]:
+        breakdown = defaultdict(int)
+        for field, text in sections.items():
+            breakdown[SECTIONS.get(field, field)] += count_tokens(str(text))
+        total = count_tokens(prompt)
+        breakdown["instructions"] = max(total - sum(breakdown.values()), 0)
+        breakdown = {"site": site, "total": total, **breakdown}
+        with self._lock:
+            self.last = breakdown
+            self._calls[site] += 1
+            for name, tokens in breakdown.items():
+                if name != "site":
+                    self._tokens[site][name] += tokens
+            if self.log_path:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(breakdown) + "\n")
+        return breakdown
+
+    def format(self, site: str, template: str, **fields) -> str:
+        """Format a prompt template and record the tokens of each of its fields."""
+        prompt = template.format(**fields)
+        self.record(site, prompt, fields)
+        return prompt
+
+    def report(self) -> Dict[str, dict]:
+        """Calls, total and average tokens and share of the prompt per section, per call site."""
+        report = {}
+        for site, tokens in self._tokens.items():
+            calls = self._calls[site]
+            total = max(tokens["total"], 1)
+            names = [n for n in SECTION_ORDER if n in tokens] + \
+                sorted(n for n in tokens if n not in SECTION_ORDER and n != "total")
+            report[site] = {
+                "calls": calls,
+                "total_tokens": tokens["total"],
+                "avg_tokens": round(tokens["total"] / calls, 1),
+                "sections": {name: {"tokens": tokens[name],
+                                    "avg_tokens": round(tokens[name] / calls, 1),
+                                    "share": round(tokens[name] / total, 3)} for name in names},
+            }
+        return report
+
+    def reset(self) -> None:
+        with self._lock:
+            self.last = {}
+            self._calls.clear()
+            self._tokens.clear()
+
+
+# shared by all agents of a run, like the demo banks
+prompt_tracker = PromptTokenTracker()
@@ -136,9 +136,9 @@ TABLE_OPERATION_PROMPT = """
 You are given an instruction and a table in pandas dataframe format. Write python code in one code block to retrieve the most relevant rows or/and columns according to the instruction. Return the result in pandas dataframe format and rename it after 'new_table'. Do not use print in the code.
 Below are two examples:
 {examples}
-Now please write code for the following instruction.
-Instruction:{instruction}
+Now please write code for the following table and instruction.
 Table dataframe code:{table_df}
+Instruction:{instruction}
 Code:
 """
 
@@ -146,19 +146,30 @@ NUMERICAL_OPERATION_PROMPT = """
 According to the instruction, write python code in one code block to perform calculations based on the given pandas dataframe. Return the final result after the variable name final_result. The final result can be of either pandas dataframe or string type. Do not use other data type. Do not use print statement in the code block.
 Below are two examples:
 {examples}
-Now generate python code according to the following instruction.
-Instruction: {instruction}
+Now generate python code for the following dataframe according to the instruction.
 Dataframe code: {table_df}
+Instruction: {instruction}
 Code: 
 """
 
+SQL_OPERATION_PROMPT = """
+According to the instruction, write one SQL SELECT query in one sql code block over the given tables. Return the rows and columns the instruction asks for, or a single value for calculations. Quote column names with spaces or symbols in double quotes.
+Below are two examples:
+{examples}
+Now generate the SQL query for the following tables according to the instruction.
+Tables:
+{schema}
+Instruction: {instruction}
+SQL: 
+"""
+
 NUMERICAL_OPERATION_PROMPT_LONG_TABLE = """
 According to the instruction, write a function named after 'target_function' in one python code block to perform calculations on a dataframe object. The given dataframe shows only two records of the original data due to its large size. However, you should be able to infer the data type based on the given dataframe. Return only the python function without any execution and do not use print statement in the code block.
 Below are two examples:
 {examples}
-Now generate python code according to the following instruction.
-Instruction: {instruction}
+Now generate python code for the following dataframe according to the instruction.
 Dataframe code for the first two records: {table_df}
+Instruction: {instruction}
 Code: 
 """
 
@@ -169,9 +180,9 @@ The given dataframe shows only two records of the original data due to its large
 However, you should not operate any code based on the given dataframe, since it does not contain all information about the table.  \
 Below are two examples
 {examples}
-Now generate the python function according to the given plan.
-Plan: {instruction}
+Now generate the python function for the following dataframe according to the given plan.
 Dataframe code for the first two records: {table_df}
+Plan: {instruction}
 Code: 
 """
 
@@ -194,6 +205,13 @@ Question: {question}
 """
 
 
+FORMAT_REMINDER = """
+(Answer only with the next step in exactly this format, nothing else:
+Thought {step}: <your reasoning>
+Action {step}: <one of Retrieve[...], Calculate[...], Operate[...], Search[...], Finish[...]>)
+"""
+
+
 react_agent_prompt_wtq = PromptTemplate(
     input_variables=["examples", "table", "context", "question", "scratchpad"],
     template=REACT_INSTRUCTION_WTQ,
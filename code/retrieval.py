@@ -0,0 +1,230 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+STOPWORDS = {"the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was",
+             "were", "what", "which", "who", "how", "did", "does", "do", "by", "with", "that",
+             "this", "it", "as", "at", "be", "from"}
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, else about 4 characters per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a small in-memory collection."""
+
+    def __init__(self, docs: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = [Counter(tokenize(doc)) for doc in docs]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / max(len(self.docs), 1) or 1.0
+        df = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def scores(self, query: str) -> List[float]:
+        terms = tokenize(query)
+        scores = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / self.avg_length)
+                    score += self.idf[term] * tf * (self.k1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        scores = self.scores(query)
+        return sorted(range(len(scores)), key=lambda i: (-scores[i], i))[:k]
+
+
+def split_demos(demos: str) -> List[str]:
+    """Split a few-shot block into single examples (each starts with "Example n:" or "Table:")."""
+    parts = re.split(r"\n\s*\n(?=\s*(?:Example \d+:|Table:))", demos.strip())
+    return [part.strip() for part in parts if part.strip()]
+
+
+def demo_key(demo: str) -> str:
+    """Text a demo is indexed by: its table header and its question or statement."""
+    lines = [line.strip() for line in demo.split("\n") if line.strip()]
+    key = []
+    for i, line in enumerate(lines):
+        if line.startswith("Table:") and i + 1 < len(lines):
+            key.append(line[len("Table:"):] or lines[i + 1])
+        elif line.startswith(("Question:", "Statement:", "Claim:")):
+            key.append(line)
+    return " ".join(key) or demo
+
+
+class DemoBank:
+    """Few-shot demonstrations of one task, selected per question by BM25."""
+
+    def __init__(self, demos: List[str]):
+        self.demos = demos
+        self.index = BM25Index([demo_key(demo) for demo in demos])
+        self.tokens = [count_tokens(demo) for demo in demos]
+
+    @classmethod
+    def from_block(cls, demos: str, extra: Optional[List[str]] = None) -> "DemoBank":
+        return cls(split_demos(demos) + list(extra or []))
+
+    def select(self, query: str, k: int, max_tokens: Optional[int] = None) -> str:
+        """
+        Return the k most relevant demos, within max_tokens when given.
+        The best demo is always kept; selected demos keep their bank order.
+        """
+        chosen = []
+        used = 0
+        for i in self.index.top_k(query, len(self.demos)):
+            if len(chosen) == k:
+                break
+            if chosen and max_tokens is not None and used + self.tokens[i] > max_tokens:
+                continue
+            chosen.append(i)
+            used += self.tokens[i]
+        demos = [self.demos[i] for i in sorted(chosen)]
+        return "\n\n".join(re.sub(r"^Example \d+:", f"Example {n}:", demo)
+                           for n, demo in enumerate(demos, 1))
+
+
+_banks: Dict[tuple, DemoBank] = {}
+
+
+def task_demo_bank(task: str, demos: str, extra: Optional[List[str]] = None) -> DemoBank:
+    """Index of a task's demos, built once per process and shared by all agents."""
+    key = (task, demos, tuple(extra or []))
+    if key not in _banks:
+        _banks[key] = DemoBank.from_block(demos, extra)
+    return _banks[key]
+
+
+def load_demo_bank(path: str) -> Dict[str, List[str]]:
+    """Read extra demos from a JSON lines file of {"task": ..., "demo": ...}."""
+    extra = {}
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                extra.setdefault(item["task"], []).append(item["demo"].strip())
+    return extra
+
+
+def table_query(question: str, table_string: str) -> str:
+    """Retrieval query of a question: the question plus the header row of its table."""
+    header = next((line for line in table_string.split("\n") if line.strip().startswith("|")), "")
+    return f"{question} {header}"
+
+
+
+def table_entities(table_string: str, max_cells: int = 50) -> str:
+    """Header and first-column cells of a rendered table, the entities paragraphs are matched against."""
+    rows = [line.strip().strip("|").split("|") for line in table_string.split("\n")
+            if line.strip().startswith("|")]
+    if not rows:
+        return ""
+    cells = [cell.strip() for cell in rows[0]] + [row[0].strip() for row in rows[1:max_cells]]
+    return " ".join(cell for cell in cells if cell)
+
+
+def split_passages(context: str) -> Tuple[List[str], str]:
+    """
+    Split a context on its "Paragraph N:" markers, else on lines, else into
+    sentences; returns the passages and the separator that rejoins them.
+    """
+    if len(re.findall(r"Paragraph \d+:", context)) > 1:
+        return [p.strip() for p in re.split(r"(?=Paragraph \d+:)", context) if p.strip()], " "
+    lines = [p.strip() for p in context.split("\n") if p.strip()]
+    if len(lines) > 1:
+        return lines, "\n"
+    return [p.strip() for p in re.split(r"(?<=[.!?])\s+", context) if p.strip()], " "
+
+
+class PassageRetriever:
+    """
+    BM25 over the paragraphs of a context. Paragraphs are ranked by the
+    question, with table entities as a weaker second signal, and the best ones
+    are kept (in context order) under a token budget. When the kept paragraphs
+    cover too few of the question terms found in the context, retrieval is not
+    trusted and the full context is returned.
+    """
+
+    def __init__(self, context: str, entity_weight: float = 0.3, min_coverage: float = 0.5):
+        self.context = context
+        self.paragraphs, self.sep = split_passages(context)
+        self.index = BM25Index(self.paragraphs)
+        self.tokens = [count_tokens(p) for p in self.paragraphs]
+        self.entity_weight = entity_weight
+        self.min_coverage = min_coverage
+
+    def select(self, question: str, max_tokens: int, entities: str = "") -> Tuple[str, bool]:
+        """Return the selected context and whether it was reduced by retrieval."""
+        full = self.context
+        if sum(self.tokens) <= max_tokens:
+            return full, False
+        q_scores = self.index.scores(question)
+        e_scores = self.index.scores(entities) if entities else [0.0] * len(self.paragraphs)
+        scores = [q + self.entity_weight * e for q, e in zip(q_scores, e_scores)]
+        ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        if not ranked or q_scores[ranked[0]] <= 0:
+            return full, False
+        chosen, used = [], 0
+        for i in ranked:
+            if scores[i] <= 0:
+                break
+            if used + self.tokens[i] > max_tokens:
+                continue
+            chosen.append(i)
+            used += self.tokens[i]
+        if not chosen or len(chosen) == len(self.paragraphs):
+            return full, False
+        found = {t for t in tokenize(question) if any(t in self.index.docs[i] for i in range(len(self.paragraphs)))}
+        covered = {t for t in found if any(t in self.index.docs[i] for i in chosen)}
+        if found and len(covered) / len(found) < self.min_coverage:
+            return full, False
+        return self.sep.join(self.paragraphs[i] for i in sorted(chosen)), True
@@ -0,0 +1,248 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import copy
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import canonicalize_answer, parse_action
+
+
+FREE_ACTIONS = ("Finish", "Search")
+
+
+class RolloutBudget:
+    """Thread-safe counter of the LLM calls a single agent step may spend."""
+
+    def __init__(self, max_llm_calls: int):
+        self.max_llm_calls = max_llm_calls
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def spend(self, n: int = 1) -> bool:
+        with self._lock:
+            if self.used + n > self.max_llm_calls:
+                return False
+            self.used += n
+            return True
+
+    @property
+    def exhausted(self) -> bool:
+        return self.used >= self.max_llm_calls
+
+
+class Branch:
+    """One trajectory continued from a candidate action of the current step."""
+
+    def __init__(self, thought, action, scratchpad, step_n, table_dfs):
+        self.thought = thought
+        self.action = action
+        self.scratchpad = scratchpad
+        self.step_n = step_n
+        self.table_dfs = table_dfs
+        self.answer = None
+        self.steps = 0
+        self.done = False
+
+
+def parse_step(instance, step_n):
+    """Return the (thought, action) lines of step `step_n` in a sampled continuation."""
+    lines = [line for line in instance.split("\n") if line.strip() != ""]
+    try:
+        thought = [line for line in lines if f"Thought {step_n}:" in line][0]
+        action = [line for line in lines if f"Action {step_n}:" in line][0]
+    except IndexError:
+        return "", ""
+    return thought, action
+
+
+class RolloutEngine:
+    """
+    Scores the candidate actions of a step by continuing each of them for a
+    few steps. Branches are expanded in parallel rounds; sampled
+    continuations are memoized by scratchpad prefix and tool results by
+    (prefix, action), so branches sharing a prefix, and the agent step that
+    later commits the selected action, reuse the same calls.
+    """
+
+    def __init__(self, agent, depth=2, max_llm_calls=20, max_workers=4, early_stop=True):
+        self.agent = agent
+        self.depth = depth
+        self.max_llm_calls = max_llm_calls
+        self.max_workers = max_workers
+        self.early_stop = early_stop
+        self.plan_cache = {}
+        self.tool_cache = {}
+        self._lock = threading.Lock()
+        self.budget = RolloutBudget(max_llm_calls)
+        self.history = []
+
+    def reset(self) -> None:
+        self.plan_cache.clear()
+        self.tool_cache.clear()
+        self.history = []
+
+    def lookup(self, scratchpad, action):
+        """
+        Return the memoized (raw tool result, table_dfs) of an action, if any;
+        the agent turns the result into its observation as for a fresh run.
+        """
+        cached = self.tool_cache.get((scratchpad, action))
+        if cached is None:
+            return None
+        result, table_dfs = cached
+        return result, list(table_dfs)
+
+    def _tool_cost(self, action_type) -> int:
+        if action_type in FREE_ACTIONS:
+            return 0
+        if self.agent.code_model_name == self.agent.plan_model_name:
+            # one batched call for all code samples
+            return 1
+        return self.agent.code_sample
+
+    def _run_tool(self, branch, thought, action) -> bool:
+        key = (branch.scratchpad, action)
+        with self._lock:
+            cached = self.tool_cache.get(key)
+        if cached is None:
+            action_type, argument = parse_action(action)
+            if action_type is None:
+                return False
+            if not self.budget.spend(self._tool_cost(action_type)):
+                return False
+            table_dfs = list(branch.table_dfs)
+            # the tools record their last code and results on the agent; each branch gets its own
+            result = copy.copy(self.agent)._run_tool(action_type, argument, table_dfs=table_dfs)
+            cached = (result, table_dfs)
+            with self._lock:
+                self.tool_cache[key] = cached
+        result, table_dfs = cached
+        # branches see tool results only, without the llm predicted observations
+        observation = self.agent._observe(parse_action(action)[0], result, branch.step_n)
+        if observation == "":
+            return False
+        branch.scratchpad += thought + "\n" + action + "\n" + observation + "\n"
+        branch.table_dfs = list(table_dfs)
+        branch.step_n += 1
+        return True
+
+    def _sample_next(self, scratchpad):
+        with self._lock:
+            if scratchpad in self.plan_cache:
+                return self.plan_cache[scratchpad]
+        if not self.budget.spend(1):
+            return None
+        prompt = self.agent._build_agent_prompt(scratchpad=scratchpad)
+        try:
+            continuation = self.agent.llm(
+                prompt, num_return_sequences=1, return_prob=False)[0]
+        except Exception:
+            continuation = ""
+        with self._lock:
+            self.plan_cache[scratchpad] = continuation
+        return continuation
+
+    def _advance(self, branch, thought, action) -> None:
+        # apply one (thought, action) to the branch; finish or run the tool
+        branch.steps += 1
+        if "Finish" in action:
+            _, answer = parse_action(action)
+            branch.answer = canonicalize_answer(answer)
+            branch.done = True
+        elif not self._run_tool(branch, thought, action):
+            branch.done = True
+
+    def _expand(self, branch) -> None:
+        if branch.steps == 0:
+            self._advance(branch, branch.thought, branch.action)
+            return
+        continuation = self._sample_next(branch.scratchpad)
+        if not continuation:
+            branch.done = True
+            return
+        thought, action = parse_step(continuation, branch.step_n)
+        if thought == "" or action == "":
+            branch.done = True
+            return
+        self._advance(branch, thought, action)
+
+    def _dominated(self, branches, prior_answers) -> bool:
+        votes = Counter(prior_answers)
+        votes.update(b.answer for b in branches if b.answer)
+        unfinished = sum(1 for b in branches if not b.done)
+        ranked = votes.most_common(2)
+        if not ranked:
+            return False
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        return ranked[0][1] > runner_up + unfinished
+
+    def select(self, action_thought, prior_answers=None):
+        """
+        Pick the most promising action among the distinct sampled actions.
+
+        Args:
+            action_thought: mapping from action line to the thoughts proposing it
+            prior_answers: Finish answers already present in the samples
+
+        Returns:
+            The selected action, or "" if no branch reached an answer
+        """
+        prior_answers = [canonicalize_answer(a) for a in prior_answers or []]
+        prior_answers = [a for a in prior_answers if a != ""]
+        self.budget = RolloutBudget(self.max_llm_calls)
+        branches = []
+        for action, thoughts in action_thought.items():
+            thought = ([t for t in thoughts if t != ""] or [""])[0]
+            branches.append(Branch(thought, action, self.agent.scratchpad,
+                                   self.agent.step_n, list(self.agent.table_dfs)))
+        if not branches:
+            return ""
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in range(self.depth + 1):
+                active = [b for b in branches if not b.done]
+                if not active or self.budget.exhausted:
+                    break
+                list(executor.map(self._expand, active))
+                if self.early_stop and self._dominated(branches, prior_answers):
+                    break
+
+        votes = Counter(prior_answers)
+        votes.update(b.answer for b in branches if b.answer)
+        self.history.append({"step": self.agent.step_n,
+                             "llm_calls": self.budget.used,
+                             "answers": [b.answer for b in branches]})
+        if not votes:
+            return ""
+        # reward: agreement of a branch's answer with the majority, shorter wins ties
+        scored = [(votes[b.answer], -b.steps, i) for i, b in enumerate(branches) if b.answer]
+        if not scored:
+            return ""
+        best = max(scored)[2]
+        return branches[best].action
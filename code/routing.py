@@ -0,0 +1,173 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from llm import UnifiedLLM
+
+# call site -> which of the agent's models it uses when no route is given
+CALL_SITES = {
+    "plan": "plan",
+    "propose": "propose",
+    "evaluator": "plan",
+    "global_plan": "plan",
+    "quick_answer": "plan",
+    "retrieve_code": "code",
+    "calculate_code": "code",
+    "operate_code": "code",
+    "code_revise": "code",
+    "direct_code": "code",
+    "subtask_extraction": "code",
+}
+
+# USD per 1K (prompt, completion) tokens; unknown models are costed at 0
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-35-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+
+
+class RouteProfile:
+    """Measured latency, token, cost and success statistics of one route."""
+
+    def __init__(self, model: str, price=None):
+        self.model = model
+        self.price = price or MODEL_PRICES.get(model, (0.0, 0.0))
+        self.calls = 0
+        self.successes = 0
+        self.latency = 0.0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, usage: Optional[dict], success: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.successes += int(success)
+            self.latency += latency
+            if usage:
+                self.prompt_tokens += usage.get("prompt_tokens") or 0
+                self.cached_tokens += usage.get("cached_tokens") or 0
+                self.completion_tokens += usage.get("completion_tokens") or 0
+
+    @property
+    def cost(self) -> float:
+        return (self.prompt_tokens * self.price[0] + self.completion_tokens * self.price[1]) / 1000
+
+    def summary(self) -> dict:
+        calls = max(self.calls, 1)
+        return {"model": self.model,
+                "calls": self.calls,
+                "success_rate": round(self.successes / calls, 3),
+                "avg_latency_s": round(self.latency / calls, 3),
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_rate": round(self.cached_tokens / max(self.prompt_tokens, 1), 3),
+                "completion_tokens": self.completion_tokens,
+                "cost_usd": round(self.cost, 5)}
+
+
+class RoutedLLM:
+    """Callable like UnifiedLLM; records a profile entry for every call."""
+
+    def __init__(self, model_name: str, profile: RouteProfile, base_url=None, api_key=None):
+        self.model_name = model_name
+        self.profile = profile
+        self.base_url = base_url
+        self.api_key = api_key
+        self._llm = None
+
+    @property
+    def llm(self) -> UnifiedLLM:
+        # clients are created on first use so unused routes need no credentials
+        if self._llm is None:
+            self._llm = UnifiedLLM(self.model_name, base_url=self.base_url, api_key=self.api_key)
+        return self._llm
+
+    def __call__(self, prompt, num_return_sequences=1, return_prob=False, **kwargs):
+        start = time.time()
+        results = self.llm(prompt, num_return_sequences=num_return_sequences,
+                           return_prob=return_prob, **kwargs)
+        success = any(result.strip() != "" for result in results if isinstance(result, str))
+        self.profile.record(time.time() - start, self.llm.last_usage, success)
+        return results
+
+
+class ModelRouter:
+    """
+    Maps each tool/call site to a model and endpoint. A route is either a
+    model name or a dict with "model" and optional "base_url", "api_key" and
+    "price" ([prompt, completion] USD per 1K tokens). Sites without a route
+    fall back to the agent's plan, code or proposer model.
+    """
+
+    def __init__(self, routes: Optional[Dict] = None, plan_model: str = "gpt-3.5-turbo",
+                 code_model: str = "gpt-3.5-turbo", propose_model: str = ""):
+        self.routes = {}
+        for site, route in (routes or {}).items():
+            self.routes[site] = {"model": route} if isinstance(route, str) else dict(route)
+        self.default_models = {"plan": plan_model, "code": code_model or plan_model,
+                               "propose": propose_model or plan_model}
+        self.profiles: Dict[str, RouteProfile] = {}
+        self._llms: Dict[str, RoutedLLM] = {}
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ModelRouter":
+        with open(path, "r") as f:
+            return cls(json.load(f), **kwargs)
+
+    def model_for(self, site: str) -> str:
+        route = self.routes.get(site)
+        if route and route.get("model"):
+            return route["model"]
+        return self.default_models[CALL_SITES.get(site, "plan")]
+
+    def llm(self, site: str) -> RoutedLLM:
+        """Return the callable model of a call site."""
+        if site not in self._llms:
+            route = self.routes.get(site, {})
+            model = self.model_for(site)
+            self.profiles[site] = RouteProfile(model, route.get("price"))
+            self._llms[site] = RoutedLLM(model, self.profiles[site],
+                                         base_url=route.get("base_url"),
+                                         api_key=route.get("api_key"))
+        return self._llms[site]
+
+    def report(self) -> Dict[str, dict]:
+        return {site: profile.summary() for site, profile in self.profiles.items()}
+
+
+# sites of the module level helpers keep their previous model unless routed
+default_router = ModelRouter()
@@ -0,0 +1,101 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import re
+from typing import Callable, List, Optional
+
+from retrieval import count_tokens
+
+STEP_START = re.compile(r"(?m)^(?=(?:Thought|Action|Observation) \d+:)")
+OBSERVATION = re.compile(r"^Observation (\d+):[ \t]*")
+REFERENCE = re.compile(r"(?m)^\[table\b")
+
+
+def table_handle(step: int) -> str:
+    """Name under which the table observed at a step stays available to the code tools."""
+    return f"obs_table_{step}"
+
+
+def table_lines(text: str) -> List[str]:
+    return [line.strip() for line in text.split("\n") if line.strip().startswith("|")]
+
+
+def is_tabular(text: str) -> bool:
+    return len(table_lines(text)) >= 2
+
+
+def table_rows(text: str) -> List[List[str]]:
+    """Rows (header first) of a table rendered by table_linear."""
+    return [[cell.strip() for cell in line.strip("|").split("|")] for line in table_lines(text)]
+
+
+def table_reference(body: str, handle: Optional[str], preview_rows: int = 2) -> str:
+    """Shape, header and first rows of a rendered table, plus its handle."""
+    lines = table_lines(body)
+    header, rows = lines[0], lines[1:]
+    cols = len(table_rows(header)[0])
+    label = f"table {handle}" if handle else "table"
+    shown = rows[:preview_rows]
+    reference = [f"[{label}: {len(rows)} rows x {cols} columns, first {len(shown)} rows shown]",
+                 header] + shown
+    text = [line for line in body.split("\n") if line.strip() and not line.strip().startswith("|")]
+    return "\n".join(text + reference)
+
+
+class ScratchpadCompactor:
+    """
+    Keeps a scratchpad under a token budget. Once the budget is exceeded, the
+    oldest tabular observations are replaced by references (shape, header, a
+    few rows and a handle) until it fits; thoughts, actions, non-tabular
+    observations and the latest keep_recent observations stay verbatim.
+    """
+
+    def __init__(self, max_tokens: int, keep_recent: int = 1, preview_rows: int = 2):
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.preview_rows = preview_rows
+
+    def compact(self, scratchpad: str, handle_for: Callable[[int], Optional[str]] = table_handle) -> str:
+        if count_tokens(scratchpad) <= self.max_tokens:
+            return scratchpad
+        segments = [s for s in STEP_START.split(scratchpad) if s]
+        observations = [i for i, s in enumerate(segments) if OBSERVATION.match(s)]
+        candidates = observations[:-self.keep_recent] if self.keep_recent else observations
+        tokens = count_tokens(scratchpad)
+        for i in candidates:
+            if tokens <= self.max_tokens:
+                break
+            match = OBSERVATION.match(segments[i])
+            body = segments[i][match.end():]
+            if not is_tabular(body) or REFERENCE.search(body):
+                continue
+            step = int(match.group(1))
+            compacted = f"Observation {step}: " + table_reference(
+                body, handle_for(step), self.preview_rows) + "\n"
+            tokens += count_tokens(compacted) - count_tokens(segments[i])
+            segments[i] = compacted
+        return "".join(segments)
@@ -0,0 +1,135 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+import re
+import threading
+from typing import Any, Dict
+
+import pandas as pd
+
+SQL_ENGINES = ("sqlite", "duckdb")
+# statements generated SQL may start with; everything else is rejected
+READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def extract_sql(text: str) -> str:
+    """The SQL query of a model response: its sql code block, else the first SELECT/WITH statement."""
+    block = re.search(r"```(?:sql|SQL)?\s*\n(.*?)```", text, re.DOTALL)
+    if block:
+        text = block.group(1)
+    start = re.search(r"\b(select|with)\b", text, re.IGNORECASE)
+    if start is None:
+        return ""
+    return text[start.start():].split(";")[0].strip()
+
+
+def quote_identifier(name: Any) -> str:
+    name = str(name)
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLBackend:
+    """
+    Embedded SQL engine with the tables of a question registered once.
+    Queries are serialized on one connection and must be read only.
+    """
+
+    def __init__(self, engine: str = "sqlite"):
+        if engine not in SQL_ENGINES:
+            raise ValueError(f"unknown SQL engine '{engine}', expected one of {SQL_ENGINES}")
+        self.engine = engine
+        self.tables: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        if engine == "duckdb":
+            try:
+                import duckdb
+            except ImportError:
+                raise ImportError("the duckdb SQL engine needs the duckdb package: pip install duckdb")
+            self._conn = duckdb.connect()
+        else:
+            import sqlite3
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+
+    def register(self, name: str, df: pd.DataFrame) -> None:
+        """Make a DataFrame queryable as table `name`, replacing an earlier one."""
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        with self._lock:
+            if self.engine == "duckdb":
+                self._conn.register(name, df)
+            else:
+                self._conn.execute("PRAGMA query_only = OFF")
+                df.to_sql(name, self._conn, index=False, if_exists="replace")
+                # WITH ... DELETE passes the statement check, the engine refuses it
+                self._conn.execute("PRAGMA query_only = ON")
+            self.tables[name] = df.columns.tolist()
+
+    def register_parquet(self, name: str, path: str) -> None:
+        """Make a parquet file queryable as table `name`; DuckDB scans it in place."""
+        if self.engine != "duckdb":
+            self.register(name, pd.read_parquet(path, engine="pyarrow"))
+            return
+        with self._lock:
+            escaped = path.replace("'", "''")
+            self._conn.execute(f"CREATE OR REPLACE VIEW {quote_identifier(name)} AS "
+                               f"SELECT * FROM read_parquet('{escaped}')")
+            self.tables[name] = [row[0] for row in self._conn.execute(
+                f"DESCRIBE {quote_identifier(name)}").fetchall()]
+
+    def query(self, sql: str) -> pd.DataFrame:
+        """Run a read-only query; raises ValueError for other statements and the engine's error on failure."""
+        if not READ_ONLY.match(sql or ""):
+            raise ValueError("only SELECT/WITH queries can be executed")
+        with self._lock:
+            if self.engine == "duckdb":
+                return self._conn.execute(sql).df()
+            return pd.read_sql_query(sql, self._conn)
+
+    def schema(self, num_row: int = 3) -> str:
+        """Prompt view of the registered tables: columns, types and first rows."""
+        parts = []
+        for name in self.tables:
+            head = self.query(f"SELECT * FROM {quote_identifier(name)} LIMIT {num_row}")
+            columns = ", ".join(f"{quote_identifier(c)} {dtype}" for c, dtype in head.dtypes.astype(str).items())
+            parts.append(f"Table {quote_identifier(name)} ({columns})\n"
+                         f"First rows: {head.values.tolist()}")
+        return "\n".join(parts)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def register_frames(backend: SQLBackend, namespace: Dict[str, Any]) -> SQLBackend:
+    """Register every DataFrame of a namespace (df, df1, original_df, ...) under its variable name."""
+    for name, value in namespace.items():
+        if isinstance(value, pd.DataFrame):
+            backend.register(name, value)
+    return backend
@@ -0,0 +1,179 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+
+import copy
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from types import ModuleType
+from typing import Any, Dict
+
+import pandas as pd
+
+from code_validation import SchemaValidator
+
+
+_cow_lock = threading.Lock()
+_cow_state = {"users": 0, "saved": None}
+
+
+@contextmanager
+def copy_on_write():
+    """
+    pandas copy-on-write while the block runs: a shallow copy of a cached
+    frame then behaves as an independent copy, its data is only copied when
+    generated code writes to it. The option is process wide, so blocks
+    overlapping in several threads share it and the last one restores it.
+    Without the option (older pandas) the block runs unchanged.
+    """
+    with _cow_lock:
+        if _cow_state["users"] == 0:
+            try:
+                _cow_state["saved"] = pd.get_option("mode.copy_on_write")
+                pd.set_option("mode.copy_on_write", True)
+            except (KeyError, ValueError):
+                _cow_state["saved"] = None
+        _cow_state["users"] += 1
+    try:
+        yield
+    finally:
+        with _cow_lock:
+            _cow_state["users"] -= 1
+            if _cow_state["users"] == 0 and _cow_state["saved"] is not None:
+                pd.set_option("mode.copy_on_write", _cow_state["saved"])
+
+
+def copy_on_write_active() -> bool:
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except (KeyError, ValueError):
+        return False
+
+
+def isolated(value: Any) -> Any:
+    """
+    Copy of a cached namespace value that generated code can mutate without
+    changing the original; shallow inside copy_on_write(), where the code
+    must then run too.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not copy_on_write_active())
+    if isinstance(value, dict) and all(isinstance(column, list) for column in value.values()):
+        # the data dict of table2df holds immutable cells, copying its lists is enough
+        return {name: list(column) for name, column in value.items()}
+    return copy.deepcopy(value)
+
+
+class TableRegistry:
+    """
+    Per-question cache of the tables of an agent. The table2df code of each
+    table is executed once and each DataBench dataset loaded once; every code
+    execution then gets a namespace (df, data, original_df) of copy-on-write
+    copies, so code samples cannot change the cached frames or each other's.
+    Counters report the build cost and the rebuilds avoided.
+    """
+
+    def __init__(self, copy_on_write: bool = True):
+        self.copy_on_write = copy_on_write
+        self._namespaces: Dict[str, Dict[str, Any]] = {}
+        self._datasets: Dict[str, pd.DataFrame] = {}
+        self._validators: Dict[str, SchemaValidator] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+        self.build_time = 0.0
+        self.copy_time = 0.0
+
+    def shared(self, dfcode: str) -> Dict[str, Any]:
+        """The cached variables of table2df code; read only, for executors that copy them anyway."""
+        with self._lock:
+            namespace = self._namespaces.get(dfcode)
+            if namespace is not None:
+                self.hits += 1
+                return namespace
+        start = time.perf_counter()
+        loc = {}
+        exec(dfcode, {"pd": pd}, loc)
+        namespace = {name: value for name, value in loc.items() if not isinstance(value, ModuleType)}
+        with self._lock:
+            self.builds += 1
+            self.build_time += time.perf_counter() - start
+            self._namespaces[dfcode] = namespace
+        return namespace
+
+    def dataset(self, path: str) -> pd.DataFrame:
+        """The DataFrame of a parquet dataset, loaded once per path; read only, isolate it to execute code."""
+        with self._lock:
+            df = self._datasets.get(path)
+            if df is not None:
+                self.hits += 1
+                return df
+        start = time.perf_counter()
+        df = pd.read_parquet(path, engine="pyarrow")
+        with self._lock:
+            self.builds += 1
+            self.build_time += time.perf_counter() - start
+            self._datasets[path] = df
+        return df
+
+    def frame(self, dfcode: str) -> pd.DataFrame:
+        """The cached DataFrame of table2df code; read only, use namespace() to execute code."""
+        return self.shared(dfcode)["df"]
+
+    def validator(self, dfcode: str) -> SchemaValidator:
+        """Column validator for generated code on the tables of table2df code, built once per table."""
+        validator = self._validators.get(dfcode)
+        if validator is None:
+            validator = self._validators[dfcode] = SchemaValidator.from_namespace(self.shared(dfcode))
+        return validator
+
+    def scope(self):
+        """Context to copy namespaces and run generated code in: pandas copy-on-write unless disabled."""
+        return copy_on_write() if self.copy_on_write else nullcontext()
+
+    def namespace(self, dfcode: str) -> Dict[str, Any]:
+        """Variables of table2df code, copied for one execution; shallow copies within scope()."""
+        cached = self.shared(dfcode)
+        start = time.perf_counter()
+        # with pandas copy-on-write a shallow copy is enough, else copy the data
+        namespace = {name: isolated(value) for name, value in cached.items()}
+        self.copy_time += time.perf_counter() - start
+        return namespace
+
+    def stats(self) -> Dict[str, Any]:
+        avg_build = self.build_time / max(self.builds, 1)
+        return {
+            "tables": len(self._namespaces),
+            "datasets": len(self._datasets),
+            "builds": self.builds,
+            "hits": self.hits,
+            "build_s": round(self.build_time, 4),
+            "copy_s": round(self.copy_time, 4),
+            # rebuilds a cache hit avoided, minus what copying cost instead
+            "saved_s": round(self.hits * avg_build - self.copy_time, 4),
+        }
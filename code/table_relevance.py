@@ -0,0 +1,168 @@
+""" Utility classes and functions related to MACT (NAACL 2025).
+
+Copyright (c) 2025 Robert Bosch GmbH
+
+
+This program is free software: you can redistribute it and/or modify
+
+it under the terms of the GNU Affero General Public License as published
+
+by the Free Software Foundation, either version 3 of the License, or
+
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from retrieval import BM25Index, tokenize
+from utils import serialize_table
+
+MAX_ROWS = 20
+MAX_COLS = 8
+
+# question cue -> which end of a numeric column is relevant
+SUPERLATIVES = {"highest": "max", "most": "max", "largest": "max", "maximum": "max", "top": "max",
+                "biggest": "max", "best": "max", "latest": "max", "last": "max",
+                "lowest": "min", "least": "min", "smallest": "min", "minimum": "min",
+                "fewest": "min", "worst": "min", "earliest": "min", "first": "min"}
+RANGE_CUES = [(r"between\s+(-?[\d.,]+)\s+and\s+(-?[\d.,]+)", "between"),
+              (r"(?:more|greater|higher|larger|over|above|after)\s+(?:than\s+)?(-?[\d.,]+)", "gt"),
+              (r"(?:less|fewer|lower|smaller|under|below|before)\s+(?:than\s+)?(-?[\d.,]+)", "lt")]
+
+
+def to_number(cell) -> Optional[float]:
+    text = re.sub(r"[,$%\s]", "", str(cell))
+    match = re.match(r"^\(?(-?\d+(?:\.\d+)?)\)?", text)
+    return float(match.group(1)) if match else None
+
+
+def numeric_ranges(question: str) -> List[Tuple[float, float]]:
+    """Value ranges stated in a question ("more than 10", "between 1990 and 2000", ...)."""
+    ranges = []
+    for pattern, kind in RANGE_CUES:
+        for match in re.finditer(pattern, question.lower()):
+            values = [to_number(v) for v in match.groups()]
+            if any(v is None for v in values):
+                continue
+            if kind == "between":
+                ranges.append((min(values), max(values)))
+            elif kind == "gt":
+                ranges.append((values[0], float("inf")))
+            else:
+                ranges.append((float("-inf"), values[0]))
+    return ranges
+
+
+class TableRelevanceIndex:
+    """
+    Inverted index (BM25) over the rows of a table, with header matching and
+    numeric cues of the question, used to prune a table to the rows and
+    columns a question is about.
+    """
+
+    def __init__(self, table: List[List]):
+        self.header = [str(cell) for cell in table[0]]
+        self.rows = [[str(cell) for cell in row] for row in table[1:]]
+        self.index = BM25Index([" ".join(row) for row in self.rows])
+        self.numbers = [[to_number(cell) for cell in row] for row in self.rows]
+
+    def numeric_columns(self) -> List[int]:
+        columns = []
+        for j in range(len(self.header)):
+            values = [row[j] for row in self.numbers if j < len(row)]
+            if values and sum(v is not None for v in values) / len(values) > 0.5:
+                columns.append(j)
+        return columns
+
+    def column_scores(self, question: str) -> List[float]:
+        terms = set(tokenize(question))
+        scores = []
+        for j, name in enumerate(self.header):
+            name_terms = set(tokenize(name))
+            header_hit = len(name_terms & terms) / max(len(name_terms), 1)
+            cell_hits = sum(1 for row in self.rows if j < len(row) and set(tokenize(row[j])) & terms)
+            scores.append(2 * header_hit + min(cell_hits, 3) / 3)
+        return scores
+
+    def row_scores(self, question: str) -> List[float]:
+        scores = self.index.scores(question)
+        q_numbers = {to_number(n) for n in re.findall(r"-?\d[\d,]*\.?\d*", question)} - {None}
+        ranges = numeric_ranges(question)
+        for i, row in enumerate(self.numbers):
+            values = [v for v in row if v is not None]
+            if q_numbers & set(values):
+                scores[i] += 1.0
+            if ranges and any(low <= v <= high for v in values for low, high in ranges):
+                scores[i] += 0.5
+        # superlatives: the extreme rows of the numeric columns the question names
+        words = set(question.lower().split())
+        ends = {SUPERLATIVES[w] for w in words if w in SUPERLATIVES}
+        if ends and self.rows:
+            column_scores = self.column_scores(question)
+            numeric = self.numeric_columns()
+            named = [j for j in numeric if column_scores[j] > 0] or numeric
+            for j in named:
+                values = [(row[j], i) for i, row in enumerate(self.numbers)
+                          if j < len(row) and row[j] is not None]
+                if not values:
+                    continue
+                for end in ends:
+                    scores[(max if end == "max" else min)(values)[1]] += 1.0
+        return scores
+
+    def prune(self, question: str, max_rows: int = MAX_ROWS, max_cols: int = MAX_COLS) -> Tuple[List[List], str]:
+        """
+        Return the pruned table (header first, original order kept) and a note
+        on what was omitted; the note is empty when nothing was pruned.
+        """
+        n_rows, n_cols = len(self.rows), len(self.header)
+        cols = list(range(n_cols))
+        if n_cols > max_cols:
+            scores = self.column_scores(question)
+            # the first column usually names the row, keep it
+            ranked = sorted(range(1, n_cols), key=lambda j: (-scores[j], j))
+            cols = sorted([0] + ranked[:max_cols - 1])
+        rows = list(range(n_rows))
+        if n_rows > max_rows:
+            scores = self.row_scores(question)
+            ranked = sorted(range(n_rows), key=lambda i: (-scores[i], i))
+            if scores[ranked[0]] <= 0:
+                ranked = rows
+            rows = sorted(ranked[:max_rows])
+        table = [[self.header[j] for j in cols]] + [
+            [self.rows[i][j] if j < len(self.rows[i]) else "" for j in cols] for i in rows]
+        if len(rows) == n_rows and len(cols) == n_cols:
+            return table, ""
+        note = f"[Showing {len(rows)} of {n_rows} rows and {len(cols)} of {n_cols} columns most relevant to the question"
+        omitted = [self.header[j] for j in range(n_cols) if j not in cols]
+        if omitted:
+            note += f"; omitted columns: {', '.join(omitted)}"
+        note += ". Retrieve and Calculate still operate on the full table.]"
+        return table, note
+
+
+def prune_table(table: List[List], question: str, max_rows: int = MAX_ROWS,
+                max_cols: int = MAX_COLS, max_tokens: Optional[int] = None) -> Tuple[str, bool]:
+    """
+    Serialized question-relevant part of a table, and whether anything was
+    pruned or sampled; max_tokens is the serialize_table budget.
+    """
+    note = ""
+    if len(table) - 1 > max_rows or len(table[0]) > max_cols:
+        table, note = TableRelevanceIndex(table).prune(question, max_rows, max_cols)
+    text, name, _ = serialize_table(table, max_tokens)
+    return text + note, bool(note) or name in ("sampled", "summary")
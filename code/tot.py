@@ -37,6 +37,9 @@ from config import llm_config
 vote_prompt_as = '''Given a question, a table, past reasonings and several current intermediate reasoning paths, decide which current reasoning path is the most promising in terms of solving the question. Analyze each path in detail, then conclude in the last line "The best path is {s}", where s the integer id of the path.
 '''
 
+vote_prompt_as_brief = '''Given a question, a table, past reasonings and several current intermediate reasoning paths, decide which current reasoning path is the most promising in terms of solving the question. Compare the paths in at most three sentences, then conclude in the last line "The best path is {s}", where s the integer id of the path.
+'''
+
 vote_prompt_obs = '''Given an instruction, a table and several results generated by following the instruction, decide which result is the most correct. Analyze each result in detail, then conclude in the last line "The best result is {s}", where s the integer id of the result.
 '''
 
@@ -58,13 +61,13 @@ score_prompt = '''Analyze the following passage, then at the last line conclude
 
 # all_input_token, all_output_token = 0, 0
 
-def get_completion(prompt, model="gpt-4-turbo", client=None):
+def get_completion(prompt, model="gpt-4-turbo", client=None, max_tokens=1000):
     """Get completion using unified LLM interface."""
     print(f"using {model}!")
     
     # Use unified LLM approach
     llm = UnifiedLLM(model)
-    response = llm(prompt, num_return_sequences=1, max_tokens=1000, temperature=0.0)
+    response = llm(prompt, num_return_sequences=1, max_tokens=max_tokens, temperature=0.0)
     
     # Simplified token counting
     input_token_num = len(prompt) // 4
@@ -73,16 +76,16 @@ def get_completion(prompt, model="gpt-4-turbo", client=None):
     return response[0] if response else "", input_token_num, output_token_num
 
 
-def llm_reward(reasoning_paths, vote_prompt, model_type="closed", tokenizer=None, model_name="", model=None):
+def llm_reward(reasoning_paths, vote_prompt, model_type="closed", tokenizer=None, model_name="", model=None, max_tokens=2000):
     """Get LLM reward using unified interface."""
     prompt = vote_prompt + reasoning_paths
     
     if model_type == "closed":
-        outputs, input_tokens_num, output_tokens_num = get_completion(prompt)
+        outputs, input_tokens_num, output_tokens_num = get_completion(prompt, max_tokens=max_tokens)
     elif model_type == "open":
         # Use unified LLM for open-source models
-        llm = UnifiedLLM(model_name)
-        outputs = llm(prompt, num_return_sequences=1, return_prob=False)
+        llm = model if model is not None else UnifiedLLM(model_name)
+        outputs = llm(prompt, num_return_sequences=1, return_prob=False, max_tokens=max_tokens)
         outputs = outputs[0] if outputs else ""
         input_tokens_num = len(prompt) // 4
         output_tokens_num = len(outputs) // 4
@@ -30,7 +30,13 @@ import traceback
 import json
 import argparse
 from agents import ReactAgent
-from utils import summarize_react_trial, table2df
+from budget_policy import DifficultyBudgetPolicy, parquet_shape
+from routing import ModelRouter
+from retrieval import load_demo_bank
+from prompt_stats import prompt_tracker
+from sandbox import make_executor
+from exec_cache import execution_cache
+from utils import summarize_react_trial, table2df, OBSERVATION_MAX_ROWS, OBSERVATION_MAX_CHARS
 from utils import get_databench_table
 from config import llm_config
 
@@ -43,11 +49,45 @@ def write_to_file(path, agent, idx, new_table_dataset, given_plan):
         item["pred_answer"] = pred_answer
         item["history"] = agent.scratchpad
         item["pred_answer_all"] = agent.pre_ans_all
+        item["resample_n"] = agent.resample_n
+        item["table_format"] = agent.table_format
+        item["table_tokens"] = agent.table_tokens
+        item["table_cache"] = agent.table_registry.stats()
         # item["code_log"] = agent.generated_code
         # item["plan_log"] = agent.generated_plan
         f.write(json.dumps(item)+"\n")
     return agent
 
+def allocate_budgets(args, table_dataset):
+    # per-question sample counts and step limits; uniform unless --adaptive_budget
+    if not args.adaptive_budget:
+        return [{"plan_sample": args.plan_sample, "code_sample": args.code_sample,
+                 "max_steps": args.max_step, "max_actual_steps": args.max_actual_step}
+                for _ in table_dataset]
+    policy = DifficultyBudgetPolicy(plan_sample=args.plan_sample, code_sample=args.code_sample,
+                                    max_steps=args.max_step, max_actual_steps=args.max_actual_step)
+    items = [{"question": row["question"] if "question" in list(row.keys()) else row["statement"],
+              "tables": [parquet_shape(f"{args.table_dir}/{row['dataset']}/all.parquet")
+                         if args.task == "databench" else row["table_text"]],
+              "context": row["text"] if "text" in list(row.keys()) else ""}
+             for row in table_dataset]
+    return policy.allocate(items)
+
+
+def build_router(args):
+    """One router shared by all agents, so route profiles cover the whole run."""
+    if args.routes:
+        return ModelRouter.from_file(args.routes, plan_model=args.plan_model_name,
+                                     code_model=args.code_model_name, propose_model=args.propose_model_name)
+    return ModelRouter(plan_model=args.plan_model_name, code_model=args.code_model_name,
+                       propose_model=args.propose_model_name)
+
+
+def build_executor(args):
+    """Sandbox worker pool shared by all agents; None executes generated code in process."""
+    return make_executor(args.sandbox_workers, timeout=args.sandbox_timeout,
+                         memory_mb=args.sandbox_memory_mb or None, mode=args.sandbox_mode)
+
 # ===================================================
 
 
@@ -66,10 +106,16 @@ def main(args):
     with open(args.dataset_path, "r") as f:
         table_dataset = [json.loads(line) for line in f]
 
+    budgets = allocate_budgets(args, table_dataset)
+    router = build_router(args)
+    executor = build_executor(args)
+    extra_demos = load_demo_bank(args.demo_bank) if args.demo_bank else None
+    prompt_tracker.log_path = args.prompt_log or None
+
     trial = 0
     agent_cls = ReactAgent
     agents = [agent_cls(question=row["question"] if "question" in list(row.keys()) else row["statement"],
-              table=get_databench_table(args.table_dir, row["dataset"])[
+              table=get_databench_table(args.table_dir, row["dataset"], max_tokens=args.table_max_tokens)[
         0] if args.task == "databench" else row["table_text"],
         table_df=table2df(get_databench_table(args.table_dir, row["dataset"])[
             1]) if args.task == "databench" else table2df(row["table_text"]),
@@ -78,8 +124,8 @@ def main(args):
         context=row["text"] if "text" in list(row.keys()) else "",
         key=row["answer"] if "answer" in list(row.keys()) else "none",
         answer="",
-        max_steps=args.max_step,
-        max_actual_steps=args.max_actual_step,
+        max_steps=budget["max_steps"],
+        max_actual_steps=budget["max_actual_steps"],
         plan_model_name=args.plan_model_name,
         code_model_name=args.code_model_name,
         model=model,  # This can be None with unified approach
@@ -87,15 +133,37 @@ def main(args):
         task=args.task,
         codeagent_endpoint=codeagent_endpoint,
         as_reward=args.as_reward,
-        plan_sample=args.plan_sample,
-        code_sample=args.code_sample,
+        plan_sample=budget["plan_sample"],
+        code_sample=budget["code_sample"],
         use_pre_answer=args.use_pre_answer,
         answer_aggrement=args.answer_aggregate,
         direct_reasoning=args.direct_reasoning,
         long_table_op=args.long_table_op,
         debugging=args.debugging,
         code_as_observation=args.code_as_observation,
-        without_tool=args.without_tool) for _, row in enumerate(table_dataset)]
+        rollout_depth=args.rollout_depth,
+        rollout_budget=args.rollout_budget,
+        rollout_workers=args.rollout_workers,
+        rollout_early_stop=not args.rollout_no_early_stop,
+        propose_model_name=args.propose_model_name,
+        verify_max_tokens=args.verify_max_tokens,
+        min_valid_samples=args.min_valid_samples,
+        max_resample=args.max_resample,
+        resample_max_tokens=args.resample_max_tokens,
+        router=router,
+        fewshot_k=args.fewshot_k,
+        fewshot_max_tokens=args.fewshot_max_tokens,
+        extra_demos=extra_demos,
+        scratchpad_max_tokens=args.scratchpad_max_tokens,
+        table_max_tokens=args.table_max_tokens,
+        context_max_tokens=args.context_max_tokens,
+        code_prompt_table=args.code_prompt_table,
+        executor=executor,
+        code_backend=args.code_backend,
+        observation_max_rows=args.observation_max_rows,
+        observation_max_chars=args.observation_max_chars,
+        observation_max_tokens=args.observation_max_tokens,
+        without_tool=args.without_tool) for row, budget in zip(table_dataset, budgets)]
     if args.debugging:
         agents = agents[0:1]
         for idx, agent in enumerate([a for a in agents]):
@@ -127,6 +195,14 @@ def main(args):
             except Exception as e:
                 print(traceback.format_exc())
                 break
+        with open(output_path.replace(".json", "_routes.json"), "w") as f:
+            json.dump(router.report(), f, indent=2)
+        with open(output_path.replace(".json", "_prompt_tokens.json"), "w") as f:
+            json.dump(prompt_tracker.report(), f, indent=2)
+    print(f"Execution cache: {execution_cache.report()}")
+    if executor is not None:
+        print(f"Sandbox: {executor.stats()}")
+        executor.close()
 
 
 if __name__ == '__main__':
@@ -152,12 +228,66 @@ if __name__ == '__main__':
     parser.add_argument('--as_reward', type=str, default="consistency",
                         choices=["consistency", "llm", "logp", "rollout", "combined"])
     parser.add_argument('--long_table_op', type=str, default="ignore",
-                        choices=["code-agent", "ignore", "short-table"],
-                        help="methods to shorten long table. default passing the whole table.")
+                        choices=["code-agent", "ignore", "short-table", "prune"],
+                        help="methods to shorten long table. default passing the whole table; prune shows the rows and columns relevant to the question.")
     parser.add_argument('--plan_sample', type=int, default=5,
                         help="number of actions sampled from a planning model.")
     parser.add_argument('--code_sample', type=int, default=5,
                         help="numbers of trails for generating codes to address an action.")
+    parser.add_argument('--propose_model_name', type=str, default="",
+                        help="a cheaper model proposing the step candidates; the plan model only picks among them (needs --as_reward llm).")
+    parser.add_argument('--verify_max_tokens', type=int, default=200,
+                        help="output token limit of the plan model when it picks among proposals.")
+    parser.add_argument('--min_valid_samples', type=int, default=1,
+                        help="top up planner samples with a format reminder until this many are parseable.")
+    parser.add_argument('--max_resample', type=int, default=2,
+                        help="maximum top-up requests per step when planner samples cannot be parsed.")
+    parser.add_argument('--resample_max_tokens', type=int, default=300,
+                        help="output token limit of a top-up request.")
+    parser.add_argument('--routes', type=str, default="",
+                        help="json file mapping call sites (plan, evaluator, retrieve_code, calculate_code, ...) to models.")
+    parser.add_argument('--fewshot_k', type=int, default=0,
+                        help="number of demos selected per question by BM25; 0 keeps the full demo set.")
+    parser.add_argument('--fewshot_max_tokens', type=int, default=None,
+                        help="token budget of the selected demos.")
+    parser.add_argument('--demo_bank', type=str, default="",
+                        help="json lines file of extra demos ({\"task\": ..., \"demo\": ...}) added to the index.")
+    parser.add_argument('--scratchpad_max_tokens', type=int, default=None,
+                        help="token budget above which older table observations in the scratchpad are replaced by references.")
+    parser.add_argument('--table_max_tokens', type=int, default=None,
+                        help="token budget of the table in prompts; the serializer picks markdown, csv, column listing, sampled rows or a summary to fit.")
+    parser.add_argument('--context_max_tokens', type=int, default=None,
+                        help="token budget of the context paragraphs (tat); the most relevant ones are kept by BM25, the full context when retrieval is not confident.")
+    parser.add_argument('--code_prompt_table', type=str, default="schema", choices=["schema", "full"],
+                        help="code prompts show the table dtypes and first rows (the code runs on the full df) or every cell.")
+    parser.add_argument('--code_backend', type=str, default="pandas", choices=["pandas", "sqlite", "duckdb"],
+                        help="code model writes pandas code, or SQL run on embedded SQLite/DuckDB (needs duckdb; reads DataBench parquet in place).")
+    parser.add_argument('--observation_max_rows', type=int, default=OBSERVATION_MAX_ROWS,
+                        help="code results with more rows are observed as a summary (shape, column stats, first/last rows); later code gets the full table. 0 disables.")
+    parser.add_argument('--observation_max_chars', type=int, default=OBSERVATION_MAX_CHARS,
+                        help="character cap of a code result observation; 0 disables.")
+    parser.add_argument('--observation_max_tokens', type=int, default=None,
+                        help="token cap of a code result observation.")
+    parser.add_argument('--sandbox_workers', type=int, default=0,
+                        help="worker processes running generated code in parallel with limits; 0 runs it in process.")
+    parser.add_argument('--sandbox_timeout', type=float, default=10.0,
+                        help="wall-clock limit in seconds per generated program in the sandbox.")
+    parser.add_argument('--sandbox_memory_mb', type=int, default=2048,
+                        help="address space limit of each sandbox worker in MB; 0 for no limit.")
+    parser.add_argument('--sandbox_mode', type=str, default="fork", choices=["fork", "pool"],
+                        help="fork: fork each program from a warm server holding the tables (POSIX); pool: long-lived workers.")
+    parser.add_argument('--prompt_log', type=str, default="",
+                        help="json lines file receiving the per-section token counts of every prompt.")
+    parser.add_argument('--adaptive_budget', action='store_true',
+                        help="allocate samples and steps per question by estimated difficulty, keeping the averages above.")
+    parser.add_argument('--rollout_depth', type=int, default=2,
+                        help="steps each candidate action is continued for the rollout reward.")
+    parser.add_argument('--rollout_budget', type=int, default=20,
+                        help="maximum llm calls the rollout reward may spend per step.")
+    parser.add_argument('--rollout_workers', type=int, default=4,
+                        help="number of rollout branches expanded in parallel.")
+    parser.add_argument('--rollout_no_early_stop', action='store_true',
+                        help="keep expanding rollout branches after the answer is decided.")
     parser.add_argument('--use_pre_answer', type=bool, default=True,
                         help="whether use answers from the first iteration as final answers.")
     parser.add_argument('--answer_aggregate', type=float, default=1.,
@@ -169,4 +299,6 @@ if __name__ == '__main__':
     parser.add_argument('--code_as_observation', action='store_true',
                         help="only use code as the final observations or not.")
     args = parser.parse_args()
+    if args.propose_model_name and args.as_reward != "llm":
+        parser.error("--propose_model_name needs --as_reward llm: the plan model picks among the proposals")
     main(args)
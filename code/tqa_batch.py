@@ -24,6 +24,8 @@ from utils import (
     save_results, 
     format_table_for_prompt, 
     create_tqa_prompt,
+    create_packed_tqa_prompt,
+    parse_numbered_answers,
     calculate_metrics,
     print_sample_results
 )
@@ -36,7 +38,8 @@ class TQAProcessor:
                  model_name: str,
                  max_tokens: int = 1000,
                  temperature: float = 0.1,
-                 num_attempts: int = 1):
+                 num_attempts: int = 1,
+                 pack_size: int = 1):
         """
         Initialize TQA processor.
         
@@ -45,12 +48,14 @@ class TQAProcessor:
             max_tokens: Maximum tokens for generation
             temperature: Sampling temperature
             num_attempts: Number of generation attempts per question
+            pack_size: Maximum number of questions about the same table answered by one prompt
         """
         self.model_name = model_name
         self.llm = UnifiedLLM(model_name)
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.num_attempts = num_attempts
+        self.pack_size = pack_size
         
     def _create_prompt_and_metadata(self, item: Dict[str, Any], task_type: str) -> Dict[str, Any]:
         question = item.get("question", item.get("statement", item.get("Question", "")))
@@ -74,7 +79,8 @@ class TQAProcessor:
             question=question, table=formatted_table, context=context, task_type=task_type
         )
         
-        return {"prompt": prompt, "item": item, "formatted_table": formatted_table}
+        return {"prompt": prompt, "item": item, "formatted_table": formatted_table,
+                "question": question, "context": context, "task_type": task_type}
 
     def _process_responses(self, metadata: Dict[str, Any], responses: List[str], processing_time: float) -> Dict[str, Any]:
         """Helper to process LLM responses and format the result."""
@@ -155,6 +161,59 @@ class TQAProcessor:
             
         return batch_results
 
+    def _pack_items(self, items: List[Dict[str, Any]], task_type: str) -> List[List[Dict[str, Any]]]:
+        """Group items sharing table and context into packs of at most pack_size, in dataset order."""
+        groups = {}
+        for item in items:
+            metadata = self._create_prompt_and_metadata(item, task_type)
+            groups.setdefault((metadata["formatted_table"], metadata["context"]), []).append(metadata)
+        return [group[i:i + self.pack_size] for group in groups.values()
+                for i in range(0, len(group), self.pack_size)]
+
+    async def _process_packs(self, packs: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Answer each pack with one prompt holding the table once and numbered questions.
+        The first of the num_attempts responses whose numbered answers parse is used;
+        packs without one are re-asked one question per prompt.
+        """
+        start_time = time.time()
+        prompts = [create_packed_tqa_prompt([m["question"] for m in pack], pack[0]["formatted_table"],
+                                            pack[0]["context"], pack[0]["task_type"])
+                   if len(pack) > 1 else pack[0]["prompt"]
+                   for pack in packs]
+        try:
+            pack_responses = await self.llm.generate_batch(
+                prompts=prompts,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                num_return_sequences=self.num_attempts
+            )
+        except Exception as e:
+            print(f"Error during packed generation: {e}")
+            pack_responses = [[""] * self.num_attempts for _ in packs]
+
+        n_items = sum(len(pack) for pack in packs)
+        processing_time = (time.time() - start_time) / max(n_items, 1)
+        results, unpacked = [], []
+        for pack, responses in zip(packs, pack_responses):
+            if len(pack) == 1:
+                results.append(self._process_responses(pack[0], responses, processing_time))
+                continue
+            parsed = [(r, parse_numbered_answers(r, len(pack))) for r in responses]
+            response, answers = next(((r, a) for r, a in parsed if a is not None), ("", None))
+            if answers is None:
+                unpacked.extend(pack)
+                continue
+            for metadata, answer in zip(pack, answers):
+                result = self._process_responses(metadata, [answer], processing_time)
+                result["raw_response"] = response
+                result["pack_size"] = len(pack)
+                results.append(result)
+
+        if unpacked:
+            results.extend(await self._process_batch([m["item"] for m in unpacked], unpacked[0]["task_type"]))
+        return results
+
     async def process_dataset(self,
                               dataset: List[Dict[str, Any]],
                               task_type: str = "general",
@@ -169,7 +228,17 @@ class TQAProcessor:
         print(f"Parameters: max_tokens={self.max_tokens}, temperature={self.temperature}")
         print("-" * 60)
 
-        if batch_size > 1:
+        if self.pack_size > 1:
+            # Questions about the same table share one prompt; batch_size packs are sent concurrently
+            items = [json.loads(x) if isinstance(x, str) else x for x in dataset]
+            packs = self._pack_items(items, task_type)
+            print(f"Packed {len(dataset)} items into {len(packs)} prompts (pack size <= {self.pack_size})")
+            step = max(batch_size, 1)
+            for i in tqdm(range(0, len(packs), step), desc="Processing packs"):
+                results.extend(await self._process_packs(packs[i:i + step]))
+            order = {id(item): idx for idx, item in enumerate(items)}
+            results.sort(key=lambda r: order.get(id(r["original_item"]), len(order)))
+        elif batch_size > 1:
             # Asynchronous batch processing
             for i in tqdm(range(0, len(dataset), batch_size), desc="Processing batches"):
                 batch_items = dataset[i:i + batch_size]
@@ -219,6 +288,8 @@ async def main():
                        help="Number of generation attempts per question")
     parser.add_argument("--batch_size", type=int, default=1,
                        help="Batch size for processing. If 1, runs synchronously.")
+    parser.add_argument("--pack_size", type=int, default=1,
+                       help="Maximum questions about the same table answered in one prompt. If 1, no packing.")
     
     # Dataset parameters
     parser.add_argument("--dataset_path", type=str, required=True,
@@ -267,7 +338,8 @@ async def main():
         model_name=args.model_name,
         max_tokens=args.max_tokens,
         temperature=args.temperature,
-        num_attempts=args.num_attempts
+        num_attempts=args.num_attempts,
+        pack_size=args.pack_size
     )
     
     # Process dataset
@@ -315,7 +387,8 @@ async def main():
         "parameters": {
             "max_tokens": args.max_tokens,
             "temperature": args.temperature,
-            "num_attempts": args.num_attempts
+            "num_attempts": args.num_attempts,
+            "pack_size": args.pack_size
         }
     }
     
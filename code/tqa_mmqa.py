@@ -20,8 +20,14 @@ import traceback
 import json
 import argparse
 from agents import ReactAgent
-from utils import summarize_react_trial, table2df, table_linear
+from budget_policy import DifficultyBudgetPolicy
+from utils import summarize_react_trial, table2df, table_linear, OBSERVATION_MAX_ROWS, OBSERVATION_MAX_CHARS
 from config import llm_config
+from routing import ModelRouter
+from retrieval import load_demo_bank
+from prompt_stats import prompt_tracker
+from sandbox import make_executor
+from exec_cache import execution_cache
 
 
 def process_mmqa_tables(tables_data):
@@ -95,6 +101,9 @@ def write_to_file(path, agent, idx, dataset_item):
             "table_names": dataset_item.get("table_names", []),
             "answer": dataset_item["answer"],
             "pred_answer": pred_answer,
+            "table_format": agent.table_format,
+            "table_tokens": agent.table_tokens,
+            "table_cache": agent.table_registry.stats(),
             "history": agent.scratchpad,
             "pred_answer_all": agent.pre_ans_all if hasattr(agent, 'pre_ans_all') else []
         }
@@ -105,6 +114,7 @@ def write_to_file(path, agent, idx, dataset_item):
 
 
 def main(args):
+    prompt_tracker.log_path = args.prompt_log or None
     print(f"Loading MMQA dataset from: {args.dataset_path}")
     
     # Load MMQA dataset
@@ -117,11 +127,40 @@ def main(args):
     
     print(f"Loaded {len(dataset)} items from MMQA dataset")
     
+    # Per-question sample counts and step limits
+    if args.adaptive_budget:
+        policy = DifficultyBudgetPolicy(
+            plan_sample=args.plan_sample, code_sample=args.code_sample,
+            max_steps=args.max_step, max_actual_steps=args.max_actual_step)
+        budgets = policy.allocate([
+            {"question": item.get('Question', ''),
+             "tables": [[t['table_columns']] + t['table_content'] for t in item.get('tables', [])],
+             "context": create_mmqa_context(item)}
+            for item in dataset])
+    else:
+        budgets = [{"plan_sample": args.plan_sample, "code_sample": args.code_sample,
+                    "max_steps": args.max_step, "max_actual_steps": args.max_actual_step}
+                   for _ in dataset]
+
+    # One router shared by all agents, so route profiles cover the whole run
+    if args.routes:
+        router = ModelRouter.from_file(args.routes, plan_model=args.plan_model_name,
+                                       code_model=args.code_model_name, propose_model=args.propose_model_name)
+    else:
+        router = ModelRouter(plan_model=args.plan_model_name, code_model=args.code_model_name,
+                             propose_model=args.propose_model_name)
+
+    extra_demos = load_demo_bank(args.demo_bank) if args.demo_bank else None
+
+    # Sandbox worker pool shared by all agents (in-process execution when 0 workers)
+    executor = make_executor(args.sandbox_workers, timeout=args.sandbox_timeout,
+                             memory_mb=args.sandbox_memory_mb or None, mode=args.sandbox_mode)
+
     # Process dataset and create agents
     agents = []
     processed_dataset = []
     
-    for idx, item in enumerate(dataset):
+    for idx, (item, budget) in enumerate(zip(dataset, budgets)):
         try:
             # Process tables
             combined_tables, table_names = process_mmqa_tables(item['tables'])
@@ -147,8 +186,8 @@ def main(args):
                 context=context,
                 key=str(answer),
                 answer="",
-                max_steps=args.max_step,
-                max_actual_steps=args.max_actual_step,
+                max_steps=budget["max_steps"],
+                max_actual_steps=budget["max_actual_steps"],
                 plan_model_name=args.plan_model_name,
                 code_model_name=args.code_model_name,
                 model=None,
@@ -156,14 +195,35 @@ def main(args):
                 task="mmqa",  # New task type
                 codeagent_endpoint=None,
                 as_reward=args.as_reward,
-                plan_sample=args.plan_sample,
-                code_sample=args.code_sample,
+                plan_sample=budget["plan_sample"],
+                code_sample=budget["code_sample"],
                 use_pre_answer=args.use_pre_answer,
                 answer_aggrement=args.answer_aggregate,
                 direct_reasoning=args.direct_reasoning,
                 long_table_op=args.long_table_op,
                 debugging=args.debugging,
                 code_as_observation=args.code_as_observation,
+                rollout_depth=args.rollout_depth,
+                rollout_budget=args.rollout_budget,
+                rollout_workers=args.rollout_workers,
+                rollout_early_stop=not args.rollout_no_early_stop,
+                propose_model_name=args.propose_model_name,
+                verify_max_tokens=args.verify_max_tokens,
+                min_valid_samples=args.min_valid_samples,
+                max_resample=args.max_resample,
+                resample_max_tokens=args.resample_max_tokens,
+                router=router,
+                fewshot_k=args.fewshot_k,
+                fewshot_max_tokens=args.fewshot_max_tokens,
+                extra_demos=extra_demos,
+                scratchpad_max_tokens=args.scratchpad_max_tokens,
+                table_max_tokens=args.table_max_tokens,
+                code_prompt_table=args.code_prompt_table,
+                executor=executor,
+                code_backend=args.code_backend,
+                observation_max_rows=args.observation_max_rows,
+                observation_max_chars=args.observation_max_chars,
+                observation_max_tokens=args.observation_max_tokens,
                 without_tool=args.without_tool
             )
             
@@ -254,6 +314,24 @@ def main(args):
             print(f"Final Accuracy: {final_accuracy:.3f}")
             print(f"Results saved to: {output_path}")
 
+        print(f"\n=== Route Profiles ===")
+        for site, profile in router.report().items():
+            print(f"{site}: {profile}")
+        with open(output_path.replace(".jsonl", "_routes.json"), "w") as f:
+            json.dump(router.report(), f, indent=2)
+
+        print(f"\n=== Prompt Tokens per Section ===")
+        for site, stats in prompt_tracker.report().items():
+            shares = {name: section["share"] for name, section in stats["sections"].items()}
+            print(f"{site}: avg {stats['avg_tokens']} tokens, shares {shares}")
+        with open(output_path.replace(".jsonl", "_prompt_tokens.json"), "w") as f:
+            json.dump(prompt_tracker.report(), f, indent=2)
+
+        print(f"\n=== Execution Cache ===\n{execution_cache.report()}")
+        if executor is not None:
+            print(f"\n=== Sandbox ===\n{executor.stats()}")
+            executor.close()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="MACT framework for MMQA dataset")
@@ -283,6 +361,58 @@ if __name__ == '__main__':
                         help="Number of actions sampled from planning model")
     parser.add_argument('--code_sample', type=int, default=5,
                         help="Number of trials for code generation")
+    parser.add_argument('--propose_model_name', type=str, default="",
+                        help="Cheaper model proposing the step candidates; the plan model only picks among them (needs --as_reward llm)")
+    parser.add_argument('--verify_max_tokens', type=int, default=200,
+                        help="Output token limit of the plan model when it picks among proposals")
+    parser.add_argument('--min_valid_samples', type=int, default=1,
+                        help="Top up planner samples with a format reminder until this many are parseable")
+    parser.add_argument('--max_resample', type=int, default=2,
+                        help="Maximum top-up requests per step when planner samples cannot be parsed")
+    parser.add_argument('--resample_max_tokens', type=int, default=300,
+                        help="Output token limit of a top-up request")
+    parser.add_argument('--routes', type=str, default="",
+                        help="JSON file mapping call sites (plan, evaluator, retrieve_code, calculate_code, ...) to models")
+    parser.add_argument('--fewshot_k', type=int, default=0,
+                        help="Number of demos selected per question by BM25 (0 keeps the full demo set)")
+    parser.add_argument('--fewshot_max_tokens', type=int, default=None,
+                        help="Token budget of the selected demos")
+    parser.add_argument('--demo_bank', type=str, default="",
+                        help="JSON lines file of extra demos added to the index")
+    parser.add_argument('--scratchpad_max_tokens', type=int, default=None,
+                        help="Token budget above which older table observations in the scratchpad are replaced by references")
+    parser.add_argument('--table_max_tokens', type=int, default=None,
+                        help="Token budget of the table in prompts (markdown, csv, column listing, sampled rows or summary)")
+    parser.add_argument('--code_prompt_table', type=str, default="schema", choices=["schema", "full"],
+                        help="Code prompts show the table dtypes and first rows (the code runs on the full df) or every cell")
+    parser.add_argument('--code_backend', type=str, default="pandas", choices=["pandas", "sqlite", "duckdb"],
+                        help="Code model writes pandas code, or SQL run on embedded SQLite/DuckDB (needs duckdb)")
+    parser.add_argument('--observation_max_rows', type=int, default=OBSERVATION_MAX_ROWS,
+                        help="Code results with more rows are observed as a summary; later code gets the full table (0 disables)")
+    parser.add_argument('--observation_max_chars', type=int, default=OBSERVATION_MAX_CHARS,
+                        help="Character cap of a code result observation (0 disables)")
+    parser.add_argument('--observation_max_tokens', type=int, default=None,
+                        help="Token cap of a code result observation")
+    parser.add_argument('--sandbox_workers', type=int, default=0,
+                        help="Worker processes running generated code in parallel with limits (0 runs it in process)")
+    parser.add_argument('--sandbox_timeout', type=float, default=10.0,
+                        help="Wall-clock limit in seconds per generated program in the sandbox")
+    parser.add_argument('--sandbox_memory_mb', type=int, default=2048,
+                        help="Address space limit of each sandbox worker in MB (0 for no limit)")
+    parser.add_argument('--sandbox_mode', type=str, default="fork", choices=["fork", "pool"],
+                        help="fork: fork each program from a warm server holding the tables (POSIX); pool: long-lived workers")
+    parser.add_argument('--prompt_log', type=str, default="",
+                        help="JSON lines file receiving the per-section token counts of every prompt")
+    parser.add_argument('--adaptive_budget', action='store_true',
+                        help="Allocate samples and steps per question by estimated difficulty, keeping the averages")
+    parser.add_argument('--rollout_depth', type=int, default=2,
+                        help="Steps each candidate action is continued for the rollout reward")
+    parser.add_argument('--rollout_budget', type=int, default=20,
+                        help="Maximum LLM calls the rollout reward may spend per step")
+    parser.add_argument('--rollout_workers', type=int, default=4,
+                        help="Number of rollout branches expanded in parallel")
+    parser.add_argument('--rollout_no_early_stop', action='store_true',
+                        help="Keep expanding rollout branches after the answer is decided")
     
     # Answer configuration
     parser.add_argument('--use_pre_answer', type=bool, default=True,
@@ -302,10 +432,12 @@ if __name__ == '__main__':
     
     # Table handling
     parser.add_argument('--long_table_op', type=str, default="ignore",
-                        choices=["code-agent", "ignore", "short-table"],
+                        choices=["code-agent", "ignore", "short-table", "prune"],
                         help="Method to handle long tables")
     
     args = parser.parse_args()
+    if args.propose_model_name and args.as_reward != "llm":
+        parser.error("--propose_model_name needs --as_reward llm: the plan model picks among the proposals")
     
     print("MACT Framework for MMQA Dataset")
     print("=" * 40)
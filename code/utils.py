@@ -25,15 +25,23 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
 
+import csv
+import hashlib
+import io
 import os
 import joblib
 import json
+import numpy as np
 import pandas as pd
 import random
 import tiktoken
 import re
 import string
-from typing import List, Dict, Any, Tuple
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from retrieval import count_tokens
 # random.seed(42)
 
 
@@ -77,6 +85,171 @@ def table_linear(table, num_row):
     return output
 
 
+OBSERVATION_MAX_ROWS = 20
+OBSERVATION_MAX_CHARS = 4000
+
+
+def column_stats(df: pd.DataFrame, max_columns: int = 20) -> str:
+    """One-line statistics of each column: range and mean of numeric ones, distinct values of the others."""
+    stats = []
+    for i, column in enumerate(df.columns[:max_columns]):
+        values = df.iloc[:, i]
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.notna().any() and numeric.notna().sum() == values.notna().sum():
+            stat = f"numeric, min {numeric.min():g}, max {numeric.max():g}, mean {numeric.mean():g}"
+        else:
+            counts = values.dropna().astype(str).value_counts()
+            stat = f"text, {len(counts)} distinct"
+            if len(counts):
+                stat += f", top '{clean_cell(counts.index[0], i, header=False)[:30]}' ({counts.iloc[0]})"
+        missing = int(values.isna().sum())
+        if missing:
+            stat += f", {missing} missing"
+        stats.append(f"{clean_cell(column, i, header=True)} ({stat})")
+    if len(df.columns) > max_columns:
+        stats.append(f"... {len(df.columns) - max_columns} more columns")
+    return "; ".join(stats)
+
+
+def summarize_table(rows: List[List[Any]], head_rows: int = 5, tail_rows: int = 2) -> str:
+    """Compact view of a large result table (header first): shape, column statistics, first and last rows."""
+    header, body = rows[0], rows[1:]
+    df = pd.DataFrame(body, columns=[clean_cell(c, i, header=True) for i, c in enumerate(header)])
+    text = f"[Large result: {len(body)} rows x {len(header)} columns; the full table is kept for the next steps]\n"
+    text += "Columns: " + column_stats(df) + "\n"
+    if len(body) <= head_rows + tail_rows:
+        return text + table_linear(rows, num_row=None)
+    text += table_linear(rows, num_row=head_rows)
+    text += f"| ... {len(body) - head_rows - tail_rows} rows omitted ... |\n"
+    # tail rows without repeating the header line
+    text += table_linear([header] + body[-tail_rows:], num_row=None).split("\n", 1)[1]
+    return text
+
+
+def render_observation(rows: List[List[Any]], max_rows: int = None, max_chars: int = None,
+                       max_tokens: int = None) -> str:
+    """
+    Observation text of a result table (header first). Tables within every cap
+    are rendered in full; larger ones as summarize_table, rendered without
+    linearizing all rows, and clipped to max_chars/max_tokens as a last resort.
+    """
+    if not max_rows or len(rows) - 1 <= max_rows:
+        text = table_linear(rows, num_row=None)
+        if (not max_chars or len(text) <= max_chars) and (not max_tokens or count_tokens(text) <= max_tokens):
+            return text
+    text = summarize_table(rows)
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars] + "\n...[truncated]"
+    if max_tokens and count_tokens(text) > max_tokens:
+        # about 4 characters per token
+        text = text[:4 * max_tokens] + "\n...[truncated]"
+    return text
+
+
+def render_result(value, max_rows=None, max_chars=None, max_tokens=None):
+    """
+    Render the result of generated code as prompt text, in memory. Returns
+    (text, rows) with rows the full table behind the text (header first), []
+    when the value is not tabular. DataFrames and Series over the size caps
+    are shown as a summary (render_observation).
+    """
+    if isinstance(value, str):
+        return value, []
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        if value.empty:
+            return str(value), []
+        rows = value.values.tolist()
+        rows.insert(0, value.columns.tolist())
+        return render_observation(rows, max_rows, max_chars, max_tokens), rows
+    try:
+        # numpy arrays
+        rows = value.tolist()
+        return table_linear(rows, num_row=None), rows
+    except Exception:
+        return str(value), []
+
+
+def result_fingerprint(rows: List[List[Any]], ordered: bool = False) -> str:
+    """
+    Canonical key of a tabular result (header first) for voting.
+
+    Columns are normalized to float when all their values are numeric, else
+    to stripped strings, and rows are hashed with pd.util.hash_pandas_object,
+    so "5", 5 and 5.0 agree. Row and column order are ignored unless ordered.
+    """
+    header = [str(column) for column in rows[0]]
+    df = pd.DataFrame(rows[1:], columns=range(len(header)))
+    normalized = {}
+    for i in df.columns:
+        column = df[i]
+        numeric = pd.to_numeric(column, errors="coerce")
+        if numeric.notna().sum() == column.notna().sum():
+            normalized[i] = numeric.astype(float)
+        else:
+            normalized[i] = column.astype(str).str.strip()
+    order = list(range(len(header))) if ordered else sorted(range(len(header)), key=lambda i: header[i])
+    df = pd.DataFrame({i: normalized[i] for i in order})
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    if not ordered:
+        row_hashes = np.sort(row_hashes)
+    digest = hashlib.sha1("\x1f".join(header[i] for i in order).encode("utf-8"))
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+class ResultVote:
+    """
+    Votes of the code samples of a step, grouped by result_fingerprint: each
+    distinct result is rendered once, and only the winner is turned into
+    DataFrame code for the next step.
+    """
+
+    def __init__(self, ordered: bool = False, render=None):
+        self.ordered = ordered
+        # rows -> observation text of a new result
+        self.render = render or (lambda rows: table_linear(rows, num_row=None))
+        self.samples = 0
+        self._groups: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, rows: List[List[Any]], text: str = None) -> str:
+        """Count one sample's table; returns the text shared by its group (rendered here if not given)."""
+        try:
+            key = result_fingerprint(rows, self.ordered)
+        except Exception:
+            key = repr(rows)
+        group = self._groups.get(key)
+        if group is None:
+            if text is None:
+                text = self.render(rows)
+            group = self._groups[key] = {"rows": rows, "text": text, "count": 0, "first": self.samples}
+        group["count"] += 1
+        self.samples += 1
+        return group["text"]
+
+    def find(self, text: str) -> Tuple[List[List[Any]], int]:
+        """
+        (rows, first sample index) of the result an observation shows: the
+        group with exactly that text, else the only group whose text contains
+        it or is contained in it; None if no group or several match.
+        """
+        for group in self._groups.values():
+            if group["text"] == text:
+                return group["rows"], group["first"]
+        matches = [group for group in self._groups.values() if group["text"] in text or text in group["text"]]
+        if len(matches) != 1:
+            return None
+        return matches[0]["rows"], matches[0]["first"]
+
+    def winner(self) -> Tuple[List[List[Any]], str, int]:
+        """(rows, text, votes) of the most frequent result, the first seen on ties; None without votes."""
+        if not self._groups:
+            return None
+        group = max(self._groups.values(), key=lambda g: g["count"])
+        return group["rows"], group["text"], group["count"]
+
+
 def table2df(table):
     # transform table in list format into df code
     # currently only relational table
@@ -119,6 +292,97 @@ def table2df(table):
     return output
 
 
+def _is_number(cell) -> bool:
+    try:
+        float(str(cell).replace(",", "").replace("$", "").replace("%", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def _table_csv(table) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in table:
+        writer.writerow([clean_cell(cell, i, header=False) for i, cell in enumerate(row)])
+    return buffer.getvalue()
+
+
+def _table_columns(table) -> str:
+    header = table[0]
+    lines = []
+    for j, name in enumerate(header):
+        values = [clean_cell(row[j], j, header=False) for row in table[1:] if j < len(row)]
+        lines.append(f"{clean_cell(name, j, header=True)}: " + " | ".join(values))
+    return "\n".join(lines) + "\n"
+
+
+def _table_sampled(table, max_tokens):
+    # the most evenly spaced rows (first and last included) that fit the budget
+    rows = table[1:]
+
+    def render(k):
+        if k >= len(rows):
+            return table_linear(table, num_row=None)
+        step = (len(rows) - 1) / max(k - 1, 1)
+        picked = [rows[round(i * step)] for i in range(k)] if k > 1 else rows[:1]
+        return table_linear([table[0]] + picked, num_row=None) + \
+            f"[{k} of {len(rows)} rows shown, sampled evenly]\n"
+
+    low, high = 1, len(rows)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(render(mid)) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return render(low)
+
+
+def _table_summary(table) -> str:
+    header, rows = table[0], table[1:]
+    lines = [f"Table with {len(rows)} rows and {len(header)} columns:"]
+    for j, name in enumerate(header):
+        name = clean_cell(name, j, header=True)
+        values = [row[j] for row in rows if j < len(row) and str(row[j]).strip() != ""]
+        numbers = [float(str(v).replace(",", "").replace("$", "").replace("%", ""))
+                   for v in values if _is_number(v)]
+        if values and len(numbers) / len(values) > 0.5:
+            lines.append(f"- {name} (numeric): min {min(numbers):g}, max {max(numbers):g}, "
+                         f"mean {sum(numbers) / len(numbers):.4g}")
+        else:
+            counts = Counter(str(v) for v in values)
+            top = ", ".join(clean_cell(v, j, header=False) for v, _ in counts.most_common(3))
+            lines.append(f"- {name} (text, {len(counts)} distinct): e.g. {top}")
+    return "\n".join(lines) + "\n"
+
+
+def serialize_table(table, max_tokens=None) -> Tuple[str, str, int]:
+    """
+    Serialize a table (header first) in the most faithful format that fits the
+    token budget: markdown, then the cheaper lossless csv or column listing,
+    then evenly sampled rows, then a schema plus statistics summary.
+
+    Returns:
+        (text, format name, token count)
+    """
+    text = table_linear(table, num_row=None)
+    tokens = count_tokens(text)
+    if max_tokens is None or tokens <= max_tokens:
+        return text, "markdown", tokens
+    lossless = [(count_tokens(t), name, t) for name, t in
+                (("csv", _table_csv(table)), ("columns", _table_columns(table)))]
+    tokens, name, text = min(lossless)
+    if tokens <= max_tokens:
+        return text, name, tokens
+    text = _table_sampled(table, max_tokens)
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text, "sampled", tokens
+    text = _table_summary(table)
+    return text, "summary", count_tokens(text)
+
+
 def summarize_react_trial(agents):
     correct = [a for a in agents if a.is_correct()]
     halted = [a for a in agents if a.is_halted()]
@@ -137,6 +401,32 @@ def dfcode2str(dfcode):
     return table_string
 
 
+def df_from_code(dfcode):
+    loc = {}
+    exec(dfcode, {"pd": pd}, loc)
+    return loc["df"]
+
+
+def df_schema(dfcode, num_row=3, df=None):
+    """
+    Prompt view of table2df code: shape, dtypes and the first rows only. The
+    execution layer provides the full table as df, so the prompt does not
+    grow with the table. Tables of at most num_row rows are shown in full.
+    """
+    if df is None:
+        df = df_from_code(dfcode)
+    if len(df) <= num_row:
+        return dfcode
+    dtypes = {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+    head = {str(col): values for col, values in df.head(num_row).to_dict("list").items()}
+    return "\n".join([
+        "import pandas as pd",
+        f"# df is already loaded with all {len(df)} rows and {len(df.columns)} columns; use it as is and do not redefine it.",
+        f"# dtypes: {dtypes}",
+        f"# first {num_row} rows: {head}",
+    ])
+
+
 def parse_action(string):
     string = re.findall(r'Retrieve\[.+?\]', string)+re.findall(r'Operate\[.+?\]', string)+re.findall(
         r'Finish\[.+?\]', string)+re.findall(r'Search\[.+?\]', string)+re.findall(r'Calculate\[.+?\]', string)
@@ -170,7 +460,12 @@ def extract_from_outputs(outputs, num_choices):
     return target_choice
 
 
-def get_databench_table(table_dir, dataset, k=2):
+def _spaced(n, k):
+    # k evenly spaced positions in range(n), first and last included
+    return np.linspace(0, n - 1, min(n, k)).round().astype(int)
+
+
+def get_databench_table(table_dir, dataset, k=2, max_tokens=None):
     df = pd.read_parquet(
         f"{table_dir}/{dataset}/all.parquet", engine='pyarrow')
     df_path = f"{table_dir}/{dataset}/all.parquet"
@@ -179,6 +474,24 @@ def get_databench_table(table_dir, dataset, k=2):
     vals = [val_dict[h][:k] for h in header]
     vals = [[col[i] for col in vals] for i in range(k)]
     vals.insert(0, header)
+    if max_tokens is not None:
+        # estimate the markdown size from evenly spaced sample rows, only a table that fits is rendered whole
+        sample = [header] + df.iloc[_spaced(len(df), 20)].values.tolist()
+        header_tokens = count_tokens(table_linear([header], num_row=None))
+        row_tokens = max(count_tokens(table_linear(sample, num_row=None)) - header_tokens, 1) / max(len(sample) - 1, 1)
+        if header_tokens + row_tokens * len(df) <= max_tokens:
+            table = serialize_table([header] + df.values.tolist(), max_tokens)[0]
+            return table, vals, df_path
+        note = f"[{len(df)} of {len(df)} rows shown, sampled evenly]\n"
+        fit = int((max_tokens - header_tokens - count_tokens(note)) / row_tokens)
+        if fit >= 1:
+            # the rows chosen here, rendered as they are with a single sampling note
+            rows = df.iloc[_spaced(len(df), fit)].values.tolist()
+            table = table_linear([header] + rows, num_row=None) + \
+                f"[{fit} of {len(df)} rows shown, sampled evenly]\n"
+        else:
+            table = f"Table with {len(df)} rows and {len(header)} columns: {column_stats(df)}\n"
+        return table, vals, df_path
     table = table_linear(vals, num_row=None)
     x = len(df) - 3
     table += f"...[remaining {x} rows unshown due to large table size]..."
@@ -346,6 +659,70 @@ Answer:"""
     )
 
 
+PACKED_TQA_INSTRUCTIONS = {
+    "tat": "Given the following table and context, please answer each of the questions accurately "
+           "and independently, based on the information in the table and context.",
+    "mmqa": "You are given a table and several questions. Please analyze the table carefully and answer "
+            "each of the questions independently, based on the information provided.",
+    "wtq": "Given the table below, please answer each of the questions independently, based on the table data.",
+    "scitab": "Given the table below, please answer each of the questions independently, based on the table data.",
+}
+
+
+def create_packed_tqa_prompt(questions: List[str],
+                             table: str,
+                             context: str = "",
+                             task_type: str = "general") -> str:
+    """
+    Create one prompt answering several questions about the same table.
+
+    Args:
+        questions: Questions sharing the table and context
+        table: Formatted table data
+        context: Additional context
+        task_type: Type of task (tat, mmqa, wtq, etc.), selects the instruction as in create_tqa_prompt
+
+    Returns:
+        Formatted prompt string asking for one numbered answer per question
+    """
+    instruction = PACKED_TQA_INSTRUCTIONS.get(
+        task_type.lower(), "Based on the following table, please answer each of the questions independently.")
+    context_section = f"Context: {context}\n\n" if context.strip() or task_type.lower() == "tat" else ""
+    numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+    return f"""{instruction}
+
+{context_section}Table:
+{table}
+
+Questions:
+{numbered}
+
+Reply with exactly one line per question in the form "Answer <number>: <answer>", from Answer 1 to Answer {len(questions)}, without explanations."""
+
+
+def parse_numbered_answers(response: str, n: int) -> Optional[List[str]]:
+    """
+    Parse the "Answer <number>: <answer>" lines of a packed response.
+
+    Returns:
+        The n answers in question order, or None when the numbers are not
+        exactly 1 to n, each once
+    """
+    answers = {}
+    for line in (response or "").split("\n"):
+        match = re.match(r"^\W*answer\s*(\d+)\s*[:.)]\s*(.*\S)", line.strip(), re.IGNORECASE)
+        if not match:
+            continue
+        number = int(match.group(1))
+        if not 1 <= number <= n or number in answers:
+            # answers no longer line up with the questions asked
+            return None
+        answers[number] = match.group(2).strip("* \t")
+    if len(answers) != n:
+        return None
+    return [answers[i] for i in range(1, n + 1)]
+
+
 def normalize_answer(text: str) -> str:
     """Normalize answer for evaluation."""
     def remove_articles(text):
@@ -369,6 +746,104 @@ def exact_match(predicted: str, target: str) -> bool:
     return normalize_answer(predicted) == normalize_answer(target)
 
 
+YES_ANSWERS = {"yes", "true", "support", "supports", "supported", "entailed", "correct"}
+NO_ANSWERS = {"no", "false", "refute", "refutes", "refuted", "incorrect"}
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y",
+                "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y", "%d %B, %Y"]
+MONTH_FORMATS = ["%B %Y", "%b %Y", "%Y-%m"]
+
+
+def _canonical_number(text: str):
+    s = re.sub(r"(?<=[$€£¥(+-])\s+", "", text)
+    negative = s.startswith("(") and s.endswith(")")
+    if negative:
+        s = s[1:-1]
+    s = re.sub(r"^([-+]?)[$€£¥]", r"\1", s).rstrip("%").strip()
+    if not re.fullmatch(r"[-+]?(\d{1,3}(,\d{3})+|\d*)(\.\d+)?", s) or not re.search(r"\d", s):
+        return None
+    value = float(s.replace(",", ""))
+    if negative:
+        value = -value
+    value = round(value, 4)
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.4f}".rstrip("0")
+
+
+def _canonical_date(text: str):
+    if not re.search(r"\d", text):
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    for fmt in MONTH_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m")
+        except ValueError:
+            pass
+    return None
+
+
+def _clean_text(text: str) -> str:
+    return " ".join(text.lower().split()).strip("\"'` ").rstrip(".")
+
+
+def _canonical_atom(text: str) -> str:
+    text = _clean_text(text)
+    if text in YES_ANSWERS:
+        return "yes"
+    if text in NO_ANSWERS:
+        return "no"
+    for parse in (_canonical_number, _canonical_date):
+        value = parse(text)
+        if value is not None:
+            return value
+    return text
+
+
+def canonicalize_answer(answer) -> str:
+    """
+    Map equivalent surface forms of an answer to one voting key, e.g.
+    "$1,200", "1200.0" -> "1200"; "Supports" -> "yes"; "b, a" -> "a, b".
+    """
+    if answer is None:
+        return ""
+    if isinstance(answer, (list, tuple, set)):
+        parts = [str(item) for item in answer]
+    else:
+        text = str(answer).strip()
+        atom = _canonical_atom(text)
+        parts = re.split(r"\s*[;,|]\s*|\s+and\s+", text)
+        if len(parts) == 1 or atom != _clean_text(text):
+            # a single value, or a number/date/boolean that contains separators
+            return atom
+    parts = [_canonical_atom(part) for part in parts]
+    return ", ".join(sorted(part for part in parts if part != ""))
+
+
+def majority_vote(answers: List[Any], key=canonicalize_answer) -> Tuple[str, int]:
+    """
+    Vote over answers grouped by their canonical form.
+
+    Returns:
+        The most frequent original form within the winning group and the
+        group size; ("", 0) if all answers are empty.
+    """
+    groups = {}
+    for answer in answers:
+        canonical = key(answer)
+        if canonical == "":
+            continue
+        groups.setdefault(canonical, []).append(answer)
+    if not groups:
+        return "", 0
+    # max keeps the first group seen on ties
+    winner = max(groups.values(), key=len)
+    return Counter(winner).most_common(1)[0][0], len(winner)
+
+
 def calculate_metrics(results: List[Dict[str, Any]]) -> Dict[str, float]:
     """
     Calculate evaluation metrics.
@@ -22,6 +22,9 @@ from mact_langgraph.utils.mmqa_utils import (
     create_mmqa_config, calculate_mmqa_metrics
 )
 from mact_langgraph.utils.table_utils import exact_match
+from mact_langgraph.utils.routing import route_report
+from mact_langgraph.utils.prompt_stats import prompt_report
+from mact_langgraph.utils.exec_cache import execution_cache_report
 from mact_langgraph.utils.result_utils import (
     generate_result_filename, save_prediction_item,
     calculate_comprehensive_metrics, save_metrics
@@ -118,6 +121,14 @@ async def process_single_item(item: Dict[str, Any], config: Dict[str, Any], grap
         }
 
 
+def load_model_routes(path: str) -> Dict[str, str]:
+    """Read a call site -> model JSON file; no file means every site uses its default."""
+    if not path:
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
 async def main_async(args):
     """Main async execution function with improved storage system."""
     print("MACT LangGraph - MMQA Processing")
@@ -155,7 +166,20 @@ async def main_async(args):
         max_actual_steps=args.max_actual_steps,
         use_pre_answer=args.use_pre_answer,
         answer_threshold=args.answer_threshold,
-        use_examples=use_examples
+        use_examples=use_examples,
+        model_routes=load_model_routes(args.routes),
+        fewshot_k=args.fewshot_k,
+        fewshot_max_tokens=args.fewshot_max_tokens,
+        scratchpad_max_tokens=args.scratchpad_max_tokens,
+        code_prompt_table=args.code_prompt_table,
+        sandbox_workers=args.sandbox_workers,
+        sandbox_timeout=args.sandbox_timeout,
+        sandbox_memory_mb=args.sandbox_memory_mb,
+        sandbox_mode=args.sandbox_mode,
+        code_backend=args.code_backend,
+        observation_max_rows=args.observation_max_rows,
+        observation_max_chars=args.observation_max_chars,
+        observation_max_tokens=args.observation_max_tokens
     )
 
     print(f"Configuration:")
@@ -261,6 +285,10 @@ async def main_async(args):
         }
     })
 
+    config["route_profiles"] = route_report()
+    config["prompt_tokens"] = prompt_report()
+    config["execution_cache"] = execution_cache_report()
+
     # Save comprehensive metrics
     save_metrics(metrics, config, metrics_file)
 
@@ -330,11 +358,40 @@ def main():
     parser.add_argument('--answer_threshold', type=float, default=1.0,
                         help="Answer agreement threshold")
 
+    # Model routing
+    parser.add_argument('--routes', type=str, default="",
+                        help="JSON file mapping call sites (plan, evaluator, retrieve_code, "
+                             "calculate_code, operate_code, subtask_extraction) to models")
+
     # Prompt configuration
     parser.add_argument('--use_examples', action='store_true', default=True,
                         help="Include MMQA REACT examples in prompts (few-shot)")
     parser.add_argument('--no_examples', action='store_true',
                         help="Exclude MMQA REACT examples from prompts (zero-shot)")
+    parser.add_argument('--fewshot_k', type=int, default=0,
+                        help="Number of REACT examples selected per question by BM25 (0 keeps all)")
+    parser.add_argument('--fewshot_max_tokens', type=int, default=None,
+                        help="Token budget of the selected REACT examples")
+    parser.add_argument('--scratchpad_max_tokens', type=int, default=None,
+                        help="Token budget above which older table observations are compacted")
+    parser.add_argument('--code_prompt_table', type=str, default="schema", choices=["schema", "full"],
+                        help="Show code prompts the table schema and sample rows, or every cell")
+    parser.add_argument('--sandbox_workers', type=int, default=0,
+                        help="Worker processes running generated code in parallel with limits (0 runs it in process)")
+    parser.add_argument('--sandbox_timeout', type=float, default=10.0,
+                        help="Wall-clock limit in seconds per generated program in the sandbox")
+    parser.add_argument('--sandbox_memory_mb', type=int, default=2048,
+                        help="Address space limit of each sandbox worker in MB (0 for no limit)")
+    parser.add_argument('--sandbox_mode', type=str, default="fork", choices=["fork", "pool"],
+                        help="fork: fork each program from a warm server holding the tables (POSIX); pool: long-lived workers")
+    parser.add_argument('--code_backend', type=str, default="pandas", choices=["pandas", "sqlite", "duckdb"],
+                        help="Code model writes pandas code, or SQL run on embedded SQLite/DuckDB (needs duckdb)")
+    parser.add_argument('--observation_max_rows', type=int, default=20,
+                        help="Code results with more rows are observed as a summary; later code gets the full table (0 disables)")
+    parser.add_argument('--observation_max_chars', type=int, default=4000,
+                        help="Character cap of a code result observation (0 disables)")
+    parser.add_argument('--observation_max_tokens', type=int, default=None,
+                        help="Token cap of a code result observation")
 
     # Execution options
     parser.add_argument('--debug', action='store_true',
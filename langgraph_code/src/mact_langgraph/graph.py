@@ -24,6 +24,7 @@ from .nodes.tool_nodes import (
     operator_tool_node
 )
 from .nodes.subtask_nodes import subtask_generation_node
+from .nodes.rollout import release_rollout_engine, with_rollout_cache
 
 
 def route_action(state: MACTState) -> Literal["retriever_tool", "calculator_tool", "search_tool", "operator_tool", "answer_aggregator"]:
@@ -93,10 +94,10 @@ def create_mact_graph() -> StateGraph:
     workflow.add_node("input_processor", input_processor_node)
     workflow.add_node("planner", planner_node)
     workflow.add_node("action_selector", action_selector_node)
-    workflow.add_node("retriever_tool", retriever_tool_node)
-    workflow.add_node("calculator_tool", calculator_tool_node)
-    workflow.add_node("search_tool", search_tool_node)
-    workflow.add_node("operator_tool", operator_tool_node)
+    workflow.add_node("retriever_tool", with_rollout_cache(retriever_tool_node))
+    workflow.add_node("calculator_tool", with_rollout_cache(calculator_tool_node))
+    workflow.add_node("search_tool", with_rollout_cache(search_tool_node))
+    workflow.add_node("operator_tool", with_rollout_cache(operator_tool_node))
     workflow.add_node("observer", observer_node)
     workflow.add_node("termination_checker", termination_checker_node)
     workflow.add_node("answer_aggregator", answer_aggregator_node)
@@ -197,6 +198,8 @@ class MACTGraph:
                 "final_answer": "Error occurred during execution"
             }
             return error_state
+        finally:
+            release_rollout_engine(initial_state)
 
     def run_sync(self, initial_state: MACTState) -> MACTState:
         """
@@ -221,6 +224,8 @@ class MACTGraph:
                 "final_answer": "Error occurred during execution"
             }
             return error_state
+        finally:
+            release_rollout_engine(initial_state)
 
     def stream(self, initial_state: MACTState):
         """
@@ -23,7 +23,9 @@ from ..state import (
 )
 from ..utils.prompt_utils import build_react_prompt, build_evaluation_prompt
 from ..utils.action_utils import parse_thought_action, parse_action, extract_from_outputs
-from ..utils.table_utils import normalize_answer, exact_match
+from ..utils.table_utils import normalize_answer, exact_match, majority_vote
+from ..utils.routing import route_model, profile_route, note_usage
+from ..utils.scratchpad import compact_scratchpad, state_table_handle
 
 
 async def generate_plan_batch(llm, prompt: str, n: int, model_name: str = None) -> List[str]:
@@ -71,6 +73,7 @@ async def generate_plan_batch(llm, prompt: str, n: int, model_name: str = None)
                 temperature=0.6,
                 max_tokens=1500
             )
+            note_usage(getattr(response, "usage", None))
 
             print(f"🔍 DEBUG Planning: Response received, type={type(response)}")
             print(f"🔍 DEBUG Planning: Response={response}")
@@ -248,7 +251,8 @@ async def planner_node(state: MACTState) -> MACTState:
     prompt = build_react_prompt(state)
 
     # Initialize LLM
-    llm = create_llm(state["plan_model"])
+    plan_model = route_model(state, "plan")
+    llm = create_llm(plan_model)
 
     # Generate multiple candidate actions using batch API call
     candidates = []
@@ -265,7 +269,9 @@ async def planner_node(state: MACTState) -> MACTState:
 
     try:
         # 🎯 Fix #3: Use batch API for correlated samples (Original MACT style)
-        raw_responses = await generate_plan_batch(llm, prompt, plan_sample, state["plan_model"])
+        with profile_route("plan", plan_model) as record:
+            raw_responses = await generate_plan_batch(llm, prompt, plan_sample, plan_model)
+            record["success"] = any(r.strip() for r in raw_responses if r)
 
         import re
         for i, content in enumerate(raw_responses):
@@ -515,6 +521,11 @@ async def observer_node(state: MACTState) -> MACTState:
     )
 
     updated_scratchpad = state["scratchpad"] + scratchpad_update
+    max_tokens = state.get("scratchpad_max_tokens")
+    if max_tokens:
+        updated_scratchpad = compact_scratchpad(
+            updated_scratchpad, max_tokens, state_table_handle(state["tables"]),
+            keep_recent=state.get("keep_recent_observations", 1))
 
     # Record step in history
     step_record = {
@@ -636,12 +647,11 @@ async def answer_aggregator_node(state: MACTState) -> MACTState:
 
     # If no answer yet, try to aggregate from preliminary answers
     if not final_answer and state["preliminary_answers"]:
-        # Use most frequent answer
-        answer_counts = Counter(state["preliminary_answers"])
-        if answer_counts:
-            most_common = answer_counts.most_common(1)[0]
-            final_answer = most_common[0]
-            confidence_score = most_common[1] / len(state["preliminary_answers"])
+        # Use most frequent answer, counting equivalent forms together
+        most_common, count = majority_vote(state["preliminary_answers"])
+        if count:
+            final_answer = most_common
+            confidence_score = count / len(state["preliminary_answers"])
 
     # If still no answer, try to extract from scratchpad
     if not final_answer and state["scratchpad"]:
@@ -707,9 +717,13 @@ async def _select_by_llm_evaluation(candidates: List[ActionCandidate], state: MA
         context = f"Question: {state['question']}\nReasoning: {state['scratchpad']}"
         prompt = build_evaluation_prompt([c.to_dict() for c in candidates], context)
 
-        # Use planning model for evaluation
-        llm = create_llm(state["plan_model"])
-        response = await llm.ainvoke(prompt)
+        # Use the evaluator route, the planning model by default
+        evaluator_model = route_model(state, "evaluator")
+        llm = create_llm(evaluator_model)
+        with profile_route("evaluator", evaluator_model) as record:
+            response = await llm.ainvoke(prompt)
+            note_usage(getattr(response, "usage_metadata", None))
+            record["success"] = bool(response.content)
 
         # Extract choice
         choice_idx = extract_from_outputs(response.content, len(candidates))
@@ -736,39 +750,19 @@ async def _select_by_rollout(candidates: List[ActionCandidate], state: MACTState
     if not candidates:
         return None
 
-    # 🎯 ROLLOUT: 기존 MACT의 rollout 전략 - 각 후보를 끝까지 시뮬레이션
-    # 복잡한 구현이므로 현재는 간소화된 버전
-    # TODO: 향후 완전한 rollout 구현 필요
-
-    # 현재는 LLM 평가와 consistency를 결합한 방식으로 구현
-    try:
-        # 각 후보의 potential quality를 평가
-        scored_candidates = []
-        for candidate in candidates:
-            # 간단한 휴리스틱: action_type과 argument의 관련성 평가
-            score = 0.0
-
-            # 더 구체적인 argument를 가진 action에 높은 점수
-            if candidate.argument and len(candidate.argument.strip()) > 5:
-                score += 1.0
-
-            # Finish 액션은 마지막에만 선택되도록 낮은 점수
-            if candidate.action_type == ActionType.FINISH:
-                score -= 0.5
-
-            # Retrieve와 Operate는 중간 단계에서 유용
-            if candidate.action_type in [ActionType.RETRIEVE, ActionType.OPERATE]:
-                score += 0.5
-
-            scored_candidates.append((candidate, score))
+    if len({c.action for c in candidates}) == 1:
+        return candidates[0]
 
-        # 가장 높은 점수의 후보 선택
-        best_candidate = max(scored_candidates, key=lambda x: x[1])[0]
-        return best_candidate
+    # Imported here since the rollout engine drives the tool nodes, which import this module
+    from .rollout import get_rollout_engine
 
+    try:
+        selected = await get_rollout_engine(state).select(candidates, state)
     except Exception:
-        # Fallback to consistency
-        return _select_by_consistency(candidates)
+        selected = None
+
+    # Fallback to consistency when no branch reached an answer
+    return selected if selected is not None else _select_by_consistency(candidates)
 
 
 def _select_by_random(candidates: List[ActionCandidate]) -> ActionCandidate:
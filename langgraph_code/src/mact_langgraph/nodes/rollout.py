@@ -0,0 +1,296 @@
+"""
+Rollout reward for MACT LangGraph.
+
+Every distinct candidate action is executed with the real tool nodes and the
+trajectory is continued for a few planning steps. Branches are expanded in
+parallel rounds under a per-step LLM call budget; sampled continuations are
+memoized by scratchpad prefix and tool results by (prefix, action), so
+branches sharing a prefix, and the graph step that later commits the
+selected action, reuse the same calls.
+"""
+
+import asyncio
+import re
+from collections import Counter, OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from ..state import (
+    MACTState, ActionCandidate, ActionType, RewardType,
+    update_state_with_selected_action
+)
+from ..utils.action_utils import parse_thought_action, parse_action
+from ..utils.prompt_utils import build_react_prompt
+from ..utils.table_utils import canonicalize_answer
+from ..utils.routing import route_model, profile_route
+from .core_nodes import create_llm, generate_plan_batch, observer_node
+from .tool_nodes import (
+    retriever_tool_node,
+    calculator_tool_node,
+    search_tool_node,
+    operator_tool_node
+)
+
+
+TOOL_NODES = {
+    ActionType.RETRIEVE: retriever_tool_node,
+    ActionType.CALCULATE: calculator_tool_node,
+    ActionType.SEARCH: search_tool_node,
+    ActionType.OPERATE: operator_tool_node,
+}
+
+# Engines are kept per run so caches survive across graph steps; released when the run ends
+MAX_ENGINES = 32
+_engines: "OrderedDict[str, RolloutEngine]" = OrderedDict()
+
+
+class RolloutBudget:
+    """Counter of the LLM calls a single selection may spend."""
+
+    def __init__(self, max_llm_calls: int):
+        self.max_llm_calls = max_llm_calls
+        self.used = 0
+
+    def spend(self, n: int = 1) -> bool:
+        if self.used + n > self.max_llm_calls:
+            return False
+        self.used += n
+        return True
+
+    @property
+    def exhausted(self) -> bool:
+        return self.used >= self.max_llm_calls
+
+
+class Branch:
+    """One trajectory continued from a candidate action."""
+
+    def __init__(self, candidate: ActionCandidate, state: MACTState):
+        self.candidate = candidate
+        self.state = state
+        self.answer: Optional[str] = None
+        self.steps = 0
+        self.done = False
+
+
+def _tool_delta(before: MACTState, after: MACTState) -> Dict[str, Any]:
+    """Record what a tool node changed: appended list items and replaced values."""
+    delta = {}
+    for key, value in after.items():
+        old = before.get(key)
+        if value is old:
+            continue
+        if isinstance(value, list) and isinstance(old, list) and value[:len(old)] == old:
+            delta[key] = ("append", value[len(old):])
+        elif value != old:
+            delta[key] = ("set", value)
+    return delta
+
+
+def _apply_delta(state: MACTState, delta: Dict[str, Any]) -> MACTState:
+    updated = dict(state)
+    for key, (op, value) in delta.items():
+        if op == "append":
+            updated[key] = list(state.get(key, [])) + list(value)
+        else:
+            updated[key] = value
+    return updated
+
+
+def _finish_answers(candidates: List[ActionCandidate]) -> List[str]:
+    """Finish answers already present anywhere in the sampled responses."""
+    answers = []
+    for candidate in candidates:
+        text = candidate.raw_response or candidate.action
+        match = re.search(r'Finish\[(.+?)\]', text)
+        if match:
+            answers.append(canonicalize_answer(match.group(1)))
+    return answers
+
+
+class RolloutEngine:
+    """Bounded, memoized look-ahead over candidate actions."""
+
+    def __init__(self, depth: int = 2, max_llm_calls: int = 20,
+                 max_workers: int = 4, early_stop: bool = True):
+        self.depth = depth
+        self.max_llm_calls = max_llm_calls
+        self.max_workers = max_workers
+        self.early_stop = early_stop
+        self.plan_cache: Dict[str, str] = {}
+        self.tool_cache: Dict[tuple, Dict[str, Any]] = {}
+        self.budget = RolloutBudget(max_llm_calls)
+        self.history: List[Dict[str, Any]] = []
+
+    def lookup(self, state: MACTState) -> Optional[Dict[str, Any]]:
+        """Return the memoized tool delta of the state's current action, if any."""
+        return self.tool_cache.get((state["scratchpad"], state["current_action"]))
+
+    def _tool_cost(self, action_type: ActionType) -> int:
+        if action_type == ActionType.SEARCH:
+            return 0
+        # code samples are generated in one batched call
+        return 1
+
+    async def _run_tool(self, branch: Branch, candidate: ActionCandidate) -> bool:
+        state = update_state_with_selected_action(branch.state, candidate)
+        key = (state["scratchpad"], state["current_action"])
+        delta = self.tool_cache.get(key)
+        if delta is None:
+            node = TOOL_NODES.get(candidate.action_type)
+            if node is None or not self.budget.spend(self._tool_cost(candidate.action_type)):
+                return False
+            try:
+                after = await node(state)
+            except Exception:
+                return False
+            delta = _tool_delta(state, after)
+            self.tool_cache[key] = delta
+        state = await observer_node(_apply_delta(state, delta))
+        branch.state = {
+            **state,
+            "current_step": state["current_step"] + 1,
+            "actual_step": state["actual_step"] + 1
+        }
+        return True
+
+    async def _sample_next(self, state: MACTState) -> Optional[str]:
+        scratchpad = state["scratchpad"]
+        if scratchpad in self.plan_cache:
+            return self.plan_cache[scratchpad]
+        if not self.budget.spend(1):
+            return None
+        try:
+            plan_model = route_model(state, "plan")
+            llm = create_llm(plan_model)
+            with profile_route("plan", plan_model) as record:
+                responses = await generate_plan_batch(
+                    llm, build_react_prompt(state), 1, plan_model)
+                continuation = responses[0] if responses else ""
+                record["success"] = bool(continuation)
+        except Exception:
+            continuation = ""
+        self.plan_cache[scratchpad] = continuation
+        return continuation
+
+    async def _advance(self, branch: Branch, candidate: ActionCandidate) -> None:
+        branch.steps += 1
+        if candidate.action_type == ActionType.FINISH:
+            branch.answer = canonicalize_answer(candidate.argument)
+            branch.done = True
+        elif branch.state["current_step"] >= branch.state["max_steps"]:
+            branch.done = True
+        elif not await self._run_tool(branch, candidate):
+            branch.done = True
+
+    async def _expand(self, branch: Branch, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            if branch.steps == 0:
+                await self._advance(branch, branch.candidate)
+                return
+            continuation = await self._sample_next(branch.state)
+            if not continuation:
+                branch.done = True
+                return
+            thought, action = parse_thought_action(continuation)
+            action_type, argument = parse_action(action) if action else (None, None)
+            try:
+                action_type = ActionType(action_type)
+            except ValueError:
+                branch.done = True
+                return
+            await self._advance(branch, ActionCandidate(
+                thought=thought, action=action, action_type=action_type,
+                argument=argument, raw_response=continuation))
+
+    def _dominated(self, branches: List[Branch], prior_answers: List[str]) -> bool:
+        votes = Counter(prior_answers)
+        votes.update(b.answer for b in branches if b.answer)
+        ranked = votes.most_common(2)
+        if not ranked:
+            return False
+        unfinished = sum(1 for b in branches if not b.done)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        return ranked[0][1] > runner_up + unfinished
+
+    async def select(self, candidates: List[ActionCandidate], state: MACTState) -> Optional[ActionCandidate]:
+        """
+        Select the candidate whose rollout agrees most with the majority answer.
+
+        Args:
+            candidates: Candidate actions of the current step
+            state: Current MACT state
+
+        Returns:
+            Selected candidate, or None if no branch reached an answer
+        """
+        self.budget = RolloutBudget(self.max_llm_calls)
+        prior_answers = _finish_answers(candidates)
+
+        distinct = OrderedDict()
+        for candidate in candidates:
+            distinct.setdefault(candidate.action, candidate)
+        branches = [Branch(candidate, state) for candidate in distinct.values()]
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+        for _ in range(self.depth + 1):
+            active = [b for b in branches if not b.done]
+            if not active or self.budget.exhausted:
+                break
+            await asyncio.gather(*(self._expand(b, semaphore) for b in active))
+            if self.early_stop and self._dominated(branches, prior_answers):
+                break
+
+        votes = Counter(prior_answers)
+        votes.update(b.answer for b in branches if b.answer)
+        self.history.append({
+            "step": state["current_step"],
+            "llm_calls": self.budget.used,
+            "answers": [b.answer for b in branches]
+        })
+        answered = [b for b in branches if b.answer]
+        if not answered:
+            return None
+        # most votes, then fewest steps; the first candidate on ties
+        return max(answered, key=lambda b: (votes[b.answer], -b.steps)).candidate
+
+
+def _engine_key(state: MACTState) -> str:
+    return state.get("run_id") or state["question"]
+
+
+def get_rollout_engine(state: MACTState) -> RolloutEngine:
+    """Return the engine of the state's run, creating it on first use."""
+    key = _engine_key(state)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = RolloutEngine(
+            depth=state.get("rollout_depth", 2),
+            max_llm_calls=state.get("rollout_budget", 20),
+            max_workers=state.get("rollout_workers", 4),
+            early_stop=state.get("rollout_early_stop", True)
+        )
+        _engines[key] = engine
+        while len(_engines) > MAX_ENGINES:
+            _engines.popitem(last=False)
+    else:
+        _engines.move_to_end(key)
+    return engine
+
+
+def release_rollout_engine(state: MACTState) -> None:
+    """Drop the engine (and its caches) of a finished run."""
+    _engines.pop(_engine_key(state), None)
+
+
+def with_rollout_cache(tool_node: Callable) -> Callable:
+    """Wrap a tool node so an action already executed by a rollout is not run twice."""
+    @wraps(tool_node)
+    async def wrapper(state: MACTState) -> MACTState:
+        if state.get("reward_type") == RewardType.ROLLOUT.value:
+            engine = _engines.get(_engine_key(state))
+            delta = engine.lookup(state) if engine is not None else None
+            if delta is not None:
+                return _apply_delta(state, delta)
+        return await tool_node(state)
+    return wrapper
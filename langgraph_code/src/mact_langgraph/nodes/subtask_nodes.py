@@ -13,6 +13,7 @@ import logging
 from openai import AsyncOpenAI
 
 from ..state import MACTState
+from ..utils.routing import route_model
 from ..utils.subtask_extraction import (
     extract_sql_from_history,
     extract_foreign_keys_from_history,
@@ -42,8 +43,7 @@ async def subtask_generation_node(state: MACTState) -> MACTState:
     logger.info("=== Subtask Generation Node ===")
 
     # Get configuration
-    config = state.get('config', {})
-    code_model = config.get('code_model', 'gpt-3.5-turbo')
+    code_model = route_model(state, "subtask_extraction")
 
     # Create OpenAI client
     openai_client = AsyncOpenAI()
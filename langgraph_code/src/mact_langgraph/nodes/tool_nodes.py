@@ -11,7 +11,6 @@ These nodes handle specific tool operations:
 import re
 import asyncio
 from typing import List, Dict, Any, Union
-from collections import Counter
 from langchain_openai import ChatOpenAI
 from langchain_community.tools import WikipediaQueryRun
 from langchain_community.utilities import WikipediaAPIWrapper
@@ -19,9 +18,13 @@ from langchain_community.utilities import WikipediaAPIWrapper
 from ..state import MACTState, TableInfo, ActionType, get_tables_from_state
 from .core_nodes import create_llm
 from ..utils.table_utils import (
-    table_linear, table2df, execute_table_code, extract_code_from_response
+    table_linear, table2df, execute_table_code, extract_code_from_response, schema_code,
+    canonicalize_answer, majority_vote, ResultVote, OBSERVATION_MAX_ROWS, OBSERVATION_MAX_CHARS
 )
-from ..utils.prompt_utils import build_code_generation_prompt
+from ..utils.prompt_utils import build_code_generation_prompt, build_sql_generation_prompt
+from ..utils.routing import route_model, profile_route, note_usage
+from ..utils.sandbox import get_code_executor
+from ..utils.sql_backend import execute_table_sql, table_backend
 
 
 async def generate_code_batch(llm, prompt: str, n: int, model_name: str = None) -> List[str]:
@@ -74,6 +77,7 @@ async def generate_code_batch(llm, prompt: str, n: int, model_name: str = None)
                 temperature=0.6,
                 max_tokens=2000
             )
+            note_usage(getattr(response, "usage", None))
 
             print(f"🔍 DEBUG: Response received, type={type(response)}")
             print(f"🔍 DEBUG: Has choices={hasattr(response, 'choices')}")
@@ -195,13 +199,20 @@ async def retriever_tool_node(state: MACTState) -> MACTState:
         }
 
     try:
-        llm = create_llm(state["code_model"])
+        code_model = route_model(state, "retrieve_code")
+        llm = create_llm(code_model)
         # 🎯 Phase 3-B Fix: Improved Retrieve prompt with better instructions
-        prompt = build_code_generation_prompt(
-            f"Retrieve and show data from table: {instruction}",
-            table_df_code,
-            model_name=state.get("code_model"),
-            examples=f"""
+        engine = _sql_engine(state)
+        if engine:
+            prompt = build_sql_generation_prompt(
+                f"Retrieve and show data from table: {instruction}",
+                table_backend(table_df_code, engine).schema())
+        else:
+            prompt = build_code_generation_prompt(
+                f"Retrieve and show data from table: {instruction}",
+                _prompt_table_code(state, table_df_code),
+                model_name=code_model,
+                examples=f"""
 # IMPORTANT: Always assign final result to 'new_table' variable
 # For "Show X data" or "Display X" - show the full relevant data
 # For "Get X where Y" - filter the data based on condition Y
@@ -215,36 +226,26 @@ async def retriever_tool_node(state: MACTState) -> MACTState:
 # Current instruction: {instruction}
 new_table = df  # Replace with appropriate logic
 """
-        )
+            )
 
         # 🎯 Fix #1: Use batch API for correlated samples (Original MACT style)
-        codes = await generate_code_batch(llm, prompt, code_sample, state.get("code_model"))
+        with profile_route("retrieve_code", code_model) as record:
+            codes = await generate_code_batch(llm, prompt, code_sample, code_model)
+            record["success"] = any(code.strip() for code in codes if code)
 
         # 🎯 Phase 2-A: 기존 MACT처럼 모든 코드를 실행하고 다수결로 선택
         successful_results = []
-        successful_table_infos = []
 
+        executions = await _execute_codes(state, codes, table_df_code, code_model, "retrieve")
+        # samples returning the same rows in the same order (up to dtypes) share one vote key and text;
+        # the order of retrieved rows matters, e.g. for the top n of a ranking
+        vote = ResultVote(ordered=True)
         for i, code in enumerate(codes):
             try:
-                result, rows, error, _ = execute_table_code(
-                    code,
-                    table_df_code,
-                    model_name=state.get("code_model")
-                )
+                result, rows, error, _ = executions[i]
                 if result and rows and not error:
                     # 성공한 결과만 수집
-                    successful_results.append(result)
-                    successful_table_infos.append({
-                        'result': result,
-                        'rows': rows,
-                        'table_info': TableInfo(
-                            name=f"retrieved_step_{state['current_step']}_attempt_{i}",
-                            columns=rows[0],
-                            content=rows[1:],
-                            df_code=table2df(rows),
-                            linear_representation=table_linear(rows, num_row=None)
-                        )
-                    })
+                    successful_results.append(vote.add(rows, result))
                     results.append(result)  # 전체 결과에도 추가
                 else:
                     # 실패한 경우도 로깅
@@ -273,18 +274,23 @@ new_table = df  # Replace with appropriate logic
                     state = {**state, "execution_log": state["execution_log"] + [debug_msg]}
 
             # Majority voting on combined observations
-            result_counts = Counter(new_ob)
-            best_observation = result_counts.most_common(1)[0][0]
-            best_count = result_counts.most_common(1)[0][1]
+            best_observation, best_count = majority_vote(new_ob, key=_observation_key)
 
             # Extract result from observation format
             best_result = best_observation.replace(f"Observation {state['current_step']}: ", "")
 
             # 선택된 결과에 해당하는 TableInfo 찾기
-            for item in successful_table_infos:
-                if item['result'] in best_result or best_result in item['result']:
-                    new_table_info = item['table_info']
-                    break
+            # only the chosen table is turned into DataFrame code
+            chosen = vote.find(best_result)
+            if chosen is not None:
+                rows, first = chosen
+                new_table_info = TableInfo(
+                    name=f"retrieved_step_{state['current_step']}_attempt_{first}",
+                    columns=rows[0],
+                    content=rows[1:],
+                    df_code=table2df(rows),
+                    linear_representation=table_linear(rows, num_row=None)
+                )
 
             # 다수결 정보 로깅
             success_rate = len(successful_results) / len(codes) * 100
@@ -293,7 +299,7 @@ new_table = df  # Replace with appropriate logic
 
         elif results:
             # 성공한 것이 없다면 기존 방식 폴백
-            best_result = Counter(results).most_common(1)[0][0]
+            best_result = majority_vote(results)[0]
         else:
             best_result = f"Unable to retrieve data for: {instruction} (all {len(codes)} attempts failed)"
 
@@ -390,7 +396,8 @@ async def operator_tool_node(state: MACTState) -> MACTState:
     print(f"DEBUG: {debug_log}")
 
     try:
-        llm = create_llm(state["code_model"])
+        code_model = route_model(state, "operate_code")
+        llm = create_llm(code_model)
         df_setup_code = _build_multi_table_df_code(tables)
 
         if not df_setup_code.strip():
@@ -409,11 +416,17 @@ async def operator_tool_node(state: MACTState) -> MACTState:
             fk_hints += "# All column names are normalized to lowercase (e.g., 'department_id', 'host_city_id')\n"
 
         # 🎯 Bug Fix #1: Enhanced prompt with FK hints and normalized column guidance
-        prompt = build_code_generation_prompt(
-            f"Perform table operation: {operation}",
-            df_setup_code,
-            model_name=state.get("code_model"),
-            examples=f"""
+        engine = _sql_engine(state)
+        if engine:
+            prompt = build_sql_generation_prompt(
+                f"Perform table operation: {operation}",
+                table_backend(df_setup_code, engine).schema(), examples=fk_hints)
+        else:
+            prompt = build_code_generation_prompt(
+                f"Perform table operation: {operation}",
+                _prompt_table_code(state, df_setup_code),
+                model_name=code_model,
+                examples=f"""
 # IMPORTANT: Always assign final result to 'new_table' variable
 # Available tables: df1, df2, df3, etc. and primary df
 {fk_hints}
@@ -429,36 +442,25 @@ async def operator_tool_node(state: MACTState) -> MACTState:
 # Current operation: {operation}
 new_table = df  # Replace with appropriate operation
 """
-        )
+            )
 
         # 🎯 Fix #1: Use batch API for correlated samples (Original MACT style)
-        codes = await generate_code_batch(llm, prompt, code_sample, state.get("code_model"))
+        with profile_route("operate_code", code_model) as record:
+            codes = await generate_code_batch(llm, prompt, code_sample, code_model)
+            record["success"] = any(code.strip() for code in codes if code)
 
         # 🎯 Phase 2-A: 기존 MACT처럼 모든 코드를 실행하고 다수결로 선택
         successful_results = []
-        successful_table_infos = []
 
+        executions = await _execute_codes(state, codes, df_setup_code, code_model, "operate")
+        # samples returning the same table (up to row order and dtypes) share one vote key and text
+        vote = ResultVote()
         for i, code in enumerate(codes):
             try:
-                result, rows, error, _ = execute_table_code(
-                    code,
-                    df_setup_code,
-                    model_name=state.get("code_model")
-                )
+                result, rows, error, _ = executions[i]
                 if result and rows and not error:
                     # 성공한 결과만 수집
-                    successful_results.append(result)
-                    successful_table_infos.append({
-                        'result': result,
-                        'rows': rows,
-                        'table_info': TableInfo(
-                            name=f"operated_step_{state['current_step']}_attempt_{i}",
-                            columns=rows[0],
-                            content=rows[1:],
-                            df_code=table2df(rows),
-                            linear_representation=table_linear(rows, num_row=None)
-                        )
-                    })
+                    successful_results.append(vote.add(rows, result))
                     results.append(result)  # 전체 결과에도 추가
                 else:
                     # 실패한 경우도 로깅
@@ -487,18 +489,23 @@ new_table = df  # Replace with appropriate operation
                     state = {**state, "execution_log": state["execution_log"] + [debug_msg]}
 
             # Majority voting on combined observations
-            result_counts = Counter(new_ob)
-            best_observation = result_counts.most_common(1)[0][0]
-            best_count = result_counts.most_common(1)[0][1]
+            best_observation, best_count = majority_vote(new_ob, key=_observation_key)
 
             # Extract result from observation format
             best_result = best_observation.replace(f"Observation {state['current_step']}: ", "")
 
             # 선택된 결과에 해당하는 TableInfo 찾기
-            for item in successful_table_infos:
-                if item['result'] in best_result or best_result in item['result']:
-                    new_table_info = item['table_info']
-                    break
+            # only the chosen table is turned into DataFrame code
+            chosen = vote.find(best_result)
+            if chosen is not None:
+                rows, first = chosen
+                new_table_info = TableInfo(
+                    name=f"operated_step_{state['current_step']}_attempt_{first}",
+                    columns=rows[0],
+                    content=rows[1:],
+                    df_code=table2df(rows),
+                    linear_representation=table_linear(rows, num_row=None)
+                )
 
             # 다수결 정보 로깅
             success_rate = len(successful_results) / len(codes) * 100
@@ -507,7 +514,7 @@ new_table = df  # Replace with appropriate operation
 
         elif results:
             # 성공한 것이 없다면 기존 방식 폴백
-            best_result = Counter(results).most_common(1)[0][0]
+            best_result = majority_vote(results)[0]
         else:
             best_result = f"Unable to perform operation: {operation} (all {len(codes)} attempts failed)"
 
@@ -530,7 +537,8 @@ new_table = df  # Replace with appropriate operation
 async def _calculate_with_code_generation(expression: str, state: MACTState) -> str:
     """Generate code to perform calculation."""
     try:
-        llm = create_llm(state["code_model"])
+        code_model = route_model(state, "calculate_code")
+        llm = create_llm(code_model)
         prompt = f"""Calculate the following expression and return only the result:
 {expression}
 
@@ -539,8 +547,11 @@ Provide Python code to calculate this:
 result = {expression}
 print(result)
 ```"""
-        response = await llm.ainvoke(prompt)
-        code = extract_code_from_response(response.content, state.get("code_model"))
+        with profile_route("calculate_code", code_model) as record:
+            response = await llm.ainvoke(prompt)
+            note_usage(getattr(response, "usage_metadata", None))
+            record["success"] = bool(response.content)
+        code = extract_code_from_response(response.content, code_model)
         if code:
             local_vars = {}
             exec(code, {"__builtins__": {}}, local_vars)
@@ -551,6 +562,43 @@ print(result)
         return f"Calculation error: {str(e)}"
 
 
+async def _execute_codes(state: MACTState, codes: List[str], table_df_code: str,
+                         model_name: str, tool: str) -> List[tuple]:
+    """Execute the code samples of a step; in parallel sandbox workers when configured."""
+    engine = _sql_engine(state)
+    limits = _observation_limits(state)
+    if engine:
+        return [execute_table_sql(code, table_df_code, engine, tool=tool, limits=limits) for code in codes]
+    executor = get_code_executor(state)
+    if executor is None:
+        return [execute_table_code(code, table_df_code, model_name=model_name, tool=tool, limits=limits)
+                for code in codes]
+    return await asyncio.gather(*(
+        asyncio.to_thread(execute_table_code, code, table_df_code, model_name=model_name,
+                          executor=executor, tool=tool, limits=limits)
+        for code in codes))
+
+
+def _observation_limits(state: MACTState) -> tuple:
+    """(max_rows, max_chars, max_tokens) caps of code result observations."""
+    return (state.get("observation_max_rows", OBSERVATION_MAX_ROWS),
+            state.get("observation_max_chars", OBSERVATION_MAX_CHARS),
+            state.get("observation_max_tokens"))
+
+
+def _sql_engine(state: MACTState) -> str:
+    """SQL engine the code model writes queries for; "" when it writes pandas code."""
+    backend = state.get("code_backend", "pandas")
+    return "" if backend == "pandas" else backend
+
+
+def _prompt_table_code(state: MACTState, df_code: str) -> str:
+    """Table part of a code prompt: schema and sample rows unless full code prompts are configured."""
+    if state.get("code_prompt_table", "schema") == "schema":
+        return schema_code(df_code)
+    return df_code
+
+
 def _build_multi_table_df_code(tables: List[TableInfo]) -> str:
     """
     Build DataFrame setup code for multiple tables (Phase 2C Step 1: 원본 MACT 방식).
@@ -596,6 +644,11 @@ def _build_multi_table_df_code(tables: List[TableInfo]) -> str:
     return result
 
 
+def _observation_key(observation: str) -> str:
+    """Voting key of an observation: the canonical observed value without its step prefix."""
+    return canonicalize_answer(re.sub(r"^Observation \d+:\s*", "", observation))
+
+
 def _clean_equation(equation: str) -> str:
     """Clean equation for calculation."""
     equation = equation.replace(",", "")
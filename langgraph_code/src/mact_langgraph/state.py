@@ -9,6 +9,7 @@ from typing import TypedDict, List, Dict, Any, Optional, Union
 from dataclasses import dataclass, field
 from enum import Enum
 import json
+import uuid
 
 
 class ActionType(Enum):
@@ -108,6 +109,7 @@ class MACTState(TypedDict):
     foreign_keys: List[str]
     primary_keys: List[str]
     context: str
+    run_id: str  # identifies one run of the graph, e.g. for per-run caches
 
     # Configuration
     plan_model: str
@@ -122,6 +124,24 @@ class MACTState(TypedDict):
     long_table_op: str
     code_as_observation: bool
     without_tool: bool
+    rollout_depth: int
+    rollout_budget: int
+    rollout_workers: int
+    rollout_early_stop: bool
+    model_routes: Dict[str, str]  # call site -> model, see utils/routing.py
+    fewshot_k: int  # ReAct examples selected per question, 0 keeps all
+    fewshot_max_tokens: Optional[int]
+    scratchpad_max_tokens: Optional[int]  # compact older table observations above this
+    keep_recent_observations: int
+    code_prompt_table: str  # "schema": code prompts show dtypes and sample rows, "full": all cells
+    sandbox_workers: int  # worker processes executing generated code, 0 runs it in process
+    sandbox_timeout: float
+    sandbox_memory_mb: int
+    sandbox_mode: str  # "fork" (warm fork server) or "pool"
+    code_backend: str  # "pandas", or "sqlite"/"duckdb" for SQL retrieve/operate code
+    observation_max_rows: int  # larger code results are observed as a summary
+    observation_max_chars: int
+    observation_max_tokens: Optional[int]
 
     # Reasoning state
     current_step: int
@@ -228,6 +248,7 @@ def create_initial_state(
         foreign_keys=foreign_keys or [],
         primary_keys=primary_keys or [],
         context=context,
+        run_id=uuid.uuid4().hex,
 
         # Configuration
         plan_model=config.get("plan_model", "gpt-3.5-turbo"),
@@ -242,6 +263,24 @@ def create_initial_state(
         long_table_op=config.get("long_table_op", "ignore"),
         code_as_observation=config.get("code_as_observation", False),
         without_tool=config.get("without_tool", False),
+        rollout_depth=config.get("rollout_depth", 2),
+        rollout_budget=config.get("rollout_budget", 20),
+        rollout_workers=config.get("rollout_workers", 4),
+        rollout_early_stop=config.get("rollout_early_stop", True),
+        model_routes=dict(config.get("model_routes") or {}),
+        fewshot_k=config.get("fewshot_k", 0),
+        fewshot_max_tokens=config.get("fewshot_max_tokens"),
+        scratchpad_max_tokens=config.get("scratchpad_max_tokens"),
+        keep_recent_observations=config.get("keep_recent_observations", 1),
+        code_prompt_table=config.get("code_prompt_table", "schema"),
+        sandbox_workers=config.get("sandbox_workers", 0),
+        sandbox_timeout=config.get("sandbox_timeout", 10.0),
+        sandbox_memory_mb=config.get("sandbox_memory_mb", 2048),
+        sandbox_mode=config.get("sandbox_mode", "fork"),
+        code_backend=config.get("code_backend", "pandas"),
+        observation_max_rows=config.get("observation_max_rows", 20),
+        observation_max_chars=config.get("observation_max_chars", 4000),
+        observation_max_tokens=config.get("observation_max_tokens"),
 
         # Reasoning state
         current_step=1,
@@ -2,16 +2,28 @@
 Utility modules for MACT LangGraph implementation.
 """
 
-from .table_utils import table2df, table_linear, normalize_answer, exact_match
+from .table_utils import (
+    table2df, table_linear, normalize_answer, exact_match,
+    canonicalize_answer, majority_vote, render_result, render_observation
+)
 from .action_utils import parse_action, parse_thought_action, extract_from_outputs
 from .prompt_utils import build_react_prompt, build_multi_table_prompt
 from .mmqa_utils import process_mmqa_tables, create_mmqa_context, combine_tables_for_qa
+from .routing import route_model, profile_route, note_usage, route_report, reset_route_profiles
+from .retrieval import count_tokens, BM25Index
+from .prompt_stats import record_prompt, prompt_report, reset_prompt_stats
+from .exec_cache import canonical_code, execution_cache_report
+from .sql_backend import SQLBackend, execute_table_sql
 
 __all__ = [
     "table2df",
     "table_linear",
     "normalize_answer",
     "exact_match",
+    "canonicalize_answer",
+    "majority_vote",
+    "render_result",
+    "render_observation",
     "parse_action",
     "parse_thought_action",
     "extract_from_outputs",
@@ -19,5 +31,19 @@ __all__ = [
     "build_multi_table_prompt",
     "process_mmqa_tables",
     "create_mmqa_context",
-    "combine_tables_for_qa"
+    "combine_tables_for_qa",
+    "route_model",
+    "profile_route",
+    "note_usage",
+    "route_report",
+    "reset_route_profiles",
+    "count_tokens",
+    "BM25Index",
+    "record_prompt",
+    "prompt_report",
+    "reset_prompt_stats",
+    "canonical_code",
+    "execution_cache_report",
+    "SQLBackend",
+    "execute_table_sql"
 ]
\ No newline at end of file
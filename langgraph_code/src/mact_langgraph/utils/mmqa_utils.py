@@ -185,6 +185,33 @@ def create_mmqa_config(
         max_steps: Maximum reasoning steps
         **kwargs: Additional configuration options
             use_examples: Whether to include MMQA REACT examples in prompts (default: True)
+            rollout_depth / rollout_budget / rollout_workers / rollout_early_stop:
+                look-ahead steps, LLM calls per step, parallel branches and
+                dominated-branch cancellation of the rollout reward
+            model_routes: call site -> model overrides (plan, evaluator,
+                retrieve_code, calculate_code, operate_code, subtask_extraction)
+            fewshot_k / fewshot_max_tokens: ReAct examples selected per
+                question by BM25 and their token budget (0 keeps all examples)
+            scratchpad_max_tokens / keep_recent_observations: budget above
+                which older table observations are compacted, and how many
+                latest observations always stay verbatim
+            code_prompt_table: "schema" shows code prompts the dtypes and
+                first rows of each table, injected in full at execution;
+                "full" embeds every cell (default: "schema")
+            sandbox_workers / sandbox_timeout / sandbox_memory_mb: worker
+                processes running generated code in parallel (0 runs it in
+                process), seconds per program and memory limit per worker
+            sandbox_mode: "fork" forks each program from a warm server
+                holding the tables (POSIX), "pool" uses long-lived workers
+                (default: "fork")
+            code_backend: "pandas" for pandas code, "sqlite"/"duckdb" to have
+                retrieve and operate steps write SQL run on an embedded
+                engine (default: "pandas")
+            observation_max_rows / observation_max_chars / observation_max_tokens:
+                caps of a code result observation; larger results are shown
+                as shape, column statistics and first/last rows while the
+                next steps get the full table (default: 20 rows, 4000
+                characters, no token cap; 0 disables a cap)
 
     Returns:
         Configuration dictionary
@@ -202,6 +229,24 @@ def create_mmqa_config(
         'long_table_op': kwargs.get('long_table_op', 'ignore'),
         'code_as_observation': kwargs.get('code_as_observation', False),
         'without_tool': kwargs.get('without_tool', False),
+        'rollout_depth': kwargs.get('rollout_depth', 2),
+        'rollout_budget': kwargs.get('rollout_budget', 20),
+        'rollout_workers': kwargs.get('rollout_workers', 4),
+        'rollout_early_stop': kwargs.get('rollout_early_stop', True),
+        'model_routes': kwargs.get('model_routes', {}),
+        'fewshot_k': kwargs.get('fewshot_k', 0),
+        'fewshot_max_tokens': kwargs.get('fewshot_max_tokens'),
+        'scratchpad_max_tokens': kwargs.get('scratchpad_max_tokens'),
+        'keep_recent_observations': kwargs.get('keep_recent_observations', 1),
+        'code_prompt_table': kwargs.get('code_prompt_table', 'schema'),
+        'sandbox_workers': kwargs.get('sandbox_workers', 0),
+        'sandbox_timeout': kwargs.get('sandbox_timeout', 10.0),
+        'sandbox_memory_mb': kwargs.get('sandbox_memory_mb', 2048),
+        'sandbox_mode': kwargs.get('sandbox_mode', 'fork'),
+        'code_backend': kwargs.get('code_backend', 'pandas'),
+        'observation_max_rows': kwargs.get('observation_max_rows', 20),
+        'observation_max_chars': kwargs.get('observation_max_chars', 4000),
+        'observation_max_tokens': kwargs.get('observation_max_tokens'),
         'use_examples': kwargs.get('use_examples', True)  # Few-shot by default
     }
 
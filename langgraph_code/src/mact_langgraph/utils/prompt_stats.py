@@ -0,0 +1,54 @@
+"""
+Per-section prompt token accounting for MACT LangGraph.
+
+Prompt builders report the text of each section (examples, tables, context,
+question, scratchpad); whatever else the prompt holds counts as instructions.
+Counts are aggregated per call site so prompt-size work can target the
+sections that dominate.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict
+
+from .retrieval import count_tokens
+
+SECTION_ORDER = ["instructions", "examples", "table", "context", "question", "scratchpad"]
+
+_calls: Dict[str, int] = defaultdict(int)
+_tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def record_prompt(site: str, prompt: str, sections: Dict[str, str]) -> Dict[str, Any]:
+    """Count the tokens of each section of a prompt and add them to the site totals."""
+    breakdown = {name: count_tokens(text or "") for name, text in sections.items()}
+    total = count_tokens(prompt)
+    breakdown["instructions"] = max(total - sum(breakdown.values()), 0)
+    _calls[site] += 1
+    _tokens[site]["total"] += total
+    for name, tokens in breakdown.items():
+        _tokens[site][name] += tokens
+    return {"site": site, "total": total, **breakdown}
+
+
+def prompt_report() -> Dict[str, Dict[str, Any]]:
+    """Calls, total and average tokens and share of the prompt per section, per call site."""
+    report = {}
+    for site, tokens in _tokens.items():
+        calls = _calls[site]
+        total = max(tokens["total"], 1)
+        names = [n for n in SECTION_ORDER if n in tokens] + \
+            sorted(n for n in tokens if n not in SECTION_ORDER and n != "total")
+        report[site] = {
+            "calls": calls,
+            "total_tokens": tokens["total"],
+            "avg_tokens": round(tokens["total"] / calls, 1),
+            "sections": {name: {"tokens": tokens[name],
+                                "avg_tokens": round(tokens[name] / calls, 1),
+                                "share": round(tokens[name] / total, 3)} for name in names},
+        }
+    return report
+
+
+def reset_prompt_stats() -> None:
+    _calls.clear()
+    _tokens.clear()
@@ -4,6 +4,8 @@ Prompt building utilities for MACT LangGraph.
 
 from typing import List, Dict, Any
 from ..state import MACTState, get_tables_from_state
+from .retrieval import get_example_bank
+from .prompt_stats import record_prompt
 
 
 # ReAct prompt templates
@@ -100,10 +102,25 @@ Action: Finish[58.0]
 """
 
 
+def select_examples(state: MACTState) -> str:
+    """ReAct examples of the prompt; the fewshot_k most relevant ones when fewshot_k > 0."""
+    k = state.get("fewshot_k", 0)
+    if k <= 0:
+        return MMQA_REACT_EXAMPLES
+    columns = " ".join(
+        f"{table.name} {' '.join(table.columns)}" for table in get_tables_from_state(state))
+    return get_example_bank(MMQA_REACT_EXAMPLES).select(
+        f"{state['question']} {columns}", k, state.get("fewshot_max_tokens"))
+
+
 def build_react_prompt(state: MACTState) -> str:
     """
     Build ReAct prompt for the current state.
 
+    Blocks go from most to least reused (instructions and examples, tables,
+    context, question, scratchpad), so the steps of a question and questions
+    on the same tables share a prefix the serving side can cache.
+
     Args:
         state: Current MACT state
 
@@ -127,6 +144,7 @@ def build_react_prompt(state: MACTState) -> str:
 
     # Check if examples should be included (defaults to True for backward compatibility)
     use_examples = state.get("config", {}).get("use_examples", True)
+    examples = select_examples(state) if use_examples else ""
 
     # Use QWEN-optimized prompt for QWEN models
     if "qwen" in state.get("config", {}).get("plan_model", "").lower():
@@ -134,13 +152,13 @@ def build_react_prompt(state: MACTState) -> str:
         if use_examples:
             prompt = f"""{REACT_SYSTEM_PROMPT_QWEN}
 
-{MMQA_REACT_EXAMPLES}
+{examples}
 
 Now solve this question:
 
-Question: {state['question']}
 {table_description}
 {context_section}
+Question: {state['question']}
 Current: {state['scratchpad']}
 
 Next action:"""
@@ -148,9 +166,9 @@ Next action:"""
             # Zero-shot QWEN prompt (original behavior)
             prompt = f"""{REACT_SYSTEM_PROMPT_QWEN}
 
-Question: {state['question']}
 {table_description}
 {context_section}
+Question: {state['question']}
 Current: {state['scratchpad']}
 
 Next action:"""
@@ -160,14 +178,14 @@ Next action:"""
             # Few-shot with examples (original behavior)
             prompt = f"""{REACT_SYSTEM_PROMPT}
 
-{MMQA_REACT_EXAMPLES}
+{examples}
 
 Now solve this question:
 
-Question: {state['question']}
-
 {table_description}
 {context_section}
+Question: {state['question']}
+
 Current reasoning:
 {state['scratchpad']}
 
@@ -178,15 +196,18 @@ Think step by step and choose your next action:"""
 
 Now solve this question:
 
-Question: {state['question']}
-
 {table_description}
 {context_section}
+Question: {state['question']}
+
 Current reasoning:
 {state['scratchpad']}
 
 Think step by step and choose your next action:"""
 
+    record_prompt("plan", prompt, {"examples": examples, "table": table_description,
+                                   "context": context_section, "question": state["question"],
+                                   "scratchpad": state["scratchpad"]})
     return prompt
 
 
@@ -373,28 +394,70 @@ def build_code_generation_prompt(instruction: str, table_df_code: str, examples:
     Returns:
         Code generation prompt
     """
+    # Static text first, then the table, then the instruction: code prompts of
+    # one question then share a cacheable prefix.
     # QWEN3-8B specific prompt (ultra concise)
     if model_name and 'qwen' in model_name.lower():
-        return f"""Task: {instruction}
+        prompt = f"""Write clean pandas code. End with: new_table = result
 
 {table_df_code}
 
-Write clean pandas code. End with: new_table = result
+Task: {instruction}
 
 ```python"""
+        record_prompt("code_generation", prompt, {"table": table_df_code, "question": instruction})
+        return prompt
 
     # Standard prompt for other models
-    return f"""Generate Python code to: {instruction}
+    prompt = f"""Generate Python code for the table below.
+
+Requirements:
+- Use pandas operations
+- Store the final result in a variable called 'result' or 'final_result'
+- Include only the necessary code
 
 Table setup:
 {table_df_code}
 
 {examples}
 
-Requirements:
-- Use pandas operations
-- Store the final result in a variable called 'result' or 'final_result'
-- Include only the necessary code
+Task: {instruction}
 
 Code:
-```python"""
\ No newline at end of file
+```python"""
+    record_prompt("code_generation", prompt, {"examples": examples, "table": table_df_code,
+                                              "question": instruction})
+    return prompt
+
+
+def build_sql_generation_prompt(instruction: str, table_schema: str, examples: str = "") -> str:
+    """
+    Build prompt for SQL generation when code runs on the SQL backend.
+
+    Args:
+        instruction: Instruction for what query to write
+        table_schema: Registered tables with columns, types and first rows
+        examples: Example queries
+
+    Returns:
+        SQL generation prompt
+    """
+    prompt = f"""Write one SQL SELECT query for the tables below.
+
+Requirements:
+- Use only the tables and columns listed; quote names with spaces or symbols in double quotes
+- Return the rows and columns the task asks for, or a single value for calculations
+- Include only the query
+
+Tables:
+{table_schema}
+
+{examples}
+
+Task: {instruction}
+
+SQL:
+```sql"""
+    record_prompt("sql_generation", prompt, {"examples": examples, "table": table_schema,
+                                             "question": instruction})
+    return prompt
\ No newline at end of file
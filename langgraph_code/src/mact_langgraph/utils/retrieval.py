@@ -0,0 +1,112 @@
+"""
+Few-shot demo retrieval for MACT LangGraph.
+
+The ReAct demos are split into single examples and indexed with BM25 over
+their question and table schema; prompts embed only the examples most
+similar to the current question, within a token budget.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+STOPWORDS = {"the", "a", "an", "of", "in", "on", "for", "to", "and", "or", "is", "are", "was",
+             "were", "what", "which", "who", "how", "did", "does", "do", "by", "with", "that",
+             "this", "it", "as", "at", "be", "from"}
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, else about 4 characters per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a small in-memory collection."""
+
+    def __init__(self, docs: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = [Counter(tokenize(doc)) for doc in docs]
+        self.lengths = [sum(doc.values()) for doc in self.docs]
+        self.avg_length = sum(self.lengths) / max(len(self.docs), 1) or 1.0
+        df = Counter(term for doc in self.docs for term in doc)
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def scores(self, query: str) -> List[float]:
+        terms = tokenize(query)
+        scores = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term, 0)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / self.avg_length)
+                    score += self.idf[term] * tf * (self.k1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        scores = self.scores(query)
+        return sorted(range(len(scores)), key=lambda i: (-scores[i], i))[:k]
+
+
+def split_examples(examples: str) -> List[str]:
+    """Split an "Example n:" block into single examples."""
+    parts = re.split(r"\n\s*\n(?=Example \d+:)", examples.strip())
+    return [part.strip() for part in parts if part.strip()]
+
+
+def example_key(example: str) -> str:
+    """Text an example is indexed by: everything before its first thought."""
+    return example.split("Thought", 1)[0]
+
+
+class ExampleBank:
+    """Indexed ReAct examples, selected per question."""
+
+    def __init__(self, examples: List[str]):
+        self.examples = examples
+        self.index = BM25Index([example_key(example) for example in examples])
+        self.tokens = [count_tokens(example) for example in examples]
+
+    def select(self, query: str, k: int, max_tokens: Optional[int] = None) -> str:
+        """
+        Return the k most relevant examples, within max_tokens when given.
+        The best example is always kept; selected examples keep their bank order.
+        """
+        chosen = []
+        used = 0
+        for i in self.index.top_k(query, len(self.examples)):
+            if len(chosen) == k:
+                break
+            if chosen and max_tokens is not None and used + self.tokens[i] > max_tokens:
+                continue
+            chosen.append(i)
+            used += self.tokens[i]
+        examples = [self.examples[i] for i in sorted(chosen)]
+        return "\n\n".join(re.sub(r"^Example \d+:", f"Example {n}:", example)
+                           for n, example in enumerate(examples, 1))
+
+
+_banks: Dict[str, ExampleBank] = {}
+
+
+def get_example_bank(examples: str) -> ExampleBank:
+    """Bank of an examples block, built once per process."""
+    if examples not in _banks:
+        _banks[examples] = ExampleBank(split_examples(examples))
+    return _banks[examples]
@@ -0,0 +1,98 @@
+"""
+Per call site model routing for MACT LangGraph.
+
+Each LLM call site resolves its model through ``state["model_routes"]`` and
+falls back to the plan or code model. Calls are timed per site so a routing
+table can be tuned from measured latency and success rates. Token usage,
+including prompt tokens served from the provider's prefix cache, is added to
+the active call through ``note_usage``.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+# call site -> state field of the model used when no route is given
+CALL_SITES = {
+    "plan": "plan_model",
+    "evaluator": "plan_model",
+    "retrieve_code": "code_model",
+    "calculate_code": "code_model",
+    "operate_code": "code_model",
+    "subtask_extraction": "code_model",
+}
+
+_profiles: Dict[str, Dict[str, Any]] = {}
+_active: ContextVar[Optional[Dict[str, Any]]] = ContextVar("active_route", default=None)
+
+
+def route_model(state: Dict[str, Any], site: str) -> str:
+    """Return the model name routed to a call site."""
+    model = (state.get("model_routes") or {}).get(site)
+    if model:
+        return model
+    return state.get(CALL_SITES.get(site, "plan_model")) or "gpt-3.5-turbo"
+
+
+@contextmanager
+def profile_route(site: str, model: str) -> Iterator[Dict[str, Any]]:
+    """
+    Time one call of a site. The caller sets ``record["success"]`` once the
+    response is checked; an exception counts as a failure.
+    """
+    record = {"success": False, "prompt_tokens": 0, "cached_tokens": 0}
+    token = _active.set(record)
+    start = time.time()
+    try:
+        yield record
+    finally:
+        _active.reset(token)
+        profile = _profiles.setdefault(site, {"model": model, "calls": 0, "successes": 0, "latency": 0.0,
+                                              "prompt_tokens": 0, "cached_tokens": 0})
+        profile["model"] = model
+        profile["calls"] += 1
+        profile["successes"] += int(bool(record["success"]))
+        profile["latency"] += time.time() - start
+        profile["prompt_tokens"] += record["prompt_tokens"]
+        profile["cached_tokens"] += record["cached_tokens"]
+
+
+def note_usage(usage: Any) -> None:
+    """
+    Add the usage of a response to the call being profiled, if any.
+    Accepts an OpenAI usage object or a LangChain ``usage_metadata`` dict.
+    """
+    record = _active.get()
+    if record is None or not usage:
+        return
+    if isinstance(usage, dict):
+        prompt = usage.get("input_tokens") or 0
+        cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    else:
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    record["prompt_tokens"] += prompt
+    record["cached_tokens"] += cached
+
+
+def route_report() -> Dict[str, Dict[str, Any]]:
+    """Calls, success rate, average latency and prompt cache hits per call site."""
+    report = {}
+    for site, profile in _profiles.items():
+        calls = max(profile["calls"], 1)
+        report[site] = {
+            "model": profile["model"],
+            "calls": profile["calls"],
+            "success_rate": round(profile["successes"] / calls, 3),
+            "avg_latency_s": round(profile["latency"] / calls, 3),
+            "prompt_tokens": profile["prompt_tokens"],
+            "cached_tokens": profile["cached_tokens"],
+            "cache_hit_rate": round(profile["cached_tokens"] / max(profile["prompt_tokens"], 1), 3),
+        }
+    return report
+
+
+def reset_route_profiles() -> None:
+    _profiles.clear()
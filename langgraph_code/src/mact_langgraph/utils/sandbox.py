@@ -0,0 +1,453 @@
+"""
+Sandboxed execution of generated code for MACT LangGraph.
+
+A pool of long-lived worker processes runs the code samples of a step in
+parallel, each program with a wall-clock timeout, the workers with a memory
+limit (RLIMIT_AS) and restricted builtins. A worker that times out or dies
+is replaced. With mode "fork" a warm server process holding pandas, numpy and
+the current tables forks a fresh child per program instead.
+"""
+
+import atexit
+import builtins
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# modules generated code may import
+SAFE_MODULES = {"pandas", "numpy", "math", "re", "datetime", "time", "statistics", "collections",
+                "itertools", "functools", "operator", "decimal", "fractions", "string", "json",
+                "dateutil", "calendar", "random", "typing"}
+BLOCKED_BUILTINS = {"open", "exec", "eval", "compile", "input", "breakpoint", "exit", "quit",
+                    "help", "globals", "locals", "vars", "memoryview"}
+
+
+class SandboxError(Exception):
+    """Generated code raised, timed out or exceeded its memory limit in the sandbox."""
+
+
+def _safe_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0 and name.split(".")[0] not in SAFE_MODULES:
+        raise ImportError(f"import of '{name}' is not allowed in generated code")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+def restricted_builtins() -> Dict[str, Any]:
+    safe = {name: value for name, value in vars(builtins).items() if name not in BLOCKED_BUILTINS}
+    safe["__import__"] = _safe_import
+    return safe
+
+
+def _portable(value):
+    # values that cannot be sent back to the parent are returned as their string
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return str(value)
+
+
+def run_program(code: str, namespace: Dict[str, Any], outputs: Iterable[str]) -> Dict[str, Any]:
+    """Execute one program with restricted builtins; returns its output variables, error and resource usage."""
+    import numpy as np
+    import pandas as pd
+    env = {"__builtins__": restricted_builtins(), "pd": pd, "pandas": pd, "np": np, "numpy": np}
+    env.update(namespace)
+    start, cpu = time.perf_counter(), time.process_time()
+    error = None
+    try:
+        exec(code, env)
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "values": {name: _portable(env[name]) for name in outputs if name in env},
+        "error": error,
+        "timed_out": False,
+        "wall_s": round(time.perf_counter() - start, 4),
+        "cpu_s": round(time.process_time() - cpu, 4),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+
+def _limit_memory(memory_mb: Optional[int]) -> None:
+    if memory_mb and resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024, hard))
+
+
+def _worker_main(conn, memory_mb: Optional[int]) -> None:
+    _limit_memory(memory_mb)
+    import numpy  # noqa: F401  warm the imports before the first program
+    import pandas  # noqa: F401
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        conn.send(run_program(*task))
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: Optional[int]):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, memory_mb), daemon=True)
+        self.process.start()
+        child.close()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(self, task, timeout: float) -> Dict[str, Any]:
+        self.conn.send(task)
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+        return self.conn.recv()
+
+    def stop(self) -> None:
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(1)
+        self.conn.close()
+
+
+class CodeExecutor:
+    """
+    Pool of long-lived worker processes executing generated code. Each
+    program gets a wall-clock timeout, the workers a memory limit (RLIMIT_AS)
+    and restricted builtins; a worker that times out or dies is replaced.
+    Threads block on the worker pipes, so ``map`` runs the code samples of a
+    step in parallel.
+    """
+
+    def __init__(self, workers: int = 4, timeout: float = 10.0, memory_mb: Optional[int] = 2048,
+                 start_method: str = "spawn"):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._ctx = multiprocessing.get_context(start_method)
+        # workers start lazily, on their first program
+        self._idle: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(None)
+        self._pool = ThreadPoolExecutor(workers)
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.wall_time = 0.0
+        atexit.register(self.close)
+
+    def execute(self, code: str, namespace: Optional[Dict[str, Any]] = None,
+                outputs: Iterable[str] = ("result",), table: Optional[str] = None) -> Dict[str, Any]:
+        """Run one program; never raises, failures are reported in the result."""
+        task = (code, namespace or {}, list(outputs))
+        worker = self._idle.get()
+        if worker is None or not worker.alive():
+            worker = _Worker(self._ctx, self.memory_mb)
+        start = time.perf_counter()
+        try:
+            result = worker.run(task, self.timeout)
+        except TimeoutError:
+            worker.stop()
+            worker = None
+            result = {"values": {}, "error": f"TimeoutError: program exceeded {self.timeout}s", "timed_out": True}
+        except (EOFError, OSError):
+            # the worker died, most likely killed by the memory limit
+            worker.stop()
+            worker = None
+            result = {"values": {}, "error": "WorkerError: worker process exited", "timed_out": False}
+        except Exception as e:
+            # e.g. a namespace that cannot be sent to the worker
+            result = {"values": {}, "error": f"{type(e).__name__}: {e}", "timed_out": False}
+        finally:
+            self._idle.put(worker)
+        return self._record(result, start)
+
+    def _record(self, result: Dict[str, Any], start: float) -> Dict[str, Any]:
+        result.setdefault("wall_s", round(time.perf_counter() - start, 4))
+        with self._lock:
+            self.runs += 1
+            self.errors += int(result["error"] is not None)
+            self.timeouts += int(result["timed_out"])
+            self.crashes += int(result["error"] == "WorkerError: worker process exited")
+            self.wall_time += time.perf_counter() - start
+        return result
+
+    def run(self, code: str, namespace: Optional[Dict[str, Any]] = None,
+            outputs: Iterable[str] = ("result",), table: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run one program and return its output variables; raises SandboxError on failure.
+        ``table`` names the namespace (e.g. a table fingerprint) so executors that keep
+        tables resident can skip sending it again.
+        """
+        result = self.execute(code, namespace, outputs, table)
+        if result["error"] is not None:
+            raise SandboxError(result["error"])
+        return result["values"]
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """Apply fn (which executes code through this executor) to items in parallel, keeping order."""
+        return list(self._pool.map(fn, items))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self.runs, "errors": self.errors, "timeouts": self.timeouts,
+                "crashes": self.crashes, "avg_wall_s": round(self.wall_time / max(self.runs, 1), 4)}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                try:
+                    worker.conn.send(None)
+                except Exception:
+                    pass
+                worker.stop()
+
+
+def _run_forked(conn, code: str, namespace: Dict[str, Any], outputs: List[str], memory_mb: Optional[int]) -> None:
+    # in the forked child: limit it, run the program, report and exit without cleanup
+    status = 1
+    try:
+        _limit_memory(memory_mb)
+        conn.send(run_program(code, namespace, outputs))
+        status = 0
+    except BaseException:
+        pass
+    finally:
+        os._exit(status)
+
+
+def _reap(pid: int) -> None:
+    try:
+        os.waitpid(pid, 0)
+    except ChildProcessError:
+        pass
+
+
+def _zygote_main(conn, memory_mb: Optional[int], timeout: float) -> None:
+    """
+    Fork server: imports pandas and numpy once, keeps the loaded tables
+    resident and forks a child per program, which inherits both copy-on-write.
+    """
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    tables: Dict[str, Dict[str, Any]] = {}
+    running: Dict[Any, tuple] = {}  # result pipe -> (task id, pid, deadline)
+    while True:
+        now = time.monotonic()
+        deadline = min((entry[2] for entry in running.values()), default=None)
+        ready = wait([conn] + list(running), None if deadline is None else max(deadline - now, 0))
+        for reader in ready:
+            if reader is not conn:
+                task_id, pid, _ = running.pop(reader)
+                try:
+                    result = reader.recv()
+                except (EOFError, OSError):
+                    result = {"values": {}, "error": "WorkerError: worker process exited", "timed_out": False}
+                reader.close()
+                _reap(pid)
+                conn.send((task_id, result))
+                continue
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = None
+            if message is None:
+                for reader, (_, pid, _) in running.items():
+                    os.kill(pid, signal.SIGKILL)
+                    _reap(pid)
+                return
+            kind = message[0]
+            if kind == "load":
+                tables[message[1]] = message[2]
+            elif kind == "drop":
+                tables.pop(message[1], None)
+            else:
+                _, task_id, code, namespace, outputs, table = message
+                if table is not None:
+                    namespace = {**tables.get(table, {}), **namespace}
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                pid = os.fork()
+                if pid == 0:
+                    reader.close()
+                    conn.close()
+                    _run_forked(writer, code, namespace, outputs, memory_mb)
+                writer.close()
+                running[reader] = (task_id, pid, time.monotonic() + timeout)
+        now = time.monotonic()
+        for reader, (task_id, pid, deadline) in list(running.items()):
+            if deadline <= now and reader not in ready:
+                os.kill(pid, signal.SIGKILL)
+                _reap(pid)
+                reader.close()
+                del running[reader]
+                conn.send((task_id, {"values": {}, "error": f"TimeoutError: program exceeded {timeout}s",
+                                     "timed_out": True}))
+
+
+class ForkServerExecutor(CodeExecutor):
+    """
+    Executor forking a fresh child per program from a warm zygote process that
+    has pandas and numpy imported and the current tables loaded, so each program
+    is isolated (memory limit, timeout, restricted builtins) for the cost of a
+    fork instead of an interpreter start. Tables passed with ``table=`` are sent
+    to the zygote once and kept resident for the last ``max_tables`` keys.
+    Needs os.fork (POSIX).
+    """
+
+    def __init__(self, workers: int = 4, timeout: float = 10.0, memory_mb: Optional[int] = 2048,
+                 start_method: str = "spawn", max_tables: int = 8):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tables = max_tables
+        self._ctx = multiprocessing.get_context(start_method)
+        self._pool = ThreadPoolExecutor(workers)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending: Dict[int, list] = {}
+        self._tables: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded = set()
+        self._zygote = None
+        self._conn = None
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.wall_time = 0.0
+        atexit.register(self.close)
+
+    def _start(self) -> None:
+        # called with _send_lock held
+        self._conn, child = self._ctx.Pipe()
+        self._zygote = self._ctx.Process(target=_zygote_main, args=(child, self.memory_mb, self.timeout),
+                                         daemon=True)
+        self._zygote.start()
+        child.close()
+        self._loaded = set()
+        threading.Thread(target=self._read_results, args=(self._conn,), daemon=True).start()
+
+    def _read_results(self, conn) -> None:
+        while True:
+            try:
+                task_id, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                waiter = self._pending.pop(task_id, None)
+            if waiter is not None:
+                waiter[1] = result
+                waiter[0].set()
+        # the zygote is gone: fail the programs still waiting on it
+        with self._lock:
+            waiters, self._pending = list(self._pending.values()), {}
+        for waiter in waiters:
+            waiter[1] = {"values": {}, "error": "WorkerError: worker process exited", "timed_out": False}
+            waiter[0].set()
+
+    def _submit(self, task_id: int, code: str, namespace: Dict[str, Any], outputs: List[str],
+                table: Optional[str]) -> None:
+        with self._send_lock:
+            if self._zygote is None or not self._zygote.is_alive():
+                self._start()
+            if table is not None:
+                if table not in self._tables:
+                    self._tables[table] = namespace
+                    if len(self._tables) > self.max_tables:
+                        old, _ = self._tables.popitem(last=False)
+                        if old in self._loaded:
+                            self._loaded.discard(old)
+                            self._conn.send(("drop", old))
+                self._tables.move_to_end(table)
+                if table not in self._loaded:
+                    self._conn.send(("load", table, self._tables[table]))
+                    self._loaded.add(table)
+                namespace = {}
+            self._conn.send(("run", task_id, code, namespace, outputs, table))
+
+    def execute(self, code: str, namespace: Optional[Dict[str, Any]] = None,
+                outputs: Iterable[str] = ("result",), table: Optional[str] = None) -> Dict[str, Any]:
+        """Run one program in a forked child; never raises, failures are reported in the result."""
+        task_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        start = time.perf_counter()
+        with self._slots:
+            with self._lock:
+                self._pending[task_id] = waiter
+            try:
+                self._submit(task_id, code, namespace or {}, list(outputs), table)
+            except Exception as e:
+                # e.g. a namespace that cannot be sent to the zygote
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                return self._record({"values": {}, "error": f"{type(e).__name__}: {e}", "timed_out": False}, start)
+            # the zygote enforces the timeout; the margin covers a zygote that stopped answering
+            if not waiter[0].wait(self.timeout + 5):
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                waiter[1] = {"values": {}, "error": f"TimeoutError: program exceeded {self.timeout}s",
+                             "timed_out": True}
+        return self._record(waiter[1], start)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+        with self._send_lock:
+            if self._zygote is None:
+                return
+            try:
+                self._conn.send(None)
+            except Exception:
+                pass
+            self._zygote.join(1)
+            if self._zygote.is_alive():
+                self._zygote.terminate()
+            self._conn.close()
+            self._zygote = None
+
+
+def make_executor(workers: int, timeout: float = 10.0, memory_mb: Optional[int] = 2048,
+                  mode: str = "fork") -> Optional[CodeExecutor]:
+    """Sandbox executor for the command line options; None (no workers) executes code in process."""
+    if workers <= 0:
+        return None
+    if mode == "fork" and hasattr(os, "fork"):
+        return ForkServerExecutor(workers=workers, timeout=timeout, memory_mb=memory_mb)
+    return CodeExecutor(workers=workers, timeout=timeout, memory_mb=memory_mb)
+
+
+_executors: Dict[tuple, CodeExecutor] = {}
+
+
+def get_code_executor(state: Dict[str, Any]) -> Optional[CodeExecutor]:
+    """Executor configured by a state, shared by all questions; None executes code in process."""
+    workers = state.get("sandbox_workers") or 0
+    if workers <= 0:
+        return None
+    key = (workers, state.get("sandbox_timeout", 10.0), state.get("sandbox_memory_mb", 2048),
+           state.get("sandbox_mode", "fork"))
+    if key not in _executors:
+        _executors[key] = make_executor(key[0], timeout=key[1], memory_mb=key[2] or None, mode=key[3])
+    return _executors[key]
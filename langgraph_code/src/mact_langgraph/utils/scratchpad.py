@@ -0,0 +1,74 @@
+"""
+Scratchpad compaction for MACT LangGraph.
+
+Once the scratchpad exceeds a token budget, older tabular observations are
+replaced by references (shape, header, a few rows and the DataFrame variable
+the operator tool exposes the table under), while thoughts, actions and the
+latest observations stay verbatim.
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from .retrieval import count_tokens
+
+STEP_START = re.compile(r"(?m)^(?=(?:Thought|Action|Observation) \d+:)")
+OBSERVATION = re.compile(r"^Observation (\d+):[ \t]*")
+REFERENCE = re.compile(r"(?m)^\[table\b")
+
+
+def table_lines(text: str) -> List[str]:
+    return [line.strip() for line in text.split("\n") if line.strip().startswith("|")]
+
+
+def is_tabular(text: str) -> bool:
+    return len(table_lines(text)) >= 2
+
+
+def table_reference(body: str, handle: Optional[str], preview_rows: int = 2) -> str:
+    """Shape, header and first rows of a rendered table, plus its handle."""
+    lines = table_lines(body)
+    header, rows = lines[0], lines[1:]
+    cols = len(header.strip("|").split("|"))
+    label = f"table {handle}" if handle else "table"
+    shown = rows[:preview_rows]
+    reference = [f"[{label}: {len(rows)} rows x {cols} columns, first {len(shown)} rows shown]",
+                 header] + shown
+    text = [line for line in body.split("\n") if line.strip() and not line.strip().startswith("|")]
+    return "\n".join(text + reference)
+
+
+def compact_scratchpad(scratchpad: str, max_tokens: int,
+                       handle_for: Callable[[int], Optional[str]] = lambda step: None,
+                       keep_recent: int = 1, preview_rows: int = 2) -> str:
+    """Replace the oldest tabular observations by references until the scratchpad fits."""
+    tokens = count_tokens(scratchpad)
+    if tokens <= max_tokens:
+        return scratchpad
+    segments = [s for s in STEP_START.split(scratchpad) if s]
+    observations = [i for i, s in enumerate(segments) if OBSERVATION.match(s)]
+    candidates = observations[:-keep_recent] if keep_recent else observations
+    for i in candidates:
+        if tokens <= max_tokens:
+            break
+        match = OBSERVATION.match(segments[i])
+        body = segments[i][match.end():]
+        if not is_tabular(body) or REFERENCE.search(body):
+            continue
+        step = int(match.group(1))
+        compacted = f"Observation {step}: " + table_reference(body, handle_for(step), preview_rows) + "\n"
+        tokens += count_tokens(compacted) - count_tokens(segments[i])
+        segments[i] = compacted
+    return "".join(segments)
+
+
+def state_table_handle(tables: List[Dict[str, Any]]) -> Callable[[int], Optional[str]]:
+    """Handle lookup of the tables produced by Retrieve/Operate steps of a state."""
+    def handle_for(step: int) -> Optional[str]:
+        prefixes = (f"retrieved_step_{step}_", f"operated_step_{step}_")
+        for table in reversed(tables):
+            name = table.get("name", "")
+            if name.startswith(prefixes):
+                return "df_" + name.lower().replace(' ', '_').replace('-', '_')
+        return None
+    return handle_for
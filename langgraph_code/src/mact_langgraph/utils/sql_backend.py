@@ -0,0 +1,156 @@
+"""
+SQL execution backend for MACT LangGraph.
+
+The code model writes SQL instead of pandas code; it runs on an embedded
+engine holding the tables of the question: in-memory SQLite from the
+standard library, or DuckDB (optional dependency), which also reads
+parquet files in place for large tables.
+"""
+
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+
+from .exec_cache import execution_cache, fingerprint
+from .table_utils import DEFAULT_OBSERVATION_LIMITS, _setup_namespace, load_dataset, render_result
+
+SQL_ENGINES = ("sqlite", "duckdb")
+# statements generated SQL may start with; everything else is rejected
+READ_ONLY = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def extract_sql(text: str) -> str:
+    """The SQL query of a model response: its sql code block, else the first SELECT/WITH statement."""
+    block = re.search(r"```(?:sql|SQL)?\s*\n(.*?)```", text, re.DOTALL)
+    if block:
+        text = block.group(1)
+    start = re.search(r"\b(select|with)\b", text, re.IGNORECASE)
+    if start is None:
+        return ""
+    return text[start.start():].split(";")[0].strip()
+
+
+def quote_identifier(name: Any) -> str:
+    name = str(name)
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLBackend:
+    """
+    Embedded SQL engine with the tables of a question registered once.
+    Queries are serialized on one connection and must be read only.
+    """
+
+    def __init__(self, engine: str = "sqlite"):
+        if engine not in SQL_ENGINES:
+            raise ValueError(f"unknown SQL engine '{engine}', expected one of {SQL_ENGINES}")
+        self.engine = engine
+        self.tables: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        if engine == "duckdb":
+            try:
+                import duckdb
+            except ImportError:
+                raise ImportError("the duckdb SQL engine needs the duckdb package: pip install duckdb")
+            self._conn = duckdb.connect()
+        else:
+            import sqlite3
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+
+    def register(self, name: str, df: pd.DataFrame) -> None:
+        """Make a DataFrame queryable as table `name`, replacing an earlier one."""
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        with self._lock:
+            if self.engine == "duckdb":
+                self._conn.register(name, df)
+            else:
+                self._conn.execute("PRAGMA query_only = OFF")
+                df.to_sql(name, self._conn, index=False, if_exists="replace")
+                # WITH ... DELETE passes the statement check, the engine refuses it
+                self._conn.execute("PRAGMA query_only = ON")
+            self.tables[name] = df.columns.tolist()
+
+    def register_parquet(self, name: str, path: str) -> None:
+        """Make a parquet file queryable as table `name`; DuckDB scans it in place."""
+        if self.engine != "duckdb":
+            self.register(name, load_dataset(path))
+            return
+        with self._lock:
+            escaped = path.replace("'", "''")
+            self._conn.execute(f"CREATE OR REPLACE VIEW {quote_identifier(name)} AS "
+                               f"SELECT * FROM read_parquet('{escaped}')")
+            self.tables[name] = [row[0] for row in self._conn.execute(
+                f"DESCRIBE {quote_identifier(name)}").fetchall()]
+
+    def query(self, sql: str) -> pd.DataFrame:
+        """Run a read-only query; raises ValueError for other statements and the engine's error on failure."""
+        if not READ_ONLY.match(sql or ""):
+            raise ValueError("only SELECT/WITH queries can be executed")
+        with self._lock:
+            if self.engine == "duckdb":
+                return self._conn.execute(sql).df()
+            return pd.read_sql_query(sql, self._conn)
+
+    def schema(self, num_row: int = 3) -> str:
+        """Prompt view of the registered tables: columns, types and first rows."""
+        parts = []
+        for name in self.tables:
+            head = self.query(f"SELECT * FROM {quote_identifier(name)} LIMIT {num_row}")
+            columns = ", ".join(f"{quote_identifier(c)} {dtype}" for c, dtype in head.dtypes.astype(str).items())
+            parts.append(f"Table {quote_identifier(name)} ({columns})\n"
+                         f"First rows: {head.values.tolist()}")
+        return "\n".join(parts)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def register_frames(backend: SQLBackend, namespace: Dict[str, Any]) -> SQLBackend:
+    """Register every DataFrame of a namespace (df, df1, original_df, ...) under its variable name."""
+    for name, value in namespace.items():
+        if isinstance(value, pd.DataFrame):
+            backend.register(name, value)
+    return backend
+
+
+
+@lru_cache(maxsize=32)
+def table_backend(table_df: str, engine: str = "sqlite") -> SQLBackend:
+    """Backend holding the tables of DataFrame setup code, registered once per setup code."""
+    return register_frames(SQLBackend(engine), _setup_namespace(table_df))
+
+
+def render_sql_result(df: pd.DataFrame, limits: Tuple[int, int, int] = DEFAULT_OBSERVATION_LIMITS
+                      ) -> Tuple[str, List[List[Any]]]:
+    """Single values are rendered as text, other results as tables; rows hold the table either way."""
+    text, rows = render_result(df, *limits)
+    if df.shape == (1, 1):
+        text = str(df.iat[0, 0])
+    return text, rows
+
+
+def execute_table_sql(response: str, table_df: str, engine: str = "sqlite", tool: str = "table_sql",
+                      limits: Tuple[int, int, int] = DEFAULT_OBSERVATION_LIMITS) -> Tuple[str, List[List[Any]], Exception, str]:
+    """
+    Execute the SQL query of a model response on the tables of DataFrame setup
+    code. Returns (result, rows, error, sql) like execute_table_code.
+    """
+    sql = extract_sql(response)
+    if not sql:
+        return "", [], None, None
+    try:
+        backend = table_backend(table_df, engine)
+        df = execution_cache.run(tool, fingerprint(table_df, engine), " ".join(sql.split()),
+                                 lambda: backend.query(sql))
+        result, rows = render_sql_result(df, limits)
+        return result, rows, None, sql
+    except Exception as e:
+        print(f"DEBUG: SQL execution error: {e}")
+        return "", [], e, sql
@@ -2,11 +2,23 @@
 Table processing utilities adapted from original MACT implementation.
 """
 
+import copy
+import hashlib
 import re
 import string
 import random
+import threading
+import numpy as np
 import pandas as pd
-from typing import List, Any, Tuple
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from .code_validation import SchemaValidator
+from .exec_cache import execution_cache, fingerprint
+from .retrieval import count_tokens
 
 
 def clean_cell(cell: Any, idx: int, header: bool = False) -> str:
@@ -58,6 +70,100 @@ def table_linear(table: List[List[Any]], num_row: int = None) -> str:
     return output
 
 
+OBSERVATION_MAX_ROWS = 20
+OBSERVATION_MAX_CHARS = 4000
+
+
+def column_stats(df: pd.DataFrame, max_columns: int = 20) -> str:
+    """One-line statistics of each column: range and mean of numeric ones, distinct values of the others."""
+    stats = []
+    for i, column in enumerate(df.columns[:max_columns]):
+        values = df.iloc[:, i]
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.notna().any() and numeric.notna().sum() == values.notna().sum():
+            stat = f"numeric, min {numeric.min():g}, max {numeric.max():g}, mean {numeric.mean():g}"
+        else:
+            counts = values.dropna().astype(str).value_counts()
+            stat = f"text, {len(counts)} distinct"
+            if len(counts):
+                stat += f", top '{clean_cell(counts.index[0], i, header=False)[:30]}' ({counts.iloc[0]})"
+        missing = int(values.isna().sum())
+        if missing:
+            stat += f", {missing} missing"
+        stats.append(f"{clean_cell(column, i, header=True)} ({stat})")
+    if len(df.columns) > max_columns:
+        stats.append(f"... {len(df.columns) - max_columns} more columns")
+    return "; ".join(stats)
+
+
+def summarize_table(rows: List[List[Any]], head_rows: int = 5, tail_rows: int = 2) -> str:
+    """Compact view of a large result table (header first): shape, column statistics, first and last rows."""
+    header, body = rows[0], rows[1:]
+    df = pd.DataFrame(body, columns=[clean_cell(c, i, header=True) for i, c in enumerate(header)])
+    text = f"[Large result: {len(body)} rows x {len(header)} columns; the full table is kept for the next steps]\n"
+    text += "Columns: " + column_stats(df) + "\n"
+    if len(body) <= head_rows + tail_rows:
+        return text + table_linear(rows, num_row=None)
+    text += table_linear(rows, num_row=head_rows)
+    text += f"| ... {len(body) - head_rows - tail_rows} rows omitted ... |\n"
+    # tail rows without repeating the header line
+    text += table_linear([header] + body[-tail_rows:], num_row=None).split("\n", 1)[1]
+    return text
+
+
+def render_observation(rows: List[List[Any]], max_rows: int = None, max_chars: int = None,
+                       max_tokens: int = None) -> str:
+    """
+    Observation text of a result table (header first).
+
+    Tables within every cap are rendered in full; larger ones as
+    summarize_table, rendered without linearizing all rows, and clipped to
+    max_chars/max_tokens as a last resort.
+    """
+    if not max_rows or len(rows) - 1 <= max_rows:
+        text = table_linear(rows, num_row=None)
+        if (not max_chars or len(text) <= max_chars) and (not max_tokens or count_tokens(text) <= max_tokens):
+            return text
+    text = summarize_table(rows)
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars] + "\n...[truncated]"
+    if max_tokens and count_tokens(text) > max_tokens:
+        # about 4 characters per token
+        text = text[:4 * max_tokens] + "\n...[truncated]"
+    return text
+
+
+# (max_rows, max_chars, max_tokens) caps of code result observations; 0/None disables a cap
+DEFAULT_OBSERVATION_LIMITS = (OBSERVATION_MAX_ROWS, OBSERVATION_MAX_CHARS, None)
+
+
+def render_result(value: Any, max_rows: int = None, max_chars: int = None,
+                  max_tokens: int = None) -> Tuple[str, List[List[Any]]]:
+    """
+    Render the result of generated code as prompt text, in memory.
+
+    Returns (text, rows) with rows the full table behind the text (header
+    first), [] when the value is not tabular. DataFrames and Series over the
+    size caps are shown as a summary (render_observation).
+    """
+    if isinstance(value, str):
+        return value, []
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        if value.empty:
+            return str(value), []
+        rows = value.values.tolist()
+        rows.insert(0, value.columns.tolist())
+        return render_observation(rows, max_rows, max_chars, max_tokens), rows
+    try:
+        # numpy arrays
+        rows = value.tolist()
+        return table_linear(rows, num_row=None), rows
+    except Exception:
+        return str(value), []
+
+
 def normalize_column_name(col_name: str) -> str:
     """
     🎯 Bug Fix #1: Normalize column names to consistent lowercase format.
@@ -87,6 +193,85 @@ def normalize_column_name(col_name: str) -> str:
     return normalized.lower()
 
 
+def result_fingerprint(rows: List[List[Any]], ordered: bool = False) -> str:
+    """
+    Canonical key of a tabular result (header first) for voting.
+
+    Columns are normalized to float when all their values are numeric, else
+    to stripped strings, and rows are hashed with pd.util.hash_pandas_object,
+    so "5", 5 and 5.0 agree. Row and column order are ignored unless ordered.
+    """
+    header = [str(column) for column in rows[0]]
+    df = pd.DataFrame(rows[1:], columns=range(len(header)))
+    normalized = {}
+    for i in df.columns:
+        column = df[i]
+        numeric = pd.to_numeric(column, errors="coerce")
+        if numeric.notna().sum() == column.notna().sum():
+            normalized[i] = numeric.astype(float)
+        else:
+            normalized[i] = column.astype(str).str.strip()
+    order = list(range(len(header))) if ordered else sorted(range(len(header)), key=lambda i: header[i])
+    df = pd.DataFrame({i: normalized[i] for i in order})
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    if not ordered:
+        row_hashes = np.sort(row_hashes)
+    digest = hashlib.sha1("\x1f".join(header[i] for i in order).encode("utf-8"))
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+class ResultVote:
+    """
+    Votes of the code samples of a step, grouped by result_fingerprint: each
+    distinct result is rendered once, and only the winner is turned into
+    DataFrame code for the next step.
+    """
+
+    def __init__(self, ordered: bool = False, render=None):
+        self.ordered = ordered
+        # rows -> observation text of a new result
+        self.render = render or (lambda rows: table_linear(rows, num_row=None))
+        self.samples = 0
+        self._groups: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, rows: List[List[Any]], text: str = None) -> str:
+        """Count one sample's table; returns the text shared by its group (rendered here if not given)."""
+        try:
+            key = result_fingerprint(rows, self.ordered)
+        except Exception:
+            key = repr(rows)
+        group = self._groups.get(key)
+        if group is None:
+            if text is None:
+                text = self.render(rows)
+            group = self._groups[key] = {"rows": rows, "text": text, "count": 0, "first": self.samples}
+        group["count"] += 1
+        self.samples += 1
+        return group["text"]
+
+    def find(self, text: str) -> Tuple[List[List[Any]], int]:
+        """
+        (rows, first sample index) of the result an observation shows: the
+        group with exactly that text, else the only group whose text contains
+        it or is contained in it; None if no group or several match.
+        """
+        for group in self._groups.values():
+            if group["text"] == text:
+                return group["rows"], group["first"]
+        matches = [group for group in self._groups.values() if group["text"] in text or text in group["text"]]
+        if len(matches) != 1:
+            return None
+        return matches[0]["rows"], matches[0]["first"]
+
+    def winner(self) -> Tuple[List[List[Any]], str, int]:
+        """(rows, text, votes) of the most frequent result, the first seen on ties; None without votes."""
+        if not self._groups:
+            return None
+        group = max(self._groups.values(), key=lambda g: g["count"])
+        return group["rows"], group["text"], group["count"]
+
+
 def table2df(table: List[List[Any]], normalize_columns: bool = True) -> str:
     """
     Convert table to pandas DataFrame code string.
@@ -183,6 +368,104 @@ def exact_match(predicted: str, target: str) -> bool:
     return normalized_pred == normalized_target
 
 
+YES_ANSWERS = {"yes", "true", "support", "supports", "supported", "entailed", "correct"}
+NO_ANSWERS = {"no", "false", "refute", "refutes", "refuted", "incorrect"}
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y",
+                "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y", "%d %B, %Y"]
+MONTH_FORMATS = ["%B %Y", "%b %Y", "%Y-%m"]
+
+
+def _canonical_number(text: str):
+    s = re.sub(r"(?<=[$€£¥(+-])\s+", "", text)
+    negative = s.startswith("(") and s.endswith(")")
+    if negative:
+        s = s[1:-1]
+    s = re.sub(r"^([-+]?)[$€£¥]", r"\1", s).rstrip("%").strip()
+    if not re.fullmatch(r"[-+]?(\d{1,3}(,\d{3})+|\d*)(\.\d+)?", s) or not re.search(r"\d", s):
+        return None
+    value = float(s.replace(",", ""))
+    if negative:
+        value = -value
+    value = round(value, 4)
+    if value == int(value):
+        return str(int(value))
+    return f"{value:.4f}".rstrip("0")
+
+
+def _canonical_date(text: str):
+    if not re.search(r"\d", text):
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    for fmt in MONTH_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m")
+        except ValueError:
+            pass
+    return None
+
+
+def _clean_text(text: str) -> str:
+    return " ".join(text.lower().split()).strip("\"'` ").rstrip(".")
+
+
+def _canonical_atom(text: str) -> str:
+    text = _clean_text(text)
+    if text in YES_ANSWERS:
+        return "yes"
+    if text in NO_ANSWERS:
+        return "no"
+    for parse in (_canonical_number, _canonical_date):
+        value = parse(text)
+        if value is not None:
+            return value
+    return text
+
+
+def canonicalize_answer(answer) -> str:
+    """
+    Map equivalent surface forms of an answer to one voting key, e.g.
+    "$1,200", "1200.0" -> "1200"; "Supports" -> "yes"; "b, a" -> "a, b".
+    """
+    if answer is None:
+        return ""
+    if isinstance(answer, (list, tuple, set)):
+        parts = [str(item) for item in answer]
+    else:
+        text = str(answer).strip()
+        atom = _canonical_atom(text)
+        parts = re.split(r"\s*[;,|]\s*|\s+and\s+", text)
+        if len(parts) == 1 or atom != _clean_text(text):
+            # a single value, or a number/date/boolean that contains separators
+            return atom
+    parts = [_canonical_atom(part) for part in parts]
+    return ", ".join(sorted(part for part in parts if part != ""))
+
+
+def majority_vote(answers: List[Any], key=canonicalize_answer) -> Tuple[str, int]:
+    """
+    Vote over answers grouped by their canonical form.
+
+    Returns:
+        The most frequent original form within the winning group and the
+        group size; ("", 0) if all answers are empty.
+    """
+    groups = {}
+    for answer in answers:
+        canonical = key(answer)
+        if canonical == "":
+            continue
+        groups.setdefault(canonical, []).append(answer)
+    if not groups:
+        return "", 0
+    # max keeps the first group seen on ties
+    winner = max(groups.values(), key=len)
+    return Counter(winner).most_common(1)[0][0], len(winner)
+
+
 def dfcode2str(dfcode: str) -> str:
     """Convert DataFrame code to string representation."""
     try:
@@ -374,32 +657,167 @@ def extract_code_from_response(response: str, model_name: str = None) -> str:
     return raw_code
 
 
-def execute_table_code(code: str, table_df: str, df_path: str = None, model_name: str = None) -> Tuple[Any, List[List[Any]], Exception, str]:
-    """Execute table manipulation code safely using original MACT approach with robust column name handling."""
+@lru_cache(maxsize=256)
+def _setup_namespace(table_df: str) -> Dict[str, Any]:
+    """Variables defined by DataFrame setup code, computed once per setup code."""
+    import numpy as np
+    namespace = {}
+    exec(table_df, {'pd': pd, 'pandas': pd, 'np': np, 'numpy': np}, namespace)
+    return namespace
+
+
+@lru_cache(maxsize=256)
+def schema_validator(table_df: str, df_path: str = None) -> SchemaValidator:
+    """Column validator for the tables of setup code (and the dataset at df_path), built once per schema."""
+    frames = {name: value.columns for name, value in _setup_namespace(table_df).items()
+              if isinstance(value, pd.DataFrame)}
+    if df_path:
+        import pyarrow.parquet as pq
+        frames['original_df'] = pq.read_schema(df_path).names
+    return SchemaValidator(frames)
+
+
+_cow_lock = threading.Lock()
+_cow_state = {"users": 0, "saved": None}
+
+
+@contextmanager
+def copy_on_write():
+    """
+    pandas copy-on-write while the block runs: a shallow copy of a cached
+    frame then behaves as an independent copy, its data is only copied when
+    generated code writes to it. The option is process wide, so blocks
+    overlapping in several threads share it and the last one restores it.
+    Without the option (older pandas) the block runs unchanged.
+    """
+    with _cow_lock:
+        if _cow_state["users"] == 0:
+            try:
+                _cow_state["saved"] = pd.get_option("mode.copy_on_write")
+                pd.set_option("mode.copy_on_write", True)
+            except (KeyError, ValueError):
+                _cow_state["saved"] = None
+        _cow_state["users"] += 1
+    try:
+        yield
+    finally:
+        with _cow_lock:
+            _cow_state["users"] -= 1
+            if _cow_state["users"] == 0 and _cow_state["saved"] is not None:
+                pd.set_option("mode.copy_on_write", _cow_state["saved"])
+
+
+def copy_on_write_active() -> bool:
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except (KeyError, ValueError):
+        return False
+
+
+def isolated(value: Any) -> Any:
+    """
+    Copy of a cached value that generated code can mutate without changing
+    the original; shallow inside copy_on_write(), where the code must then run too.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=not copy_on_write_active())
+    if isinstance(value, dict) and all(isinstance(column, list) for column in value.values()):
+        # the data dict of setup code holds immutable cells, copying its lists is enough
+        return {name: list(column) for name, column in value.items()}
+    return copy.deepcopy(value)
+
+
+@lru_cache(maxsize=8)
+def load_dataset(df_path: str) -> pd.DataFrame:
+    """DataFrame of a parquet dataset, loaded once per path; read only, use isolated() to execute code."""
+    return pd.read_parquet(df_path, engine='pyarrow')
+
+
+def setup_namespace(table_df: str) -> Dict[str, Any]:
+    """Copy of the variables of DataFrame setup code, safe to mutate; shallow copies within copy_on_write()."""
+    return {name: isolated(value)
+            for name, value in _setup_namespace(table_df).items()
+            if not callable(value) and not isinstance(value, type(re))}
+
+
+def schema_code(table_df: str, num_row: int = 3) -> str:
+    """
+    Prompt view of DataFrame setup code: for every DataFrame it defines, the
+    shape, dtypes and first rows. The frames themselves are provided at
+    execution time, so code prompts do not grow with the tables. Setup code
+    whose tables have at most num_row rows is returned unchanged.
+    """
+    try:
+        frames = {name: value for name, value in _setup_namespace(table_df).items()
+                  if isinstance(value, pd.DataFrame)}
+    except Exception:
+        return table_df
+    if not frames or all(len(df) <= num_row for df in frames.values()):
+        return table_df
+    lines = ["import pandas as pd", "import numpy as np"]
+    for name, df in frames.items():
+        dtypes = {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+        head = {str(col): values for col, values in df.head(num_row).to_dict("list").items()}
+        lines += [f"# {name} is already loaded with all {len(df)} rows and {len(df.columns)} columns; use it as is and do not redefine it.",
+                  f"# {name} dtypes: {dtypes}",
+                  f"# {name} first {min(num_row, len(df))} rows: {head}"]
+    lines += [line for line in table_df.split("\n") if line.strip().startswith("#")]
+    return "\n".join(lines)
+
+
+RESULT_VARIABLES = ('new_table', 'final_result', 'result', 'answer')
+
+
+def execute_table_code(code: str, table_df: str, df_path: str = None, model_name: str = None,
+                       executor=None, tool: str = "table_code",
+                       limits: Tuple[int, int, int] = DEFAULT_OBSERVATION_LIMITS) -> Tuple[Any, List[List[Any]], Exception, str]:
+    """
+    Execute table manipulation code safely using original MACT approach with robust column name handling.
+    With a sandbox executor (utils/sandbox.py) the code runs in a worker process under its limits.
+    Programs equivalent to one already run on the same tables are answered by the execution cache.
+    Results over the (max_rows, max_chars, max_tokens) limits are rendered as a summary; rows hold the full table.
+    """
+    # responses differing only outside the program (prose, fences) share an entry
+    executable_code = extract_program(code, model_name)
+
+    def run():
+        # code samples share the cached tables and datasets through copy-on-write copies
+        with copy_on_write():
+            return _execute_table_code(executable_code, table_df, df_path, executor, limits)
+
+    return execution_cache.run(tool, fingerprint(table_df, df_path), executable_code, run, outputs=limits)
+
+
+def extract_program(code: str, model_name: str = None) -> str:
+    """Program of a code response: its first python code block (original MACT approach), else the code-like lines."""
+    code_matches = re.findall(r"```(?:Python|python).*?```", code, re.DOTALL)
+    if code_matches:
+        return "\n".join(code_matches[0].split("\n")[1:-1])
+    return extract_code_from_response(code, model_name=model_name)
+
+
+def _execute_table_code(executable_code: str, table_df: str, df_path: str = None, executor=None,
+                        limits: Tuple[int, int, int] = DEFAULT_OBSERVATION_LIMITS
+                        ) -> Tuple[Any, List[List[Any]], Exception, str]:
     result = ""
     rows = []
     current_error = None
-    executable_code = None
 
     try:
-        # Extract executable code (original MACT approach)
-        p = re.compile(r"```(?:Python|python).*?```", re.DOTALL)
-        code_matches = re.findall(p, code)
-
-        if code_matches:
-            executable_code = code_matches[0]
-            executable_code = "\n".join(executable_code.split("\n")[1:-1])
-        else:
-            executable_code = extract_code_from_response(code, model_name=model_name)
-
         if not executable_code:
             return "", [], None, None
 
-        # 🎯 Phase 3-A Fix: Preprocess code to fix column name issues
-        executable_code = _fix_column_references(executable_code, table_df)
-
-        # Original MACT approach: combine table_df with executable_code
-        combined_code = "\n".join([table_df, executable_code]) if table_df else executable_code
+        # Tables are injected from the (cached) setup code; if it cannot run
+        # on its own, fall back to prepending it like original MACT
+        local_vars = {}
+        combined_code = executable_code
+        table_key = None
+        if table_df:
+            try:
+                local_vars.update(setup_namespace(table_df))
+                table_key = fingerprint(table_df, df_path)
+            except Exception:
+                combined_code = "\n".join([table_df, executable_code])
 
         # Debug logging
         print(f"DEBUG: Executing combined code ({len(combined_code)} chars)")
@@ -417,37 +835,30 @@ def execute_table_code(code: str, table_df: str, df_path: str = None, model_name
             'np': np,
             'numpy': np
         }
-        local_vars = {}
 
         # Load original dataframe if available
         if df_path:
-            local_vars['original_df'] = pd.read_parquet(df_path, engine='pyarrow')
+            local_vars['original_df'] = isolated(load_dataset(df_path))
+
+        # Check syntax and column references against the schema before running:
+        # near-miss column names are corrected, hopeless programs rejected
+        if table_key is not None:
+            executable_code = combined_code = schema_validator(table_df, df_path).check(executable_code)
 
         # Execute combined code (original MACT approach)
-        exec(combined_code, global_vars, local_vars)
+        if executor is not None:
+            # a fork-server executor keeps the tables resident under their fingerprint
+            local_vars = executor.run(combined_code, local_vars, RESULT_VARIABLES, table=table_key)
+        else:
+            exec(combined_code, global_vars, local_vars)
 
         # Original MACT expects 'new_table' variable
         if 'new_table' in local_vars:
             new_table = local_vars['new_table']
             print(f"DEBUG: Found new_table variable: {type(new_table)}")
 
-            # Convert to appropriate format (original MACT logic)
-            if isinstance(new_table, pd.Series):
-                new_table = new_table.to_frame()
-
-            if isinstance(new_table, pd.DataFrame) and not new_table.empty:
-                # Convert to string format (original MACT approach)
-                header = new_table.columns.tolist()
-                rows = new_table.values.tolist()
-                rows.insert(0, header)
-
-                if len(new_table) > 10:
-                    remain_line = len(new_table) - 4
-                    result = table_linear(rows, num_row=3) + f"\n ...[remaining {remain_line} rows not shown due to large table size]..."
-                    rows = rows[:4]  # Keep header + 3 rows
-                else:
-                    result = table_linear(rows, num_row=None)
-
+            if isinstance(new_table, (pd.Series, pd.DataFrame)) and not new_table.empty:
+                result, rows = render_result(new_table, *limits)
                 print(f"DEBUG: Generated table result ({len(result)} chars)")
             else:
                 print("DEBUG: new_table is empty or not a DataFrame")
@@ -461,27 +872,9 @@ def execute_table_code(code: str, table_df: str, df_path: str = None, model_name
                     fallback_result = local_vars[var_name]
                     print(f"DEBUG: Using fallback variable '{var_name}': {type(fallback_result)}")
 
-                    # Convert fallback result to table format
-                    if isinstance(fallback_result, pd.Series):
-                        fallback_result = fallback_result.to_frame()
-
-                    if isinstance(fallback_result, pd.DataFrame) and not fallback_result.empty:
-                        header = fallback_result.columns.tolist()
-                        rows = fallback_result.values.tolist()
-                        rows.insert(0, header)
-
-                        if len(fallback_result) > 10:
-                            remain_line = len(fallback_result) - 4
-                            result = table_linear(rows, num_row=3) + f"\n ...[remaining {remain_line} rows not shown due to large table size]..."
-                            rows = rows[:4]  # Keep header + 3 rows
-                        else:
-                            result = table_linear(rows, num_row=None)
-
-                        print(f"DEBUG: Converted fallback to table result ({len(result)} chars)")
-                        break
-                    else:
-                        result = str(fallback_result)
-                        break
+                    result, rows = render_result(fallback_result, *limits)
+                    print(f"DEBUG: Rendered fallback result ({len(result)} chars)")
+                    break
 
         if not isinstance(result, str):
             result = str(result)
@@ -495,161 +888,3 @@ def execute_table_code(code: str, table_df: str, df_path: str = None, model_name
 
     return result, rows, current_error, executable_code
 
-
-def _fix_column_references(code: str, table_df_code: str = None) -> str:
-    """
-    Fix column reference issues in generated code to prevent KeyError.
-    This addresses the critical 'department_ID' error and similar column name mismatches.
-    Enhanced to handle multi-table scenarios with robust column normalization.
-    """
-    if not code:
-        return code
-
-    # Extract actual column names from table_df_code (handles both single and multi-table scenarios)
-    actual_columns = set()
-    if table_df_code:
-        # Extract column names from all data dictionaries in the setup code
-        import re
-        data_pattern = r"data=\{([^}]+)\}"
-        data_matches = re.findall(data_pattern, table_df_code)
-        for data_content in data_matches:
-            # Extract keys (column names)
-            key_pattern = r"'([^']+)':"
-            column_matches = re.findall(key_pattern, data_content)
-            actual_columns.update(column_matches)
-
-    # 🎯 Critical Multi-Table Fix: Normalize all table column references to a consistent format
-    # This is the root cause of JOIN failures - inconsistent column naming between tables
-    if actual_columns:
-        # Create bidirectional mapping for all department/head ID variations
-        dept_columns = [col for col in actual_columns if 'department' in col.lower() and 'id' in col.lower()]
-        head_columns = [col for col in actual_columns if 'head' in col.lower() and 'id' in col.lower()]
-
-        # If we have mixed case department columns, normalize to the most common format
-        if dept_columns:
-            # Choose the most frequent format or default to 'Department_ID'
-            target_dept_col = 'Department_ID' if 'Department_ID' in dept_columns else dept_columns[0]
-            for col in dept_columns:
-                if col != target_dept_col:
-                    # Replace all references to this column with the target format
-                    patterns = [f"'{col}'", f'"{col}"', f"['{col}']", f'["{col}"]', f"on='{col}'", f'on="{col}"']
-                    replacements = [f"'{target_dept_col}'", f'"{target_dept_col}"', f"['{target_dept_col}']", f'["{target_dept_col}"]', f"on='{target_dept_col}'", f'on="{target_dept_col}"']
-                    for pattern, replacement in zip(patterns, replacements):
-                        if pattern in code:
-                            code = code.replace(pattern, replacement)
-                            print(f"DEBUG: Normalized column: {pattern} -> {replacement}")
-
-        # Same for head columns
-        if head_columns:
-            target_head_col = 'head_ID' if 'head_ID' in head_columns else head_columns[0]
-            for col in head_columns:
-                if col != target_head_col:
-                    patterns = [f"'{col}'", f'"{col}"', f"['{col}']", f'["{col}"]', f"on='{col}'", f'on="{col}"']
-                    replacements = [f"'{target_head_col}'", f'"{target_head_col}"', f"['{target_head_col}']", f'["{target_head_col}"]', f"on='{target_head_col}'", f'on="{target_head_col}"']
-                    for pattern, replacement in zip(patterns, replacements):
-                        if pattern in code:
-                            code = code.replace(pattern, replacement)
-                            print(f"DEBUG: Normalized column: {pattern} -> {replacement}")
-
-    # Common column name mapping patterns from MMQA dataset
-    column_mappings = {
-        # Department-related columns
-        'department_ID': ['Department_ID', 'department_id', 'dept_id'],
-        'Department_ID': ['department_ID', 'department_id', 'dept_id'],
-        'department_id': ['Department_ID', 'department_ID', 'dept_id'],
-
-        # Head-related columns
-        'head_ID': ['Head_ID', 'head_id'],
-        'Head_ID': ['head_ID', 'head_id'],
-        'head_id': ['Head_ID', 'head_ID'],
-
-        # Other common patterns
-        'Host_city_ID': ['host_city_ID', 'Host_City_ID', 'host_city_id'],
-        'host_city_ID': ['Host_city_ID', 'Host_City_ID', 'host_city_id'],
-
-        # Temporary acting column variations
-        'temporary_acting': ['Temporary_Acting', 'temporary_Acting', 'Temporary_acting'],
-        'Temporary_Acting': ['temporary_acting', 'temporary_Acting', 'Temporary_acting'],
-    }
-
-    fixed_code = code
-
-    # Strategy 1: Use actual columns from table_df_code if available
-    if actual_columns:
-        # Create case-insensitive mapping
-        column_map = {}
-        for actual_col in actual_columns:
-            # Map variations to the actual column name
-            variations = [
-                actual_col.lower(),
-                actual_col.upper(),
-                actual_col.replace('_', '').lower(),
-                actual_col.replace('_', '').upper()
-            ]
-            for variation in variations:
-                if variation != actual_col:
-                    column_map[variation] = actual_col
-
-        # Apply the mapping
-        for wrong_name, correct_name in column_map.items():
-            # Replace column references in various contexts
-            patterns = [
-                f"'{wrong_name}'",  # String literals
-                f'"{wrong_name}"',  # Double quoted strings
-                f"['{wrong_name}']",  # DataFrame column access
-                f'["{wrong_name}"]',  # DataFrame column access with double quotes
-            ]
-
-            replacements = [
-                f"'{correct_name}'",
-                f'"{correct_name}"',
-                f"['{correct_name}']",
-                f'["{correct_name}"]',
-            ]
-
-            for pattern, replacement in zip(patterns, replacements):
-                if pattern in fixed_code:
-                    fixed_code = fixed_code.replace(pattern, replacement)
-                    print(f"DEBUG: Fixed column reference: {pattern} -> {replacement}")
-
-    # Strategy 2: Apply common MMQA column mappings
-    for wrong_name, possible_correct in column_mappings.items():
-        if actual_columns:
-            # Find the correct name that exists in actual columns
-            correct_name = None
-            for candidate in possible_correct:
-                if candidate in actual_columns:
-                    correct_name = candidate
-                    break
-
-            if correct_name:
-                patterns = [
-                    f"'{wrong_name}'",
-                    f'"{wrong_name}"',
-                    f"['{wrong_name}']",
-                    f'["{wrong_name}"]',
-                ]
-
-                replacements = [
-                    f"'{correct_name}'",
-                    f'"{correct_name}"',
-                    f"['{correct_name}']",
-                    f'["{correct_name}"]',
-                ]
-
-                for pattern, replacement in zip(patterns, replacements):
-                    if pattern in fixed_code:
-                        fixed_code = fixed_code.replace(pattern, replacement)
-                        print(f"DEBUG: Applied MMQA column mapping: {pattern} -> {replacement}")
-
-    # Strategy 3: Fix common pandas operation issues
-    # Fix merge column specification issues
-    merge_patterns = [
-        (r"merge\([^,]+,\s*on='([^']+)'\)", r"merge(df2, on='\1', how='inner')"),
-        (r'merge\([^,]+,\s*on="([^"]+)"\)', r'merge(df2, on="\1", how="inner")')
-    ]
-
-    for pattern, replacement in merge_patterns:
-        fixed_code = re.sub(pattern, replacement, fixed_code)
-
-    return fixed_code
\ No newline at end of file
@@ -4,6 +4,7 @@ Basic tests for MACT LangGraph implementation.
 
 import pytest
 import asyncio
+import importlib
 import sys
 import os
 
@@ -15,9 +16,35 @@ from mact_langgraph.state import (
     create_initial_state
 )
 from mact_langgraph.graph import MACTGraph, run_mact_on_question_async
-from mact_langgraph.utils.table_utils import table_linear, table2df, exact_match
+from mact_langgraph.utils.table_utils import (
+    table_linear, table2df, exact_match, canonicalize_answer, majority_vote,
+    schema_code, execute_table_code, render_result, render_observation, result_fingerprint, ResultVote,
+    setup_namespace, _setup_namespace, isolated, load_dataset, copy_on_write
+)
 from mact_langgraph.utils.action_utils import parse_action, parse_thought_action
 from mact_langgraph.utils.mmqa_utils import process_mmqa_tables
+from mact_langgraph.nodes.rollout import RolloutEngine
+from mact_langgraph.utils.prompt_utils import build_react_prompt, MMQA_REACT_EXAMPLES
+from mact_langgraph.utils.retrieval import BM25Index
+from mact_langgraph.utils.scratchpad import compact_scratchpad, state_table_handle
+from mact_langgraph.utils.routing import (
+    route_model, profile_route, note_usage, route_report, reset_route_profiles
+)
+from mact_langgraph.utils.prompt_stats import prompt_report, reset_prompt_stats
+from mact_langgraph.utils.sandbox import CodeExecutor, ForkServerExecutor
+from mact_langgraph.utils.prompt_utils import build_code_generation_prompt
+from mact_langgraph.utils.exec_cache import ExecutionCache, canonical_code
+from mact_langgraph.utils.code_validation import CodeValidationError, SchemaValidator
+from mact_langgraph.utils.sql_backend import execute_table_sql, table_backend
+
+
+def code_module(name):
+    """A module of the original implementation in code/, which imports its siblings by their flat names."""
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'code'))
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.pop(0)
 
 
 class TestState:
@@ -95,6 +122,29 @@ class TestUtils:
         assert "| Alice | 25 |" in result
         assert "| Bob | 30 |" in result
 
+    def test_render_result(self):
+        """Test in-memory rendering of execution results."""
+        import numpy as np
+        import pandas as pd
+
+        text, rows = render_result(pd.DataFrame({"a": range(12)}), max_rows=10)
+        assert rows == [["a"]] + [[i] for i in range(12)]
+        assert "12 rows x 1 columns" in text and "| 11 |" in text and "| 6 |" not in text
+        assert render_result(pd.Series([1, 2], name="x")) == ("| x |\n| 1 |\n| 2 |\n", [["x"], [1], [2]])
+        assert render_result(np.int64(3)) == ("3", [])
+        assert render_result("done") == ("done", [])
+
+    def test_render_observation(self):
+        """Large results are observed as a summary within the caps."""
+        rows = [["city", "population"]] + [[f"c{i}", i * 1000] for i in range(500)] + [["c500", None]]
+        text = render_observation(rows, max_rows=20, max_chars=4000)
+        assert "501 rows x 2 columns" in text
+        assert "population (numeric, min 0, max 499000" in text and "1 missing" in text
+        assert "city (text, 501 distinct" in text
+        assert "| c0 | 0 |" in text and "| c500 | None |" in text and "| c250 |" not in text
+        assert len(render_observation(rows, max_rows=0, max_chars=300)) <= 300 + len("\n...[truncated]")
+        assert render_observation(rows[:3], max_rows=20, max_chars=4000) == table_linear(rows[:3], num_row=None)
+
     def test_table2df(self):
         """Test table to DataFrame code generation."""
         table = [
@@ -117,6 +167,23 @@ class TestUtils:
         assert exact_match("Treasury Dept", "treasury") is False
         assert exact_match("123", "123.0") is True
 
+    def test_canonicalize_answer(self):
+        """Test equivalent answers share a voting key."""
+        assert canonicalize_answer("1,200") == canonicalize_answer("1200.0") == canonicalize_answer("$1200")
+        assert canonicalize_answer("(1,200)") == "-1200"
+        assert canonicalize_answer("12%") == "12"
+        assert canonicalize_answer("Supports") == canonicalize_answer("yes")
+        assert canonicalize_answer("refutes") == "no"
+        assert canonicalize_answer("March 5, 2019") == "2019-03-05"
+        assert canonicalize_answer("B, a") == canonicalize_answer("a and b")
+
+    def test_majority_vote(self):
+        """Test voting groups canonical forms and keeps an original answer."""
+        answer, count = majority_vote(["1,200", "1300", "1200.0", "1300", "$1,200", ""])
+        assert answer == "1,200"
+        assert count == 3
+        assert majority_vote(["", None]) == ("", 0)
+
     def test_parse_action(self):
         """Test action parsing."""
         action_type, argument = parse_action("Retrieve[data from table]")
@@ -131,6 +198,30 @@ class TestUtils:
         assert action_type is None
         assert argument is None
 
+    def test_result_vote(self):
+        """Results differing only in row/column order or number formatting vote together."""
+        rows = [["name", "score"], ["a", 5], ["b", 7.5]]
+        same = [["score", "name"], [7.5, "b"], ["5", "a"]]
+        assert result_fingerprint(rows) == result_fingerprint(same)
+        assert result_fingerprint(rows, ordered=True) != result_fingerprint(rows[:1] + rows[:0:-1], ordered=True)
+
+        vote = ResultVote()
+        first = vote.add(rows)
+        assert vote.add(same) == first
+        vote.add([["name", "score"], ["c", 1]])
+        winner_rows, text, count = vote.winner()
+        assert winner_rows == rows and text == first and count == 2
+        assert vote.find(first) == (rows, 0)
+
+        # an exact text wins over groups containing it, a text several groups contain is ambiguous
+        vote = ResultVote(ordered=True)
+        short, long = [["x"], [1]], [["x"], [1], [12]]
+        vote.add(short, "| x |\n| 1 |")
+        vote.add(long, "| x |\n| 1 |\n| 12 |")
+        assert vote.find("| x |\n| 1 |") == (short, 0)
+        assert vote.find("| 1 |\n| 12 |") == (long, 1)
+        assert vote.find("| 1 |") is None
+
     def test_parse_thought_action(self):
         """Test thought-action parsing."""
         response = """Thought: I need to find the data
@@ -167,6 +258,519 @@ class TestMMQAUtils:
         assert table.linear_representation is not None
 
 
+@pytest.mark.asyncio
+class TestRollout:
+    """Test rollout action selection."""
+
+    async def test_select_majority_finish(self):
+        """Finish branches are scored by agreement without any LLM call."""
+        def finish(answer):
+            return ActionCandidate(
+                thought="done",
+                action=f"Finish[{answer}]",
+                action_type=ActionType.FINISH,
+                argument=answer,
+                raw_response=f"Thought: done\nAction: Finish[{answer}]"
+            )
+
+        candidates = [finish("Paris"), finish("paris"), finish("Lyon")]
+        engine = RolloutEngine(depth=2, max_llm_calls=5)
+        state = create_initial_state("Capital?", [])
+
+        selected = await engine.select(candidates, state)
+
+        assert selected.argument == "Paris"
+        assert engine.history[-1]["llm_calls"] == 0
+
+    async def test_engines_are_per_run(self):
+        """Two runs of the same question get separate engines, released when done."""
+        from mact_langgraph.nodes.rollout import get_rollout_engine, release_rollout_engine
+
+        first, second = create_initial_state("Capital?", []), create_initial_state("Capital?", [])
+        engine = get_rollout_engine(first)
+        assert get_rollout_engine(first) is engine and get_rollout_engine(second) is not engine
+        release_rollout_engine(first)
+        release_rollout_engine(second)
+        assert get_rollout_engine(first) is not engine
+        release_rollout_engine(first)
+
+
+class TestRouting:
+    """Test per call site model routing."""
+
+    def test_route_falls_back_to_plan_and_code_model(self):
+        state = create_initial_state("Q?", [], config={
+            "plan_model": "gpt-4o", "code_model": "gpt-4o-mini",
+            "model_routes": {"evaluator": "gpt-3.5-turbo"}
+        })
+        assert route_model(state, "evaluator") == "gpt-3.5-turbo"
+        assert route_model(state, "plan") == "gpt-4o"
+        assert route_model(state, "retrieve_code") == "gpt-4o-mini"
+
+    def test_profile_records_failures(self):
+        reset_route_profiles()
+        with profile_route("retrieve_code", "m") as record:
+            record["success"] = True
+        with pytest.raises(ValueError):
+            with profile_route("retrieve_code", "m"):
+                raise ValueError("boom")
+        report = route_report()["retrieve_code"]
+        assert report["calls"] == 2
+        assert report["success_rate"] == 0.5
+
+    def test_cached_tokens_are_recorded(self):
+        reset_route_profiles()
+        note_usage({"input_tokens": 10})  # outside a profiled call: ignored
+        with profile_route("plan", "m"):
+            note_usage({"input_tokens": 100, "input_token_details": {"cache_read": 80}})
+        report = route_report()["plan"]
+        assert report["prompt_tokens"] == 100
+        assert report["cache_hit_rate"] == 0.8
+
+    def test_prompt_puts_question_after_tables(self):
+        table = {"name": "t", "columns": ["a"], "content": [["1"]]}
+        prompt = build_react_prompt(create_initial_state("Which a?", [table]))
+        assert prompt.index("Table: t") < prompt.index("Question: Which a?") < prompt.index("Current reasoning")
+
+
+class TestFewShotSelection:
+    """Test BM25 selection of ReAct examples."""
+
+    def test_bm25_ranks_overlapping_doc_first(self):
+        index = BM25Index(["average age of heads", "employees per department"])
+        assert index.top_k("department employees", 1) == [1]
+
+    def test_prompt_keeps_most_relevant_example(self):
+        state = create_initial_state(
+            "What is the average age of temporary acting heads?", [],
+            config={"fewshot_k": 1})
+        prompt = build_react_prompt(state)
+        assert "average age of department heads" in prompt
+        assert "largest number of employees" not in prompt
+        assert "Example 1:" in prompt and "Example 2:" not in prompt
+
+    def test_default_keeps_all_examples(self):
+        prompt = build_react_prompt(create_initial_state("Q?", []))
+        assert MMQA_REACT_EXAMPLES in prompt
+
+
+class TestScratchpadCompaction:
+    """Test token-bounded scratchpad compaction."""
+
+    def _scratchpad(self):
+        rows = "\n".join(f"| {i} | v{i} |" for i in range(40))
+        return (f"Thought 1: look\nAction 1: Retrieve[all]\nObservation 1: | id | val |\n{rows}\n"
+                f"Thought 2: again\nAction 2: Retrieve[all]\nObservation 2: | id | val |\n{rows}\n")
+
+    def test_old_table_replaced_by_reference(self):
+        tables = [{"name": "retrieved_step_1_attempt_0"}]
+        compacted = compact_scratchpad(self._scratchpad(), 200, state_table_handle(tables))
+        assert "[table df_retrieved_step_1_attempt_0: 40 rows x 2 columns" in compacted
+        assert "Action 1: Retrieve[all]" in compacted
+        # the latest observation stays verbatim
+        assert "| 39 | v39 |" in compacted.split("Observation 2:")[1]
+        assert "| 39 | v39 |" not in compacted.split("Observation 2:")[0]
+        # compaction is idempotent
+        assert compact_scratchpad(compacted, 200) == compacted
+
+    def test_under_budget_unchanged(self):
+        scratchpad = self._scratchpad()
+        assert compact_scratchpad(scratchpad, 10 ** 6) == scratchpad
+
+
+class TestSchemaCodePrompts:
+    """Test schema-only code prompts with tables injected at execution."""
+
+    def _df_code(self, n):
+        return table2df([["name", "age"]] + [[f"p{i}", str(i)] for i in range(n)])
+
+    def test_schema_does_not_grow_with_table(self):
+        small, large = schema_code(self._df_code(10)), schema_code(self._df_code(1000))
+        assert "all 1000 rows" in large and "p999" not in large
+        assert len(large) - len(small) < 10
+
+    def test_short_table_kept_in_full(self):
+        df_code = self._df_code(2)
+        assert schema_code(df_code) == df_code
+
+    def test_code_runs_on_full_injected_table(self):
+        df_code = self._df_code(50)
+        code = "```python\nnew_table = df[df['age'] > 45]\n```"
+        _, rows, error, _ = execute_table_code(code, df_code)
+        assert error is None and len(rows) == 5
+        # the cached frame is not changed by generated code
+        execute_table_code("```python\ndf.drop(columns=['age'], inplace=True)\nnew_table = df\n```", df_code)
+        _, rows, _, _ = execute_table_code(code, df_code)
+        assert len(rows) == 5
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = CodeExecutor(workers=2, timeout=3, memory_mb=None)
+    yield executor
+    executor.close()
+
+
+class TestSandbox:
+    """Test sandboxed execution of generated code."""
+
+    def test_table_code_runs_in_worker(self, executor):
+        df_code = table2df([["name", "age"]] + [[f"p{i}", str(i)] for i in range(20)])
+        code = "```python\nnew_table = df[df['age'] > 17]\n```"
+        _, rows, error, _ = execute_table_code(code, df_code, executor=executor)
+        assert error is None and len(rows) == 3
+
+    def test_limits_and_restricted_builtins(self, executor):
+        results = executor.map(lambda code: executor.execute(code, {}),
+                               ["while True: pass", "import os", "open('f')", "result = 1 + 1"])
+        assert results[0]["timed_out"]
+        assert "not allowed" in results[1]["error"]
+        assert results[2]["error"].startswith("NameError")
+        assert results[3]["values"] == {"result": 2}
+        # the timed out worker was replaced
+        assert executor.run("result = 3") == {"result": 3}
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="fork server needs os.fork")
+    def test_fork_server_keeps_tables_resident(self):
+        import pandas as pd
+        executor = ForkServerExecutor(workers=2, timeout=2, memory_mb=None)
+        try:
+            namespace = {"df": pd.DataFrame({"a": [1, 2, 3]})}
+            codes = ["df['a'] = 0\nresult = 1", "result = int(df['a'].sum())", "while True: pass"]
+            results = executor.map(lambda code: executor.execute(code, namespace, table="t"), codes)
+            assert results[0]["values"] == {"result": 1}
+            # each program runs in its own child, so the mutation above is not visible
+            assert results[1]["values"] == {"result": 6}
+            assert results[2]["timed_out"]
+            # the table is already loaded in the server
+            assert executor.run("result = len(df)", {}, table="t") == {"result": 3}
+        finally:
+            executor.close()
+
+
+class TestPromptStats:
+    """Test per-section prompt token accounting."""
+
+    def test_react_prompt_sections_sum_to_total(self):
+        reset_prompt_stats()
+        table = {"name": "t", "columns": ["a"], "content": [["1"]]}
+        build_react_prompt(create_initial_state("Which a?", [table]))
+        build_react_prompt(create_initial_state("Which b?", [table]))
+        report = prompt_report()["plan"]
+        assert report["calls"] == 2
+        sections = report["sections"]
+        assert sum(s["tokens"] for s in sections.values()) == report["total_tokens"]
+        assert sections["examples"]["share"] > sections["question"]["share"] > 0
+
+    def test_code_prompt_recorded(self):
+        reset_prompt_stats()
+        build_code_generation_prompt("count rows", "df = pd.DataFrame({'a': [1]})")
+        assert set(prompt_report()["code_generation"]["sections"]) >= {"instructions", "table", "question"}
+
+
+
+class TestCodeValidation:
+    """Test static validation of generated code against the table schema."""
+
+    def test_near_misses_corrected(self):
+        validator = SchemaValidator({"df": ["Name", "Age", "Department_ID"],
+                                     "df2": ["department_id", "Budget"]})
+        code, fixes, errors = validator.validate(
+            "m = df.merge(df2, left_on='department_id', right_on='Department_ID')\n"
+            "new_table = m[m['age'] > 3][['name', 'budget']]")
+        assert not errors
+        assert "left_on='Department_ID', right_on='department_id'" in code
+        assert "m['Age']" in code and "['Name', 'Budget']" in code
+        # columns the program creates are left alone
+        code, fixes, _ = validator.validate("df['name2'] = df['Name']\nresult = df['name2']")
+        assert fixes == []
+
+    def test_derived_labels_left_alone(self):
+        validator = SchemaValidator({"df": ["Name", "Age", "Value"]})
+        for code in ("new_table = df.melt(id_vars='Name')['value']",
+                     "counts = df['Name'].value_counts()\nresult = counts['value']",
+                     "s = df.set_index('Name')['Age']\nresult = s['age']"):
+            assert validator.validate(code) == (code, [], [])
+        # frames keeping the columns of a table are still corrected
+        code, fixes, _ = validator.validate("t = df[df['age'] > 3].sort_values('age')\nresult = t['name']")
+        assert "t['Name']" in code and ("age", "Age") in fixes
+
+    def test_hopeless_programs_rejected_without_running(self):
+        validator = SchemaValidator({"df": ["Name", "Age"]})
+        assert validator.validate("result = df['salary'].sum()")[2]
+        assert validator.validate("result = df.sortvalues('Age')")[2]
+        assert validator.validate("result = df[")[2][0].startswith("SyntaxError")
+        df_code = table2df([["name", "age"], ["a", "1"]])
+        _, rows, error, _ = execute_table_code("```python\nnew_table = df[df['salary'] > 1]\n```", df_code)
+        assert isinstance(error, CodeValidationError) and rows == []
+
+
+class TestSQLBackend:
+    """Test SQL execution on the embedded engine."""
+
+    def test_queries_on_registered_tables(self):
+        df_code = table2df([["name", "age"], ["a", "1"], ["b", "5"], ["c", "7"]])
+        result, rows, error, sql = execute_table_sql("```sql\nSELECT name FROM df WHERE age > 2;\n```", df_code)
+        assert error is None and sql == "SELECT name FROM df WHERE age > 2"
+        assert rows == [["name"], ["b"], ["c"]]
+        assert execute_table_sql("SELECT COUNT(*) FROM df", df_code)[0] == "3"
+        assert "Table df (name" in table_backend(df_code).schema()
+
+    def test_read_only(self):
+        df_code = table2df([["name"], ["a"]])
+        assert execute_table_sql("DROP TABLE df", df_code) == ("", [], None, None)
+        assert execute_table_sql("WITH x AS (SELECT 1) DELETE FROM df", df_code)[2] is not None
+        assert execute_table_sql("SELECT COUNT(*) FROM df", df_code)[0] == "1"
+
+
+class TestExecutionCache:
+    """Test execution memoization by table fingerprint and canonical program."""
+
+    def test_equivalent_programs_share_key(self):
+        a = "# count\nrows = df[df['a'] > 1]\nresult = len(rows)"
+        b = "filtered = df[df[\"a\"] > 1]   \nresult = len(filtered)"
+        assert canonical_code(a) == canonical_code(b)
+        assert canonical_code("result = len(df)") != canonical_code("result = len(df) + 1")
+
+    def test_variables_referenced_by_name_are_kept(self):
+        # the second programs fail on an undefined name, they must not share the first ones' entries
+        assert canonical_code("t = 3\nresult = df.query('a > @t')") != \
+            canonical_code("u = 3\nresult = df.query('a > @t')")
+        assert canonical_code("def f(a):\n    return a\nresult = f(a=1)") != \
+            canonical_code("def f(b):\n    return b\nresult = f(a=1)")
+        assert canonical_code("t = 3\nresult = eval('t')") != canonical_code("u = 3\nresult = eval('t')")
+
+    def test_fenced_programs_share_entry(self):
+        from mact_langgraph.utils.exec_cache import execution_cache
+
+        table = "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})"
+        first = "Filter the rows.\n```python\n# rows above one\nbig = df[df['a'] > 1]\nnew_table = big\n```"
+        second = "```python\nrows = df[df['a'] > 1]  # keep a > 1\nnew_table = rows\n```\nThis keeps two rows."
+        results = [execute_table_code(code, table, tool="fenced_test") for code in (first, second)]
+        assert results[0][1] == results[1][1] == [["a", "b"], [2, "y"], [3, "z"]]
+        assert execution_cache.report()["fenced_test"]["hits"] == 1
+
+    def test_hits_and_cached_errors(self):
+        cache = ExecutionCache()
+        calls = []
+
+        def run(value):
+            calls.append(value)
+            if value is None:
+                raise KeyError("x")
+            return value
+
+        assert cache.run("operate", "t1", "x = 1\nresult = x", lambda: run(1)) == 1
+        assert cache.run("operate", "t1", "y = 1\nresult = y", lambda: run(1)) == 1
+        assert cache.run("operate", "t2", "y = 1\nresult = y", lambda: run(2)) == 2
+        for _ in range(2):
+            with pytest.raises(KeyError):
+                cache.run("retrieve", "t1", "result = df['x']", lambda: run(None))
+        assert calls == [1, 2, None]
+        report = cache.report()
+        assert report["operate"]["hits"] == 1 and report["retrieve"]["hits"] == 1
+
+
+class TestCopyOnWrite:
+    """Test that code samples share cached tables without seeing each other's mutations."""
+
+    TABLE = "import pandas as pd\ndata = {'a': [1.0, 2.0, 3.0], 'b': ['x', 'y', 'z']}\ndf = pd.DataFrame(data)"
+
+    def test_namespaces_are_shallow_and_isolated(self):
+        import numpy as np
+        import pandas as pd
+
+        cached = _setup_namespace(self.TABLE)
+        with copy_on_write():
+            first = setup_namespace(self.TABLE)
+            assert np.shares_memory(first["df"]["a"].values, cached["df"]["a"].values)
+
+            first["df"].loc[0, "a"] = 100.0
+            first["df"]["b"] = first["df"]["b"].str.upper()
+            first["df"].drop(columns=["b"], inplace=True)
+            first["data"]["a"][0] = 100.0
+        # the option is scoped, outside of it namespaces are deep copies
+        assert pd.get_option("mode.copy_on_write") is False
+        second = setup_namespace(self.TABLE)
+        assert not np.shares_memory(second["df"]["a"].values, cached["df"]["a"].values)
+        for namespace in (cached, second):
+            assert namespace["df"]["a"].tolist() == [1.0, 2.0, 3.0]
+            assert namespace["df"]["b"].tolist() == ["x", "y", "z"]
+            assert namespace["data"]["a"] == [1.0, 2.0, 3.0]
+
+    def test_concurrent_samples_do_not_leak(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        codes = [f"```python\ndf.loc[df['a'] > 1, 'a'] = {i}\ndf.sort_values('a', inplace=True)\n"
+                 f"new_table = df[['a']]\n```" for i in range(8)]
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda code: execute_table_code(code, self.TABLE), codes))
+        for i, (_, rows, error, _) in enumerate(results):
+            assert error is None
+            assert sorted(row[0] for row in rows[1:]) == sorted([1.0, i, i])
+        assert _setup_namespace(self.TABLE)["df"]["a"].tolist() == [1.0, 2.0, 3.0]
+
+    def test_table_registry_namespaces(self):
+        import numpy as np
+        import pandas as pd
+
+        registry = code_module("table_registry").TableRegistry()
+        dfcode = "data = {'a': [1.0, 2.0, 3.0]}\ndf = pd.DataFrame(data)"
+        assert pd.get_option("mode.copy_on_write") is False
+        with registry.scope():
+            namespace = registry.namespace(dfcode)
+            assert np.shares_memory(namespace["df"]["a"].values, registry.frame(dfcode)["a"].values)
+            exec("df.loc[0, 'a'] = 100.0\ndf.sort_values('a', ascending=False, inplace=True)", {}, namespace)
+        assert pd.get_option("mode.copy_on_write") is False
+        assert registry.frame(dfcode)["a"].tolist() == [1.0, 2.0, 3.0]
+        assert namespace["df"]["a"].tolist() == [100.0, 3.0, 2.0]
+        assert registry.stats()["builds"] == 1
+
+    def test_dataset_loaded_once(self, monkeypatch):
+        import pandas as pd
+
+        reads = []
+        monkeypatch.setattr(pd, "read_parquet", lambda path, engine=None: reads.append(path) or
+                            pd.DataFrame({"score": [1, 2, 3]}))
+        load_dataset.cache_clear()
+        try:
+            first, second = isolated(load_dataset("data.parquet")), isolated(load_dataset("data.parquet"))
+            first["score"] *= 10
+            assert reads == ["data.parquet"]
+            assert second["score"].tolist() == [1, 2, 3]
+            assert load_dataset("data.parquet")["score"].tolist() == [1, 2, 3]
+        finally:
+            load_dataset.cache_clear()
+
+
+class TestBudgetPolicy:
+    """Test the difficulty-based budget allocation of code/budget_policy.py."""
+
+    def test_round_keeps_total_with_saturated_targets(self):
+        policy = code_module("budget_policy").DifficultyBudgetPolicy
+        assert policy._round([6.5, 6.5, 0.2], 9, 2, 6) == [4, 3, 2]
+        assert policy._round([9.0, 9.0, 9.0, 0.0], 8, 1, 4) == [3, 2, 2, 1]
+        # totals outside the bounds are clamped to them
+        assert policy._round([1.0, 1.0], 20, 1, 4) == [4, 4]
+
+    def test_allocate_keeps_mean(self):
+        policy = code_module("budget_policy").DifficultyBudgetPolicy(max_steps=2)
+        table = [["year", "sales"]] + [[str(2000 + i), str(i)] for i in range(200)]
+        items = [{"question": "what is the percentage difference in total sales", "tables": [table]}] * 2 + \
+                [{"question": "who won", "tables": []}] * 8
+        budgets = policy.allocate(items)
+        for knob, base in policy.base.items():
+            assert sum(b[knob] for b in budgets) == base * len(items)
+        # the base is at the lower bound, so nothing can be moved
+        assert [b["max_steps"] for b in budgets] == [2] * len(items)
+        assert budgets[0]["plan_sample"] > budgets[-1]["plan_sample"]
+
+
+class TestTableRelevance:
+    """Test the question-relevant table pruning of code/table_relevance.py."""
+
+    def _table(self, n_rows):
+        return [["Name", "Score", "City"]] + [[f"p{i}", str(3 * i), f"c{i % 4}"] for i in range(n_rows)]
+
+    def test_keeps_relevant_rows_of_large_table(self):
+        text, pruned = code_module("table_relevance").prune_table(self._table(40), "What is the score of p27?")
+        assert pruned
+        assert "| p27 | 81 | c3 |" in text
+        assert "[Showing 20 of 40 rows and 3 of 3 columns" in text
+
+    def test_small_table_is_kept_whole(self):
+        table = self._table(5)
+        text, pruned = code_module("table_relevance").prune_table(table, "What is the score of p3?")
+        assert not pruned
+        assert all(f"| p{i} |" in text for i in range(5))
+
+    def test_unmatched_question_keeps_first_rows(self):
+        text, pruned = code_module("table_relevance").prune_table(self._table(40), "zzz unrelated")
+        assert pruned
+        rows = [line for line in text.splitlines() if line.startswith("| p")]
+        assert rows == [f"| p{i} | {3 * i} | c{i % 4} |" for i in range(20)]
+
+    def test_token_budget(self):
+        prune_table = code_module("table_relevance").prune_table
+        count_tokens = code_module("retrieval").count_tokens
+        # a compact format that still holds every row is not flagged
+        text, pruned = prune_table(self._table(11), "score of p3", max_tokens=40)
+        assert not pruned and count_tokens(text) <= 40
+        assert "p10,30,c2" in text
+        # too small a budget falls back to a column summary, which is flagged
+        text, pruned = prune_table(self._table(11), "score of p3", max_tokens=8)
+        assert pruned and text.startswith("Table with 11 rows and 3 columns")
+
+
+class TestPassageRetriever:
+    """Test the BM25 context retrieval of code/retrieval.py."""
+
+    CONTEXT = " ".join([
+        "Paragraph 1: The company paid a dividend of 2 dollars per share in 2019.",
+        "Paragraph 2: Revenue grew in Europe thanks to new stores and strong holiday demand across the region.",
+        "Paragraph 3: The board approved a share buyback program worth 500 million over three years.",
+        "Paragraph 4: Employee headcount rose to 12000 people by the end of the fiscal year.",
+    ])
+
+    def test_keeps_ranked_paragraphs_in_context_order(self):
+        retriever = code_module("retrieval").PassageRetriever(self.CONTEXT)
+        assert retriever.select("What dividend per share was paid?", 20) == (
+            "Paragraph 1: The company paid a dividend of 2 dollars per share in 2019.", True)
+        text, reduced = retriever.select("What dividend and share buyback were approved?", 45)
+        assert reduced
+        assert text.startswith("Paragraph 1:") and "Paragraph 3:" in text
+        assert "Paragraph 2:" not in text and "Paragraph 4:" not in text
+
+    def test_nothing_to_retrieve_keeps_full_context(self):
+        retriever = code_module("retrieval").PassageRetriever(self.CONTEXT)
+        # fits the budget
+        assert retriever.select("What dividend was paid?", 200) == (self.CONTEXT, False)
+        # no question term in the context
+        assert retriever.select("Who is the chief executive?", 20) == (self.CONTEXT, False)
+        # no matching paragraph fits the budget
+        assert retriever.select("What dividend was paid?", 10) == (self.CONTEXT, False)
+
+    def test_low_coverage_keeps_full_context(self):
+        retriever = code_module("retrieval").PassageRetriever(self.CONTEXT)
+        question = "How did the dividend, buyback, headcount and revenue change?"
+        assert retriever.select(question, 20) == (self.CONTEXT, False)
+        assert code_module("retrieval").PassageRetriever(self.CONTEXT, min_coverage=0.0).select(question, 20)[1]
+
+    def test_split_passages(self):
+        split_passages = code_module("retrieval").split_passages
+        assert split_passages(self.CONTEXT)[0][2].startswith("Paragraph 3:")
+        assert split_passages("a\nb\n") == (["a", "b"], "\n")
+        assert split_passages("One. Two!") == (["One.", "Two!"], " ")
+
+
+class TestPackedPrompts:
+    """Test the multi-question prompts and answer parsing of code/utils.py."""
+
+    def test_prompt_keeps_instruction_and_answer_ids(self):
+        utils = code_module("utils")
+        prompt = utils.create_packed_tqa_prompt(["How many a?", "Which b?"], "T", task_type="mmqa")
+        assert prompt.startswith(utils.PACKED_TQA_INSTRUCTIONS["mmqa"])
+        assert "1. How many a?\n2. Which b?" in prompt
+        assert '"Answer <number>: <answer>", from Answer 1 to Answer 2,' in prompt
+
+    def test_prompt_default_instruction(self):
+        utils = code_module("utils")
+        prompt = utils.create_packed_tqa_prompt(["q"], "T", task_type="unknown")
+        assert not any(prompt.startswith(text) for text in utils.PACKED_TQA_INSTRUCTIONS.values())
+        assert "1. q" in prompt and "from Answer 1 to Answer 1," in prompt
+
+    def test_parse_numbered_answers(self):
+        parse = code_module("utils").parse_numbered_answers
+        assert parse("Answer 2: x\nanswer 1. y", 2) == ["y", "x"]
+        # a missing, duplicate or out-of-range number fails the whole pack
+        assert parse("Answer 1: y", 2) is None
+        assert parse("Answer 1: y\nAnswer 1: z\nAnswer 2: x", 2) is None
+        assert parse("Answer 1: y\nAnswer 3: x", 2) is None
+        # so does free text without answer lines
+        assert parse("1. y\n2. x", 2) is None
+        assert parse("The answers are y and x.", 2) is None
+
+
 @pytest.mark.asyncio
 class TestGraphExecution:
     """Test graph execution."""